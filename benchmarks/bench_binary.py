@@ -0,0 +1,86 @@
+# compare file size and load time of replay json and binary replays of the same matches
+# usage: python benchmarks/bench_binary.py [--matches 3] [--rounds 3] [--seconds 99] [--repeat 5]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# run from the repo root so replay_stats can find the data dir
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+os.chdir(repo_dir)
+
+import pandas as pd  # noqa: E402
+
+import replay_binary  # noqa: E402
+import replay_stats  # noqa: E402
+from benchmarks.synthetic_replay import generate_replay  # noqa: E402
+
+
+def best_time(function, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def load_json(json_path: str):
+    # json.load plus building the round DataFrames, what load_recent_file does
+    with open(json_path, 'r') as json_file:
+        return replay_stats.load_replay_data(json.load(json_file))
+
+
+def map_columns(binary_path: str):
+    # only map the file and take the columns the stats use, no copies
+    with replay_binary.BinaryReplay(binary_path) as replay:
+        return [replay.column(round_num, player_tag, col_name) for round_num in replay.round_numbers
+                for player_tag in replay_binary.player_tags for col_name in replay_stats.keep_columns]
+
+
+def assert_equivalent(json_path: str, binary_path: str):
+    json_rounds, json_characters = load_json(json_path)
+    binary_rounds, binary_characters = replay_binary.load_binary_replay_file(binary_path)
+    assert json_characters == binary_characters
+    assert json_rounds.keys() == binary_rounds.keys()
+    for round_num, json_df in json_rounds.items():
+        pd.testing.assert_frame_equal(json_df, binary_rounds[round_num])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seconds", type=int, default=99)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as replay_dir:
+        print(f"{args.matches} matches of {args.rounds} rounds x {args.seconds}s")
+        totals = {"json bytes": 0, "binary bytes": 0, "json": 0.0, "binary": 0.0, "mapped columns": 0.0}
+        for match_num in range(args.matches):
+            json_path = os.path.join(replay_dir, f"match_{match_num}.json")
+            with open(json_path, 'w') as json_file:
+                json.dump(generate_replay(rounds=args.rounds, seconds=args.seconds, seed=match_num), json_file)
+            binary_path = replay_binary.convert_replay(json_path)
+            assert_equivalent(json_path, binary_path)
+
+            totals["json bytes"] += os.path.getsize(json_path)
+            totals["binary bytes"] += os.path.getsize(binary_path)
+            totals["json"] += best_time(lambda: load_json(json_path), args.repeat)
+            totals["binary"] += best_time(lambda: replay_binary.load_binary_replay_file(binary_path), args.repeat)
+            totals["mapped columns"] += best_time(lambda: map_columns(binary_path), args.repeat)
+
+        print(f"{'json':>16}: {totals['json bytes'] / (1024 * 1024):8.1f} MB")
+        print(f"{'binary':>16}: {totals['binary bytes'] / (1024 * 1024):8.1f} MB  "
+              f"({totals['json bytes'] / totals['binary bytes']:.1f}x smaller)")
+        for loader in ["json", "binary", "mapped columns"]:
+            print(f"{loader:>16}: {totals[loader] / args.matches * 1000:8.1f} ms per match  "
+                  f"({totals['json'] / totals[loader]:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
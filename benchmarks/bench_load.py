@@ -0,0 +1,81 @@
+# compare wall time and peak RSS of the legacy and columnar replay loaders
+# usage: python benchmarks/bench_load.py [--rounds 3] [--seconds 99] [--repeat 3]
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# run from the repo root so replay_stats can find the data dir
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+os.chdir(repo_dir)
+
+from benchmarks.synthetic_replay import generate_replay, write_replay  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+
+def run_loader(loader_name: str, sf6_path: str, result_queue):
+    # import inside the fresh process so the baseline RSS includes the libraries
+    import replay_stats
+    from benchmarks import legacy_replay_stats
+
+    loaders = {
+        "legacy": legacy_replay_stats.load_recent_file,
+        "columnar": replay_stats.load_recent_file,
+    }
+    baseline_rss = peak_rss_mb()
+
+    start_time = time.perf_counter()
+    rounds_df, _ = loaders[loader_name](sf6_path)
+    elapsed = time.perf_counter() - start_time
+
+    frame_count = sum(len(df) for df in rounds_df.values())
+    result_queue.put((elapsed, peak_rss_mb() - baseline_rss, frame_count))
+
+
+def benchmark_loader(loader_name: str, sf6_path: str, repeat: int):
+    # each run gets a fresh process so the peak RSS of one run doesn't hide the next
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for _ in range(repeat):
+        result_queue = ctx.Queue()
+        process = ctx.Process(target=run_loader, args=(loader_name, sf6_path, result_queue))
+        process.start()
+        results.append(result_queue.get())
+        process.join()
+
+    best_time = min(result[0] for result in results)
+    peak_rss = max(result[1] for result in results)
+    print(f"{loader_name:>10}: {best_time * 1000:8.1f} ms  peak RSS +{peak_rss:7.1f} MB  ({results[0][2]} frames)")
+    return best_time, peak_rss
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seconds", type=int, default=99)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as sf6_path:
+        replay_path = write_replay(sf6_path, generate_replay(rounds=args.rounds, seconds=args.seconds))
+        print(f"{args.rounds} rounds x {args.seconds}s, {os.path.getsize(replay_path) / (1024 * 1024):.1f} MB json")
+
+        legacy_time, legacy_rss = benchmark_loader("legacy", sf6_path, args.repeat)
+        columnar_time, columnar_rss = benchmark_loader("columnar", sf6_path, args.repeat)
+        print(f"speedup: {legacy_time / columnar_time:.2f}x  memory: {legacy_rss / max(columnar_rss, 0.1):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
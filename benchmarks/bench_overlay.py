@@ -0,0 +1,156 @@
+# check the overlay server against a local http client, then time how long a published match takes to reach an open
+# event stream
+# usage: python benchmarks/bench_overlay.py [--matches 5] [--rounds 3] [--seconds 60]
+import argparse
+import http.client
+import json
+import os
+import sys
+import time
+
+# run from the repo root so replay_stats can find the data dir
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+os.chdir(repo_dir)
+
+import replay_stats  # noqa: E402
+from benchmarks.synthetic_replay import generate_replay  # noqa: E402
+from replay_overlay import OverlayServer, panel_name, render_panels  # noqa: E402
+
+# character id pairs of the generated matches
+matchups = [(10, 7), (1, 2), (7, 10), (16, 9)]
+
+
+def create_matches(matches: int, rounds: int, seconds: int) -> list:
+    # (plot jobs, player_character) of each match
+    created = []
+    for match_num in range(matches):
+        p1_id, p2_id = matchups[match_num % len(matchups)]
+        replay = replay_stats.Replay.from_replay_data(
+            generate_replay(rounds=rounds, seconds=seconds, p1_id=p1_id, p2_id=p2_id, seed=match_num))
+        created.append((replay_stats.create_plot_jobs_from_stats(replay_stats.create_match_stats(replay),
+                                                                 replay.player_character), replay.player_character))
+    return created
+
+
+def get(overlay: OverlayServer, path: str) -> tuple:
+    # (status, content type, body) of a GET
+    host, port = overlay.httpd.server_address[:2]
+    connection = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, response.getheader("Content-Type"), response.read()
+    finally:
+        connection.close()
+
+
+def open_events(overlay: OverlayServer):
+    # (connection, response) of the event stream
+    host, port = overlay.httpd.server_address[:2]
+    connection = http.client.HTTPConnection(host, port, timeout=5)
+    connection.request("GET", "/events")
+    response = connection.getresponse()
+    assert response.status == 200 and response.getheader("Content-Type") == "text/event-stream"
+    return connection, response
+
+
+def read_event(response) -> tuple:
+    # (id, event, data) of the next event, keepalive comments are skipped
+    fields = {}
+    while True:
+        line = response.fp.readline().decode().rstrip("\n")
+        if line == "":
+            if "data" in fields:
+                return int(fields["id"]), fields["event"], json.loads(fields["data"])
+            fields = {}
+        elif not line.startswith(":"):
+            field, value = line.split(": ", 1)
+            fields[field] = value
+
+
+def check_overlay(matches: list):
+    plot_jobs, player_character = matches[0]
+    overlay = OverlayServer(port=0)
+    try:
+        # nothing published yet
+        status, _, body = get(overlay, "/state")
+        assert status == 200 and json.loads(body) == {"version": 0, "player_character": {}, "panels": {}}
+
+        overlay.publish(plot_jobs, player_character)
+        panels = render_panels(plot_jobs)
+
+        status, content_type, body = get(overlay, "/")
+        assert status == 200 and content_type.startswith("text/html") and b"EventSource" in body
+
+        status, content_type, body = get(overlay, "/state")
+        state = json.loads(body)
+        assert status == 200 and content_type == "application/json"
+        assert state["version"] == 1 and state["player_character"] == player_character and state["panels"] == panels
+
+        # one svg chart and the html metrics table
+        svg_name = panel_name(next(plot_job for plot_job in plot_jobs if plot_job[0] == "drive_data"))
+        status, content_type, body = get(overlay, f"/panel/{svg_name}")
+        assert status == 200 and content_type == "image/svg+xml" and body.decode() == panels[svg_name]
+        assert body.startswith(b"<svg")
+        status, content_type, body = get(overlay, "/panel/match_stats")
+        assert status == 200 and content_type.startswith("text/html") and body.startswith(b"<table")
+        assert get(overlay, "/panel/missing")[0] == 404
+        assert get(overlay, "/missing")[0] == 404
+
+        # the event stream sends the current match first, then each published match
+        connection, response = open_events(overlay)
+        try:
+            event_id, event, data = read_event(response)
+            assert (event_id, event) == (1, "stats") and data["panels"] == panels
+
+            next_plot_jobs, next_player_character = matches[1 % len(matches)]
+            overlay.publish(next_plot_jobs, next_player_character)
+            event_id, event, data = read_event(response)
+            assert (event_id, event) == (2, "stats") and data["panels"] == render_panels(next_plot_jobs)
+            assert data["player_character"] == next_player_character
+        finally:
+            connection.close()
+    finally:
+        overlay.close()
+    print("overlay checks passed")
+
+
+def benchmark_overlay(matches: list):
+    # publish to a page on the event stream, as an OBS browser source would have open
+    overlay = OverlayServer(port=0)
+    try:
+        connection, response = open_events(overlay)
+        try:
+            read_event(response)
+            publish_total = 0.0
+            latency_total = 0.0
+            for plot_jobs, player_character in matches:
+                start_time = time.perf_counter()
+                overlay.publish(plot_jobs, player_character)
+                publish_total += time.perf_counter() - start_time
+                read_event(response)
+                latency_total += time.perf_counter() - start_time
+        finally:
+            connection.close()
+    finally:
+        overlay.close()
+    print(f"{len(matches)} matches, {sum(len(plot_jobs) for plot_jobs, _ in matches)} panels")
+    print(f"  publish: {publish_total * 1000 / len(matches):8.2f} ms per match")
+    print(f"  to page: {latency_total * 1000 / len(matches):8.2f} ms per match")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seconds", type=int, default=60)
+    args = parser.parse_args()
+
+    matches = create_matches(args.matches, args.rounds, args.seconds)
+    check_overlay(matches)
+    benchmark_overlay(matches)
+
+
+if __name__ == "__main__":
+    main()
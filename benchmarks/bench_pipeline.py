@@ -0,0 +1,219 @@
+# time each stage of the post match pipeline and its peak memory, results are saved as json so runs of different
+# versions can be compared
+# usage: python benchmarks/bench_pipeline.py [--matches 2] [--rounds 3] [--seconds 99] [--hit-density 0.5]
+#        [--repeat 3] [--output results.json] [--compare baseline.json] [--max-slowdown 1.2]
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# run from the repo root so replay_stats can find the data dir
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+os.chdir(repo_dir)
+
+import replay_stats  # noqa: E402
+from benchmarks.synthetic_replay import generate_replay, write_replay  # noqa: E402
+
+# version of the results json
+results_version = 1
+
+# character id pairs of the generated matches
+matchups = [(10, 7), (1, 2), (7, 10), (16, 9)]
+
+
+def parse(state: dict):
+    # json parse and the raw round columns
+    replay_data = replay_stats.read_replay_file(state["replay_path"], timeout=0)
+    state["player_character"] = replay_stats.player_characters(replay_data["player_data"])
+    state["rounds_df"] = {int(round_number): replay_stats.create_round_df(round_data)
+                          for round_number, round_data in replay_data.items() if round_number.isnumeric()}
+
+
+def derive(state: dict, derived_names: list):
+    for df in state["rounds_df"].values():
+        for player_num in sorted(state["player_character"].keys()):
+            for derived_name in derived_names:
+                column_name = f"p{player_num}_{derived_name}"
+                df[column_name] = replay_stats.derive_column(column_name, df, state["player_character"])
+
+
+def names(state: dict):
+    derive(state, ["actionName", "actionStateName"])
+
+
+def diffs(state: dict):
+    derive(state, ["drive_diff", "current_HP_diff"])
+
+
+def damage(state: dict):
+    for df in state["rounds_df"].values():
+        for p_id in ["2", "1"]:
+            damage_seqs = replay_stats.create_damage_seq(p_id, df)
+            replay_stats.create_damage_stats(p_id, damage_seqs, df)
+            replay_stats.create_damage_routes(p_id, damage_seqs, df)
+
+
+def drive(state: dict):
+    for df in state["rounds_df"].values():
+        for p_id in ["2", "1"]:
+            replay_stats.generate_drive_stats(p_id, df)
+
+
+def action_counts(state: dict):
+    for df in state["rounds_df"].values():
+        replay_stats.count_action_metrics(df)
+
+
+def render(state: dict):
+    # png bytes of every image, on the figures the render workers use
+    renderer = replay_stats.render_plot_png
+    for plot_job in state["plot_jobs"]:
+        renderer(plot_job)
+
+
+# stage name: function, in pipeline order, each stage uses the state the ones before it left
+stages = {
+    "parse": parse,
+    "names": names,
+    "diffs": diffs,
+    "damage": damage,
+    "drive": drive,
+    "action_counts": action_counts,
+    "render": render,
+}
+
+
+def time_stage(stage, state: dict, repeat: int) -> float:
+    best_time = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        stage(state)
+        elapsed = time.perf_counter() - start_time
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return best_time
+
+
+def peak_memory(stage, state: dict) -> int:
+    # bytes allocated at the peak of the stage above what was allocated before it, separate from the timed runs
+    # since tracing slows every allocation
+    tracemalloc.start()
+    try:
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        stage(state)
+        return tracemalloc.get_traced_memory()[1] - start_bytes
+    finally:
+        tracemalloc.stop()
+
+
+def max_rss_mb():
+    # peak resident memory of this process, not available on windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    totals = {stage_name: {"seconds": 0.0, "peak_mb": 0.0} for stage_name in stages.keys()}
+    frame_count = 0
+    with tempfile.TemporaryDirectory() as sf6_path:
+        for match_num in range(args.matches):
+            p1_id, p2_id = matchups[match_num % len(matchups)]
+            replay_data = generate_replay(rounds=args.rounds, seconds=args.seconds, p1_id=p1_id, p2_id=p2_id,
+                                          seed=match_num, hit_density=args.hit_density)
+            frame_count += sum(len(round_data) for key, round_data in replay_data.items() if key.isnumeric())
+            state = {"replay_path": write_replay(sf6_path, replay_data)}
+            del replay_data
+
+            for stage_name, stage in stages.items():
+                if stage_name == "render":
+                    # plot jobs from the full stats, not timed
+                    state["plot_jobs"] = replay_stats.create_plot_jobs_from_stats(
+                        replay_stats.create_match_stats(state["rounds_df"]), state["player_character"])
+                totals[stage_name]["seconds"] += time_stage(stage, state, args.repeat)
+                totals[stage_name]["peak_mb"] = max(totals[stage_name]["peak_mb"],
+                                                    peak_memory(stage, state) / (1024 * 1024))
+
+    return {
+        "version": results_version,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"matches": args.matches, "rounds": args.rounds, "seconds": args.seconds,
+                   "hit_density": args.hit_density, "repeat": args.repeat, "frames": frame_count},
+        "stages": totals,
+        "total_seconds": sum(stage_result["seconds"] for stage_result in totals.values()),
+        "max_rss_mb": max_rss_mb(),
+    }
+
+
+def compare(results: dict, baseline: dict, max_slowdown: float) -> list:
+    # stages slower than the baseline by more than max_slowdown
+    if baseline.get("params") != results["params"]:
+        print(f"baseline params differ: {baseline.get('params')}")
+    regressions = []
+    for stage_name, stage_result in results["stages"].items():
+        baseline_result = baseline["stages"].get(stage_name)
+        if baseline_result is None or baseline_result["seconds"] == 0:
+            continue
+        ratio = stage_result["seconds"] / baseline_result["seconds"]
+        print(f"{stage_name:>14}: {baseline_result['seconds'] * 1000:8.1f} ms -> {stage_result['seconds'] * 1000:8.1f}"
+              f" ms  ({ratio:.2f}x)")
+        if ratio > max_slowdown:
+            regressions.append(stage_name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seconds", type=int, default=99)
+    parser.add_argument("--hit-density", type=float, default=0.5, help="chance an attack connects, 0 to 1")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="write the results json here")
+    parser.add_argument("--compare", default=None, help="results json of an earlier run")
+    parser.add_argument("--max-slowdown", type=float, default=1.2, help="slowest stage ratio allowed by --compare")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f"{args.matches} matches of {args.rounds} rounds x {args.seconds}s, {results['params']['frames']} frames")
+    for stage_name, stage_result in results["stages"].items():
+        print(f"{stage_name:>14}: {stage_result['seconds'] * 1000:8.1f} ms  peak {stage_result['peak_mb']:7.1f} MB")
+    print(f"{'total':>14}: {results['total_seconds'] * 1000:8.1f} ms")
+    if results["max_rss_mb"] is not None:
+        print(f"{'max rss':>14}: {results['max_rss_mb']:8.1f} MB")
+
+    if args.output is not None:
+        with open(args.output, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.max_slowdown)
+        if len(regressions) > 0:
+            print(f"slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
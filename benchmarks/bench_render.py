@@ -0,0 +1,108 @@
+# compare images/sec of the pyplot plot functions and the reusable figure renderer, and check they draw the same
+# pixels
+# usage: python benchmarks/bench_render.py [--matches 3] [--rounds 3] [--seconds 60] [--repeat 3]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# run from the repo root so replay_stats can find the data dir
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+os.chdir(repo_dir)
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import replay_figures  # noqa: E402
+import replay_stats  # noqa: E402
+from replay_output import atomic_write  # noqa: E402
+from benchmarks.synthetic_replay import generate_replay  # noqa: E402
+
+# character id pairs of the generated matches
+matchups = [(10, 7), (1, 2), (7, 10), (16, 9)]
+
+
+def create_plot_jobs(matches: int, rounds: int, seconds: int) -> list:
+    plot_jobs = []
+    for match_num in range(matches):
+        p1_id, p2_id = matchups[match_num % len(matchups)]
+        replay = replay_stats.Replay.from_replay_data(
+            generate_replay(rounds=rounds, seconds=seconds, p1_id=p1_id, p2_id=p2_id, seed=match_num))
+        plot_jobs.extend(replay_stats.create_plot_jobs_from_stats(
+            replay_stats.create_match_stats(replay), replay.player_character))
+    return plot_jobs
+
+
+def render_pyplot(plot_job, output_dir: str):
+    plot_name, plot_args = plot_job
+    replay_stats.plot_functions[plot_name](*plot_args, output_dir=output_dir)
+
+
+def render_figure(renderer: replay_figures.FigureRenderer):
+    # every image is written, unlike an ImageSink which skips unchanged images
+    def render(plot_job, output_dir: str):
+        atomic_write(replay_stats.plot_job_image(plot_job, output_dir), renderer.render(plot_job))
+    return render
+
+
+def images_per_second(render, plot_jobs: list, output_dir: str, repeat: int) -> float:
+    best_time = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for plot_job in plot_jobs:
+            render(plot_job, output_dir)
+        elapsed = time.perf_counter() - start_time
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+    return len(plot_jobs) / best_time
+
+
+def pixel_diff(image_path: str, other_image_path: str) -> float:
+    # fraction of pixels that differ, 1 if the sizes differ
+    image = np.asarray(Image.open(image_path).convert('RGB'), dtype=np.int16)
+    other_image = np.asarray(Image.open(other_image_path).convert('RGB'), dtype=np.int16)
+    if image.shape != other_image.shape:
+        return 1.0
+    return float((np.abs(image - other_image).max(axis=2) > 0).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-diff", type=float, default=0.001, help="largest fraction of differing pixels allowed")
+    args = parser.parse_args()
+
+    plot_jobs = create_plot_jobs(args.matches, args.rounds, args.seconds)
+    render_reused_figure = render_figure(replay_figures.FigureRenderer())
+    with tempfile.TemporaryDirectory() as output_dir:
+        # one directory per job so images of different matches don't overwrite each other
+        failed = 0
+        for job_num, plot_job in enumerate(plot_jobs):
+            pyplot_dir = os.path.join(output_dir, f"pyplot_{job_num}")
+            figure_dir = os.path.join(output_dir, f"figure_{job_num}")
+            os.makedirs(pyplot_dir)
+            os.makedirs(figure_dir)
+            render_pyplot(plot_job, pyplot_dir)
+            render_reused_figure(plot_job, figure_dir)
+
+            diff = pixel_diff(replay_stats.plot_job_image(plot_job, pyplot_dir),
+                              replay_stats.plot_job_image(plot_job, figure_dir))
+            if diff > args.max_diff:
+                failed += 1
+                print(f"{plot_job[0]} job {job_num}: {diff:.2%} of pixels differ")
+        print(f"{len(plot_jobs) - failed}/{len(plot_jobs)} images match")
+
+        pyplot_rate = images_per_second(render_pyplot, plot_jobs, output_dir, args.repeat)
+        figure_rate = images_per_second(render_reused_figure, plot_jobs, output_dir, args.repeat)
+        print(f"{'pyplot':>8}: {pyplot_rate:6.1f} images/s")
+        print(f"{'figure':>8}: {figure_rate:6.1f} images/s  ({figure_rate / pyplot_rate:.2f}x)")
+    if failed > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
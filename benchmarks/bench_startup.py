@@ -0,0 +1,60 @@
+# measure the cold start of the headless daemon in fresh processes, exit 1 if it's over the budget
+# usage: python benchmarks/bench_startup.py [--repeat 5] [--budget-ms 250]
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from benchmarks.synthetic_replay import generate_replay, write_replay  # noqa: E402
+
+
+def best_ms(command: list, repeat: int, cwd: str) -> float:
+    # best wall time of a new process, includes the interpreter starting
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run(command, cwd=cwd, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start_time) * 1000)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=250, help="largest cold start allowed until ready")
+    args = parser.parse_args()
+
+    daemon = [sys.executable, os.path.join(repo_dir, "replay_daemon.py")]
+    with tempfile.TemporaryDirectory() as work_dir:
+        # run away from the repo so nothing is found relative to the working directory
+        empty_sf6_path = os.path.join(work_dir, "empty")
+        sf6_path = os.path.join(work_dir, "sf6")
+        os.makedirs(empty_sf6_path)
+        write_replay(sf6_path, generate_replay(rounds=2, seconds=60))
+        store_path = os.path.join(work_dir, "match_stats.db")
+
+        timings = {
+            # interpreter, config and watcher modules, up to the point a service would start waiting
+            "daemon ready": best_ms(daemon + ["--once", "--sf6-path", empty_sf6_path], args.repeat, work_dir),
+            "import replay_stats": best_ms(
+                [sys.executable, "-c", f"import sys; sys.path.insert(0, {repo_dir!r}); import replay_stats"],
+                args.repeat, work_dir),
+            "first match (--once)": best_ms(
+                daemon + ["--once", "--sf6-path", sf6_path, "--output-dir", os.path.join(work_dir, "stats_img"),
+                          "--store", store_path], 1, work_dir),
+        }
+        for name, elapsed in timings.items():
+            print(f"{name:>22}: {elapsed:8.0f} ms")
+
+    if timings["daemon ready"] > args.budget_ms:
+        print(f"daemon cold start over budget ({args.budget_ms:.0f} ms)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
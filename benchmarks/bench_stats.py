@@ -0,0 +1,94 @@
+# check the vectorized stats functions match the previous implementations, then time both
+# usage: python benchmarks/bench_stats.py [--sf6-path <SF6 dir with a recorded recent_replay.json>] [--repeat 5]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# run from the repo root so replay_stats can find the data dir
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+os.chdir(repo_dir)
+
+import replay_stats  # noqa: E402
+from benchmarks import legacy_replay_stats  # noqa: E402
+from benchmarks.synthetic_replay import generate_replay, write_replay  # noqa: E402
+
+
+def legacy_damage_stats(p_idx, df):
+    return legacy_replay_stats.create_damage_stats(p_idx, legacy_replay_stats.create_damage_seq(p_idx, df), df)
+
+
+def damage_stats(p_idx, df):
+    return replay_stats.create_damage_stats(p_idx, replay_stats.create_damage_seq(p_idx, df), df)
+
+
+# stat name: (legacy function, new function), each called with (p_idx, df)
+stat_functions = {
+    "damage": (legacy_damage_stats, damage_stats),
+    "drive": (legacy_replay_stats.generate_drive_stats, replay_stats.generate_drive_stats),
+}
+
+
+def best_time(func, args, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def assert_equivalent(expected, actual, path="stats"):
+    # compare values and key order, nan keys compare equal
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict), f"{path}: expected dict, got {type(actual)}"
+        expected_keys = [str(key) for key in expected.keys()]
+        actual_keys = [str(key) for key in actual.keys()]
+        assert expected_keys == actual_keys, f"{path}: keys {expected_keys} != {actual_keys}"
+        for expected_value, actual_value, key in zip(expected.values(), actual.values(), expected_keys):
+            assert_equivalent(expected_value, actual_value, f"{path}[{key}]")
+    else:
+        assert abs(float(expected) - float(actual)) < 1e-6, f"{path}: {expected} != {actual}"
+
+
+def benchmark_rounds(label: str, rounds_df: dict, repeat: int):
+    frame_count = sum(len(df) for df in rounds_df.values())
+    print(f"{label} ({len(rounds_df)} rounds, {frame_count} frames)")
+
+    for stat_name, (legacy_func, new_func) in stat_functions.items():
+        legacy_total = 0
+        new_total = 0
+        for round_num, df in rounds_df.items():
+            for p_idx in ["1", "2"]:
+                assert_equivalent(legacy_func(p_idx, df), new_func(p_idx, df),
+                                  f"round {round_num} p{p_idx} {stat_name}")
+                legacy_total += best_time(legacy_func, (p_idx, df), repeat)
+                new_total += best_time(new_func, (p_idx, df), repeat)
+        print(f"  {stat_name:>8}: legacy {legacy_total * 1000:9.2f} ms  new {new_total * 1000:8.2f} ms  "
+              f"speedup {legacy_total / new_total:6.1f}x  (equivalent)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sf6-path", help="SF6 dir with a recorded reframework/data/recent_replay.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.sf6_path:
+        rounds_df, _ = replay_stats.load_recent_file(args.sf6_path)
+        benchmark_rounds("recorded match", rounds_df, args.repeat)
+
+    with tempfile.TemporaryDirectory() as sf6_path:
+        write_replay(sf6_path, generate_replay(rounds=3, seconds=99))
+        rounds_df, _ = replay_stats.load_recent_file(sf6_path)
+        benchmark_rounds("synthetic 3 round, 99 second match", rounds_df, args.repeat)
+
+        write_replay(sf6_path, generate_replay(rounds=1, seconds=99 * 100, seed=1))
+        rounds_df, _ = replay_stats.load_recent_file(sf6_path)
+        benchmark_rounds("synthetic 100x round", rounds_df, 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# check the stats store on a temporary database, then time adding matches and querying them
+# usage: python benchmarks/bench_store.py [--matches 20] [--rounds 3] [--seconds 99]
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+# run from the repo root so replay_stats can find the data dir
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+os.chdir(repo_dir)
+
+import replay_stats  # noqa: E402
+from benchmarks.synthetic_replay import generate_replay, write_replay  # noqa: E402
+from replay_store import StatsStore  # noqa: E402
+
+# character id pairs of the timed matches
+matchups = [(10, 7), (1, 2), (7, 10), (16, 9)]
+
+
+def stats_round(damage: dict, drive: dict, metrics: dict, routes: dict) -> dict:
+    # round stats as create_round_stats returns them, damage and routes are keyed by the damaged player
+    return {"damage": damage, "drive": drive, "metrics": metrics, "routes": routes}
+
+
+def drive_stats(enemy_actions: dict, special: dict) -> dict:
+    # DEF drive lost to each enemy action and the player's SPECIAL actions, as (count, total), shaped like
+    # generate_drive_stats: DEF is only there when drive was lost blocking, and its 'total' is a float
+    stats = {}
+    if len(enemy_actions) > 0:
+        stats["DEF"] = {"total": float(sum(total for _, total in enemy_actions.values()))}
+        stats["DEF"].update({action_name: {"count": count, "total": total}
+                             for action_name, (count, total) in enemy_actions.items()})
+    stats.update({action_name: {"count": count, "total": total} for action_name, (count, total) in special.items()})
+    return stats
+
+
+# Ken (p1) vs JP (p2), then the same match again with other stats, then JP (p1) vs Ken (p2) a month later
+match_a = {0: stats_round(
+    {"2": {"5LP": {"count": 2, "total": 1000.0}}, "1": {"2MK": {"count": 1, "total": 500.0}}},
+    {"1": drive_stats({}, {"Drive Rush": (1, 10000.0)}), "2": drive_stats({"c.LK": (1, 5000.0)}, {})},
+    {"Perfect Parries": {"1": 3, "2": 0}},
+    {"2": [{"frame": 10, "damage": 1000.0, "route": ["5LP", "5LP2"]}], "1": []})}
+match_a_replaced = {0: stats_round(
+    {"2": {"5LP": {"count": 1, "total": 300.0}}, "1": {"2MK": {"count": 1, "total": 500.0}}},
+    {"1": drive_stats({"2MK": (1, 5000.0)}, {"Drive Rush": (1, 10000.0)}), "2": drive_stats({}, {})},
+    {"Perfect Parries": {"1": 1, "2": 0}},
+    {"2": [{"frame": 5, "damage": 300.0, "route": ["5LP"]}], "1": []})}
+match_b = {0: stats_round(
+    {"1": {"2HK": {"count": 1, "total": 2000.0}}},
+    {"1": drive_stats({}, {}), "2": drive_stats({}, {"Drive Rush": (2, 20000.0)})},
+    {"Perfect Parries": {"1": 3, "2": 0}},
+    {"1": [{"frame": 30, "damage": 2000.0, "route": ["2HK"]}]})}
+
+
+def check_store(store_path: str):
+    with StatsStore(store_path) as store:
+        store.add_match("a", match_a, {"1": "Ken", "2": "JP"}, datetime.datetime(2024, 1, 1))
+        store.add_match("b", match_b, {"1": "JP", "2": "Ken"}, datetime.datetime(2024, 2, 1))
+        store.add_match("a", match_a_replaced, {"1": "Ken", "2": "JP"}, datetime.datetime(2024, 1, 1))
+
+        # the re-added match replaces the first one and its route
+        assert store.query("SELECT COUNT(*) FROM matches") == [(2,)]
+        assert store.damage_by_action() == [("2HK", 1, 1, 2000.0, 2000.0), ("2MK", 1, 1, 500.0, 500.0),
+                                            ("5LP", 1, 1, 300.0, 300.0)]
+        assert store.damage_routes("Ken") == [("2HK", 1, 2000.0, 2000.0), ("5LP", 1, 300.0, 300.0)]
+        assert store.route_drops(["5LP"], "Ken") == [(None, 1, 1.0, 300.0)]
+
+        assert store.drive_by_action() == [("SPECIAL", "Drive Rush", 2, 3, 30000.0), ("DEF", "2MK", 1, 1, 5000.0)]
+        assert store.metric_totals() == [("Perfect Parries", 2, 4, 2.0)]
+
+        # character, opponent and since filters
+        assert store.damage_by_action(character="Ken") == [("2HK", 1, 1, 2000.0, 2000.0), ("5LP", 1, 1, 300.0, 300.0)]
+        assert store.damage_by_action(opponent="Ken") == [("2MK", 1, 1, 500.0, 500.0)]
+        assert store.damage_by_action(since="2024-01-15") == [("2HK", 1, 1, 2000.0, 2000.0)]
+        assert store.damage_by_action(action_name="5%") == [("5LP", 1, 1, 300.0, 300.0)]
+        assert store.drive_by_action(character="JP") == []
+        assert store.drive_by_action(character="Ken", since="2024-01-15") == [("SPECIAL", "Drive Rush", 1, 2,
+                                                                               20000.0)]
+        assert store.metric_totals(character="Ken") == [("Perfect Parries", 2, 1, 0.5)]
+        assert store.metric_totals(opponent="Ken", since="2024-01-15") == [("Perfect Parries", 1, 3, 3.0)]
+        assert [match[:3] for match in store.matches(since="2024-01-15")] == [("2024-02-01 00:00:00", "JP", "Ken")]
+
+        # a rolled back match leaves no action ids behind that the next match would reference
+        update_route_prefixes = store.update_route_prefixes
+
+        def fail_update(*args):
+            raise RuntimeError("update failed")
+        rolled_back_match = {0: stats_round({"1": {"6HP": {"count": 1, "total": 800.0}}}, {}, {},
+                                            {"1": [{"frame": 1, "damage": 800.0, "route": ["6HP"]}]})}
+        store.update_route_prefixes = fail_update
+        try:
+            store.add_match("d", rolled_back_match, {"1": "Ryu", "2": "Ken"})
+            raise AssertionError("add_match should have failed")
+        except RuntimeError:
+            pass
+        store.update_route_prefixes = update_route_prefixes
+        assert store.query("SELECT COUNT(*) FROM matches") == [(2,)]
+        assert "6HP" not in store.action_ids
+        store.add_match("d", rolled_back_match, {"1": "Ryu", "2": "Ken"})
+        assert store.damage_routes("Ken") == [("2HK", 1, 2000.0, 2000.0), ("6HP", 1, 800.0, 800.0),
+                                              ("5LP", 1, 300.0, 300.0)]
+    print("store checks passed")
+
+
+def time_call(label: str, func, *args):
+    start_time = time.perf_counter()
+    result = func(*args)
+    print(f"  {label:>16}: {(time.perf_counter() - start_time) * 1000:8.2f} ms")
+    return result
+
+
+def benchmark_store(store_path: str, args):
+    match_stats = []
+    with tempfile.TemporaryDirectory() as sf6_path:
+        for match_num in range(args.matches):
+            p1_id, p2_id = matchups[match_num % len(matchups)]
+            write_replay(sf6_path, generate_replay(rounds=args.rounds, seconds=args.seconds, p1_id=p1_id,
+                                                   p2_id=p2_id, seed=match_num))
+            rounds_df, player_character = replay_stats.load_recent_file(sf6_path)
+            match_stats.append((replay_stats.create_match_stats(rounds_df), player_character))
+
+    print(f"{args.matches} matches of {args.rounds} rounds x {args.seconds}s")
+    with StatsStore(store_path) as store:
+        start_time = time.perf_counter()
+        for match_num, (stats, player_character) in enumerate(match_stats):
+            store.add_match(str(match_num), stats, player_character)
+        print(f"  {'add_match':>16}: {(time.perf_counter() - start_time) * 1000 / args.matches:8.2f} ms per match")
+
+        character = match_stats[0][1]["1"]
+        time_call("damage_by_action", store.damage_by_action, character)
+        time_call("drive_by_action", store.drive_by_action, character)
+        time_call("metric_totals", store.metric_totals, character)
+        time_call("damage_routes", store.damage_routes, character)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seconds", type=int, default=99)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        check_store(os.path.join(store_dir, "check.db"))
+        benchmark_store(os.path.join(store_dir, "bench.db"), args)
+
+
+if __name__ == "__main__":
+    main()
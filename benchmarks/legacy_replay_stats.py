@@ -0,0 +1,184 @@
+# previous implementations of replay_stats functions, kept to benchmark and check new versions against
+import json
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+import replay_stats
+
+
+def load_recent_file(sf6_path: str) -> tuple[dict[Any, DataFrame], dict[str, Any]]:
+    # columns from the replay data to keep
+    keep_columns = {
+        'current_HP': int,
+        'blockstun': int,
+        'mActionId': int,
+        'hitstun': int,
+        'act_st': int,
+        'drive': float
+    }
+
+    # load the replay file
+    with open(f"{sf6_path}/reframework/data/{replay_stats.replay_name}", 'r') as replay_data_file:
+        replay_data = json.load(replay_data_file)
+
+    # dicts to be transformed into dataframes
+    rounds = {}
+
+    for round_number, round_data in replay_data.items():
+        # if round number
+        if round_number.isnumeric():
+            # create dict for the round
+            rounds.setdefault(int(round_number), {})
+            # for each frame
+            for frame_idx, frame_data in round_data.items():
+                row_data = {}
+
+                # append the player_tag to the key to create a unique column name
+                for player_tag, player_data in frame_data.items():
+                    row_data.update({f"{player_tag}_{key}": value for key, value in player_data.items() if
+                                     key in keep_columns.keys()})
+                # append the row dict
+                rounds[int(round_number)][int(frame_idx)] = row_data
+
+    # dict to store round dataframes
+    rounds_df = {}
+    for round_num, data in rounds.items():
+        # create the df
+        df = pd.DataFrame(data).T
+        df.sort_index(inplace=True)
+
+        # cast columns to type
+        for col_name, col_type in keep_columns.items():
+            for col in df.columns:
+                if col_name in col:
+                    df[col] = df[col].astype(col_type)
+            rounds_df[round_num] = df
+
+    # create dict to store player character names
+    player_character = {}
+
+    # for each player character
+    for player_tag, player_id in replay_data['player_data'].items():
+        # set player number
+        player_num = 0 if '0' in player_tag else 1
+
+        # load character name
+        character_name = replay_stats.load_data_table("character_ids")[str(player_id)]
+
+        # set player character to appropriate character name
+        player_character[str(player_num + 1)] = character_name
+
+        # load move names
+        with open(f"{replay_stats.character_move_names_path()}/{character_name} Names.json",
+                  'r') as character_move_names_file:
+            character_move_names = json.load(character_move_names_file)
+
+            for _, df in rounds_df.items():
+                # create _actionName to store the name of moves based on _mActionId
+                df[f"p{player_num + 1}_actionName"] = df[f"p{player_num + 1}_mActionId"].apply(
+                    lambda x: character_move_names.get(f"{x:04}", np.nan))
+
+                # create _actionStateName to store the name of moves based on _act_st
+                df[f"p{player_num + 1}_actionStateName"] = df[f"p{player_num + 1}_act_st"].apply(
+                    lambda x: replay_stats.load_data_table("act_st").get(f"{x}", np.nan))
+
+    # columns to generate diff, to track changes in value across frames
+    diff_columns = ['drive', 'current_HP']
+
+    # for each diff column
+    for diff_column in diff_columns:
+        for round_num, df in rounds_df.items():
+            for player_num in [1, 2]:
+                # calc and create the dif fcolumn
+                df[f'p{player_num}_{diff_column}_diff'] = df[f'p{player_num}_{diff_column}'].diff()
+
+    return rounds_df, player_character
+
+
+def create_damage_seq(p_idx, df):
+    # create a boolean mask where act_st is 'damage'
+    mask = df[f'p{p_idx}_actionStateName'] == 'DAMAGE'
+
+    # identify the start of a new 'DAMAGE' sequence
+    sequence_starts = mask != mask.shift()
+
+    # assign a unique ID to each sequence
+    sequence_ids = sequence_starts.cumsum()
+
+    # identify where the value changes
+    changes = sequence_ids.diff().ne(0).to_numpy()
+    starts = np.where(changes)[0]
+
+    # offset position by -1 for the end
+    ends = np.where(changes)[0][1:] - 1
+
+    # if the series starts with the same values, prepend the first index
+    if not changes[0]:
+        starts = np.insert(starts, 0, 0)
+
+    # end of the last run is the end of the series
+    ends = np.append(ends, len(sequence_ids) - 1)
+
+    # create list of sequences
+    damage_seqs = list(zip(starts, ends))
+
+    return damage_seqs
+
+
+def create_damage_stats(p_idx: str, damage_seqs: list, df: pd.DataFrame) -> Dict[str, Dict]:
+    other_p_idx = "2" if p_idx == "1" else "1"
+    damage_stats = {}
+
+    for damage_seq in damage_seqs:
+        total_damage = df.iloc[damage_seq[0]:damage_seq[1]][f'p{p_idx}_current_HP_diff'].sum()
+        if total_damage < 0:
+            # the entire attack sequence (combo), maybe used later
+            player_attack_sequence = df.iloc[damage_seq[0]:damage_seq[1]][f'p{other_p_idx}_actionName'].unique()
+
+            # create key for this actionName
+            action_stats = damage_stats.setdefault(df.iloc[damage_seq[0]][f'p{other_p_idx}_actionName'],
+                                                   {"count": 0, "total": 0})
+
+            # increment the count by 1
+            action_stats['count'] = action_stats['count'] + 1
+
+            # accumulate the damage
+            action_stats['total'] = action_stats['total'] + (total_damage * -1)
+
+    return damage_stats
+
+
+def generate_drive_stats(p_idx: str, df: pd.DataFrame) -> Dict[str, Dict]:
+    other_p_idx = "2" if p_idx == "1" else "1"
+    drive_stats = {}
+
+    for idx, row in df[df[f'p{p_idx}_drive_diff'] < 0].iterrows():
+        # the action state name
+        action_state_name = row[f'p{p_idx}_actionStateName']
+
+        if action_state_name in ['DEF', 'DAMAGE']:
+            # create if dict doesn't exist
+            action_stats = drive_stats.setdefault(action_state_name, {})
+
+            # total drive lost
+            total_drive = action_stats.setdefault('total', 0)
+            # accumulate total lost
+            action_stats['total'] = total_drive + (row[f'p{p_idx}_drive_diff'] * -1)
+
+            # create list if doesn't exist
+            enemy_action_stats = action_stats.setdefault(row[f'p{other_p_idx}_actionName'], {"count": 0, "total": 0})
+            # track for this action
+            enemy_action_stats['count'] = enemy_action_stats['count'] + 1
+            enemy_action_stats['total'] = enemy_action_stats['total'] + (row[f'p{p_idx}_drive_diff'] * -1)
+        elif action_state_name == 'SPECIAL':
+            action_name = row[f'p{p_idx}_actionName']
+            action_stats = drive_stats.setdefault(action_name, {"count": 0, "total": 0})
+
+            # track for this action
+            action_stats['count'] = action_stats['count'] + 1
+            action_stats['total'] = action_stats['total'] + (row[f'p{p_idx}_drive_diff'] * -1)
+
+    return drive_stats
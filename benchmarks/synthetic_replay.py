@@ -0,0 +1,204 @@
+# generate replays in the shape capture_match.lua writes them, for the benchmarks
+# usage: python benchmarks/synthetic_replay.py <sf6 path> [--rounds 3] [--seconds 99] [--p1 10] [--p2 7]
+#        [--hit-density 0.5] [--seed 0]
+import argparse
+import json
+import os
+import random
+import sys
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+from replay_config import default_data_dir  # noqa: E402
+
+# game state fields written by capture_match.lua for each player every frame
+game_state_fields = ("throw_invuln,hitstun,mEndFrame,current_HP,drive_cooldown,blockstun,HP_cooldown,chargeInfo,"
+                     "absolute_range,stance,drive,spdY,act_st,juggle,posY,pushback,aclY,mMarginFrame,mActionId,"
+                     "full_invuln,dir,spdX,posX,buff,super,aclX,mActionFrame,relative_range,HP_cap,hitstop").split(",")
+
+# fields in gameStateFormatString that capture_match.lua never sets, they're nil so json.dump_file leaves them out,
+# absolute_range and relative_range are set to 0 once and written every frame
+unset_fields = {"chargeInfo"}
+
+# fields of each frame, in the order capture_match.lua writes them
+frame_fields = [field for field in game_state_fields if field not in unset_fields]
+
+# act_st values used by the generator
+ACT_ST_FOOTWORK = 0
+ACT_ST_DEF = 27
+ACT_ST_ATCK = 29
+ACT_ST_SPECIAL = 30
+ACT_ST_DAMAGE = 32
+
+# frames per second of a match
+FPS = 60
+
+# max HP, drive and super of a player
+MAX_HP = 10000
+MAX_DRIVE = 60000
+MAX_SUPER = 30000
+
+# stage edges and starting distance, in the units of pos.x / 6553600.0
+STAGE_EDGE = 7.65
+START_POS = 1.5
+
+
+def load_action_ids(data_dir: str, character_id: int) -> list:
+    with open(f"{data_dir}/character_ids.json", 'r') as f:
+        character_ids = json.load(f)
+    with open(f"{data_dir}/fixed_character_names/{character_ids[str(character_id)]} Names.json", 'r') as f:
+        return [int(action_id) for action_id in json.load(f).keys()]
+
+
+def new_player(action_ids: list, pos_x: float) -> dict:
+    return {
+        "current_HP": MAX_HP,
+        "HP_cap": MAX_HP,
+        "drive": MAX_DRIVE,
+        "super": 0,
+        "mActionId": action_ids[0],
+        "act_st": ACT_ST_FOOTWORK,
+        "hitstun": 0,
+        "blockstun": 0,
+        "hitstop": 0,
+        "posX": pos_x,
+        "spdX": 0.0,
+        "remaining": 0,
+        "action_frames": 1,
+    }
+
+
+def generate_round(rng: random.Random, frame_count: int, action_ids: dict, hit_density: float = 0.5) -> dict:
+    # hit_density is the chance an attack the other player reacts to connects instead of being blocked
+    round_data = {}
+
+    # state of each player carried across frames
+    players = {"p1": new_player(action_ids["p1"], -START_POS), "p2": new_player(action_ids["p2"], START_POS)}
+
+    for frame_idx in range(frame_count):
+        for p_tag, other_p_tag in [("p1", "p2"), ("p2", "p1")]:
+            player = players[p_tag]
+            other_player = players[other_p_tag]
+
+            # pick a new action once the current one runs out
+            if player["remaining"] <= 0:
+                player["remaining"] = rng.randint(4, 40)
+                player["action_frames"] = player["remaining"]
+                player["mActionId"] = rng.choice(action_ids[p_tag])
+                player["act_st"] = rng.choice([ACT_ST_FOOTWORK, ACT_ST_ATCK, ACT_ST_ATCK, ACT_ST_SPECIAL])
+                player["hitstun"] = 0
+                player["blockstun"] = 0
+                player["spdX"] = rng.uniform(-0.05, 0.05) if player["act_st"] == ACT_ST_FOOTWORK else 0.0
+
+                # being hit or blocking while the other player attacks
+                if other_player["act_st"] in [ACT_ST_ATCK, ACT_ST_SPECIAL]:
+                    if rng.random() < hit_density:
+                        player["act_st"] = ACT_ST_DAMAGE
+                        player["hitstun"] = player["remaining"]
+                        player["hitstop"] = rng.randint(8, 14)
+                    else:
+                        player["act_st"] = ACT_ST_DEF
+                        player["blockstun"] = player["remaining"]
+            player["remaining"] -= 1
+
+            # lose HP while being hit, the HP cap trails behind
+            if player["act_st"] == ACT_ST_DAMAGE and rng.random() < 0.2:
+                player["current_HP"] = max(0, player["current_HP"] - rng.randint(50, 800))
+                other_player["super"] = min(MAX_SUPER, other_player["super"] + rng.randint(100, 500))
+            elif player["HP_cap"] > player["current_HP"]:
+                player["HP_cap"] = max(player["current_HP"], player["HP_cap"] - 10)
+
+            # lose drive while blocking, being hit, or spending it on specials
+            if player["act_st"] in [ACT_ST_DEF, ACT_ST_DAMAGE, ACT_ST_SPECIAL] and rng.random() < 0.1:
+                player["drive"] = max(0, player["drive"] - rng.randint(500, 5000))
+            else:
+                player["drive"] = min(MAX_DRIVE, player["drive"] + 20)
+
+            player["posX"] = min(STAGE_EDGE, max(-STAGE_EDGE, player["posX"] + player["spdX"]))
+            player["hitstun"] = max(0, player["hitstun"] - 1)
+            player["blockstun"] = max(0, player["blockstun"] - 1)
+            player["hitstop"] = max(0, player["hitstop"] - 1)
+
+        round_data[str(frame_idx)] = {
+            p_tag: player_frame(players[p_tag], players[other_p_tag]) for p_tag in ["p1", "p2"]
+        }
+
+    return round_data
+
+
+def player_frame(player: dict, other_player: dict) -> dict:
+    # the fields capture_match.lua sets for a player, ints where it floors or reads ints and floats for positions
+    frame = dict.fromkeys(frame_fields, 0)
+    frame.update({
+        "current_HP": player["current_HP"],
+        "HP_cap": player["HP_cap"],
+        "drive": player["drive"],
+        "super": player["super"],
+        "mActionId": player["mActionId"],
+        "mActionFrame": player["action_frames"] - player["remaining"] - 1,
+        "mEndFrame": player["action_frames"],
+        "mMarginFrame": max(0, player["action_frames"] - 3),
+        "act_st": player["act_st"],
+        "hitstun": player["hitstun"],
+        "blockstun": player["blockstun"],
+        "hitstop": player["hitstop"],
+        "dir": 1 if player["posX"] < other_player["posX"] else 0,
+        "posX": round(player["posX"], 6),
+        "posY": 0.0,
+        "spdX": round(player["spdX"], 6),
+        "spdY": 0.0,
+        "aclX": 0.0,
+        "aclY": 0.0,
+        "pushback": 0.0,
+    })
+    return frame
+
+
+def generate_replay(rounds: int = 3, seconds: int = 99, p1_id: int = 10, p2_id: int = 7, seed: int = 0,
+                    data_dir: str = None, hit_density: float = 0.5, frames: int = None) -> dict:
+    # frames overrides the frames per round given by seconds
+    rng = random.Random(seed)
+    data_dir = data_dir or default_data_dir()
+    action_ids = {
+        "p1": load_action_ids(data_dir, p1_id),
+        "p2": load_action_ids(data_dir, p2_id),
+    }
+    frame_count = frames if frames is not None else seconds * FPS
+
+    replay_data = {
+        str(round_num): generate_round(rng, frame_count, action_ids, hit_density) for round_num in range(rounds)
+    }
+    replay_data["player_data"] = {"player_0_id": p1_id, "player_1_id": p2_id}
+    return replay_data
+
+
+def write_replay(sf6_path: str, replay_data: dict, replay_name: str = "recent_replay.json") -> str:
+    # write the replay where capture_match.lua would
+    replay_dir = f"{sf6_path}/reframework/data"
+    os.makedirs(replay_dir, exist_ok=True)
+    replay_path = f"{replay_dir}/{replay_name}"
+    with open(replay_path, 'w') as f:
+        json.dump(replay_data, f)
+    return replay_path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sf6_path", help="written to reframework/data/recent_replay.json in here")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seconds", type=int, default=99)
+    parser.add_argument("--frames", type=int, default=None, help="frames per round, overrides --seconds")
+    parser.add_argument("--p1", type=int, default=10, help="character id of player 1")
+    parser.add_argument("--p2", type=int, default=7, help="character id of player 2")
+    parser.add_argument("--hit-density", type=float, default=0.5, help="chance an attack connects, 0 to 1")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    replay_data = generate_replay(args.rounds, args.seconds, args.p1, args.p2, args.seed,
+                                  hit_density=args.hit_density, frames=args.frames)
+    print(write_replay(args.sf6_path, replay_data))
+
+
+if __name__ == "__main__":
+    main()
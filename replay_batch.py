@@ -0,0 +1,125 @@
+import datetime
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import replay_stats
+from replay_cache import ReplayCache, process_cache
+from replay_store import StatsStore
+
+# <YYYYmmdd>_<HHMMSS>_<p1>_<p2>.json files written by capture_match.lua next to recent_replay.json, and their .sf6r
+# copies when binary capture is enabled
+archived_replay_pattern = re.compile(r"^\d{8}_\d{6}_.+\.(json|sf6r)$")
+
+
+def is_archived_replay(replay_dir: str, filename: str) -> bool:
+    # a match archived as both json and .sf6r is only loaded from the .sf6r, it's memory mapped instead of parsed
+    if not archived_replay_pattern.match(filename):
+        return False
+    return not (filename.endswith(".json") and
+                os.path.exists(os.path.join(replay_dir, os.path.splitext(filename)[0] + ".sf6r")))
+
+
+def find_archived_replays(replay_dir: str) -> list:
+    return sorted(
+        os.path.join(replay_dir, filename) for filename in os.listdir(replay_dir)
+        if is_archived_replay(replay_dir, filename))
+
+
+def match_output_dir(output_dir: str, replay_path: str) -> str:
+    # one folder per match, named after the replay file
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(replay_path))[0])
+
+
+def json_default(value):
+    # numpy scalars in the stats
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def replay_played_at(replay_path: str) -> datetime.datetime:
+    # archived replays are named after the time they were saved
+    return datetime.datetime.strptime(os.path.basename(replay_path)[:15], "%Y%m%d_%H%M%S")
+
+
+def process_replay(replay_path: str, output_dir: str, cache_dir: str = None) -> tuple:
+    # returns (replay path, seconds taken, error or None, (match key, match stats, player character) or None),
+    # errors are returned so one bad file doesn't stop the batch
+    start_time = time.perf_counter()
+    try:
+        if cache_dir is not None:
+            rounds_df, player_character = process_cache(cache_dir).load_replay_file(replay_path, timeout=0)
+        else:
+            rounds_df, player_character = replay_stats.load_replay_file(replay_path, timeout=0)
+        match_stats = replay_stats.create_match_stats(rounds_df)
+
+        match_dir = match_output_dir(output_dir, replay_path)
+        os.makedirs(match_dir, exist_ok=True)
+
+        # stats as json, round and player keys as strings
+        with open(os.path.join(match_dir, "stats.json"), 'w') as stats_file:
+            json.dump({
+                "replay": os.path.basename(replay_path),
+                "player_character": player_character,
+                "rounds": {str(round_num): round_stats for round_num, round_stats in match_stats.items()},
+            }, stats_file, indent=2, default=json_default)
+
+        # images
+        for plot_job in replay_stats.create_plot_jobs_from_stats(match_stats, player_character):
+            replay_stats.render_plot_job(plot_job, match_dir)
+    except Exception:
+        return replay_path, time.perf_counter() - start_time, traceback.format_exc(), None
+
+    match_key = replay_stats.hash_match(rounds_df, player_character)
+    return replay_path, time.perf_counter() - start_time, None, (match_key, match_stats, player_character)
+
+
+def run_batch(replay_dir: str, output_dir: str, max_workers: int = None, cache_dir: str = None,
+              store_path: str = None) -> dict:
+    replay_paths = find_archived_replays(replay_dir)
+    print(f"found {len(replay_paths)} archived matches in {replay_dir}")
+
+    # the cross match stats are written from this process only
+    stats_store = StatsStore(store_path) if store_path is not None else None
+
+    start_time = time.perf_counter()
+    failed = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=replay_stats.configure,
+                             initargs=(replay_stats.data_dir, replay_stats.stats_img_dir)) as executor:
+        futures = [
+            executor.submit(process_replay, replay_path, output_dir, cache_dir) for replay_path in replay_paths
+        ]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            replay_path, elapsed, error, match = future.result()
+            if stats_store is not None and match is not None:
+                match_key, match_stats, player_character = match
+                stats_store.add_match(match_key, match_stats, player_character, replay_played_at(replay_path),
+                                      os.path.basename(replay_path))
+            status = "ok" if error is None else f"FAILED: {error.strip().splitlines()[-1]}"
+            print(f"[{completed}/{len(replay_paths)}] {os.path.basename(replay_path)} {status} ({elapsed:.2f}s)")
+            if error is not None:
+                failed[replay_path] = error
+
+    if stats_store is not None:
+        stats_store.close()
+    # the workers only counted their own entries
+    if cache_dir is not None:
+        ReplayCache(cache_dir).evict()
+
+    elapsed = time.perf_counter() - start_time
+    processed = len(replay_paths) - len(failed)
+    matches_per_sec = len(replay_paths) / max(elapsed, 1e-9)
+    print(f"processed {processed} matches in {elapsed:.1f}s ({matches_per_sec:.2f} matches/sec), {len(failed)} failed")
+
+    # full tracebacks of failed matches
+    if len(failed) > 0:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, "errors.log"), 'w') as errors_file:
+            for replay_path, error in failed.items():
+                errors_file.write(f"{replay_path}\n{error}\n")
+
+    return {"processed": processed, "failed": failed, "seconds": elapsed}
@@ -0,0 +1,234 @@
+import json
+import os
+import struct
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import replay_stats
+from replay_metrics import instrumented
+
+# binary replay written by capture_match.lua when binary capture is enabled
+binary_replay_name = 'recent_replay.sf6r'
+binary_replay_extension = '.sf6r'
+
+# file starts with magic, format version, reserved, then the length of the json header
+magic = b"SF6R"
+format_version = 1
+prelude = struct.Struct("<4sHHI")
+
+# header is padded so the records start aligned
+header_alignment = 8
+
+# fields stored for each player every frame and their dtype, in the order of gameStateFormatString
+# chargeInfo is never filled in by the capture so it isn't stored
+# must match binaryFields in capture_match.lua
+player_fields = {
+    'throw_invuln': '<i2',
+    'hitstun': '<i2',
+    'mEndFrame': '<i2',
+    'current_HP': '<i4',
+    'drive_cooldown': '<i2',
+    'blockstun': '<i2',
+    'HP_cooldown': '<i2',
+    'absolute_range': '<f4',
+    'stance': '<i2',
+    'drive': '<f4',
+    'spdY': '<f4',
+    'act_st': '<i2',
+    'juggle': '<i2',
+    'posY': '<f4',
+    'pushback': '<f4',
+    'aclY': '<f4',
+    'mMarginFrame': '<i2',
+    'mActionId': '<i4',
+    'full_invuln': '<i2',
+    'dir': '|i1',
+    'spdX': '<f4',
+    'posX': '<f4',
+    'buff': '<i2',
+    'super': '<i4',
+    'aclX': '<f4',
+    'mActionFrame': '<i2',
+    'relative_range': '<f4',
+    'HP_cap': '<i4',
+    'hitstop': '<i2',
+}
+
+player_tags = ["p1", "p2"]
+
+
+def record_dtype(fields: dict) -> np.dtype:
+    # one packed record per frame, records are sorted by round then frame
+    player_dtype = np.dtype([(field, dtype) for field, dtype in fields.items()])
+    return np.dtype([('round', '<i2'), ('frame', '<i4')] + [(player_tag, player_dtype) for player_tag in player_tags])
+
+
+def is_binary_replay(replay_path: str) -> bool:
+    return replay_path.endswith(binary_replay_extension)
+
+
+class BinaryReplay:
+    # memory mapped binary replay, round and player columns are zero copy views into the file
+    # with mmap False the records are read into memory instead, so the file isn't held open
+    def __init__(self, replay_path: str, mmap: bool = True):
+        self.replay_path = replay_path
+        with open(replay_path, 'rb') as replay_file:
+            file_magic, version, _, header_len = prelude.unpack(replay_file.read(prelude.size))
+            if file_magic != magic:
+                raise ValueError(f"{replay_path} is not a binary replay")
+            if version != format_version:
+                raise ValueError(f"{replay_path} has binary replay version {version}, expected {format_version}")
+            header = json.loads(replay_file.read(header_len))
+
+        self.fields = dict(header["fields"])
+        self.player_data = header["player_data"]
+        self.dtype = record_dtype(self.fields)
+
+        # round number: slice of its records
+        self.round_slices = {
+            int(round_num): slice(start, start + count) for round_num, start, count in header["rounds"]}
+        record_count = sum(count for _, _, count in header["rounds"])
+
+        data_offset = prelude.size + header_len
+        if os.path.getsize(replay_path) < data_offset + record_count * self.dtype.itemsize:
+            raise ValueError(f"{replay_path} is truncated")
+
+        # np.memmap can't map zero records
+        if record_count > 0 and mmap:
+            self.records = np.memmap(replay_path, dtype=self.dtype, mode='r', offset=data_offset, shape=(record_count,))
+        elif record_count > 0:
+            self.records = np.fromfile(replay_path, dtype=self.dtype, count=record_count, offset=data_offset)
+        else:
+            self.records = np.empty(0, dtype=self.dtype)
+
+    def close(self):
+        # drop the mapping so the capture can rewrite the file, views taken from it keep it open
+        self.records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def round_numbers(self) -> list:
+        return sorted(self.round_slices.keys())
+
+    def frames(self, round_num: int) -> np.ndarray:
+        return self.records['frame'][self.round_slices[round_num]]
+
+    def column(self, round_num: int, player_tag: str, field: str) -> np.ndarray:
+        # strided view of one field of one player over a round
+        return self.records[player_tag][field][self.round_slices[round_num]]
+
+    @instrumented("round_df", rows=lambda self, round_num, *args: len(self.frames(round_num)))
+    def round_df(self, round_num: int, columns: dict = None) -> pd.DataFrame:
+        # same layout as replay_stats.create_round_df, columns are copied out of the mapping
+        columns = replay_stats.keep_columns if columns is None else columns
+        return pd.DataFrame({
+            f"{player_tag}_{col_name}": self.column(round_num, player_tag, col_name).astype(col_type)
+            for player_tag in player_tags for col_name, col_type in columns.items()
+        }, index=self.frames(round_num).astype(np.int64))
+
+    def load(self) -> tuple:
+        # rounds_df and player_character, same as replay_stats.load_replay_data
+        rounds_df = {round_num: self.round_df(round_num) for round_num in self.round_numbers}
+        return rounds_df, replay_stats.prepare_rounds(rounds_df, self.player_data)
+
+
+def load_binary_replay_file(replay_path: str) -> tuple:
+    with BinaryReplay(replay_path) as replay:
+        return replay.load()
+
+
+def write_binary_replay(replay_data: dict, replay_path: str):
+    # write replay json data as a binary replay
+    round_frames = []
+    for round_number, round_data in replay_data.items():
+        if round_number.isnumeric():
+            round_frames.append((int(round_number), sorted(round_data.items(), key=lambda item: int(item[0]))))
+    round_frames.sort(key=lambda item: item[0])
+
+    dtype = record_dtype(player_fields)
+    records = np.zeros(sum(len(frames) for _, frames in round_frames), dtype=dtype)
+    rounds = []
+    start = 0
+    for round_num, frames in round_frames:
+        round_records = records[start:start + len(frames)]
+        round_records['round'] = round_num
+        round_records['frame'] = [int(frame_key) for frame_key, _ in frames]
+        for player_tag in player_tags:
+            for field, field_dtype in player_fields.items():
+                # missing fields are stored as 0
+                values = np.array([frame[player_tag].get(field, 0) for _, frame in frames], dtype=np.float64)
+                if np.dtype(field_dtype).kind == 'i':
+                    # ints that overflow the stored dtype would silently wrap
+                    limits = np.iinfo(field_dtype)
+                    if len(values) > 0 and (values.min() < limits.min or values.max() > limits.max):
+                        raise ValueError(f"round {round_num} {player_tag} {field} doesn't fit in {field_dtype}")
+                round_records[player_tag][field] = values
+        rounds.append([round_num, start, len(frames)])
+        start += len(frames)
+
+    header = json.dumps({
+        "fields": list(player_fields.items()),
+        "player_data": replay_data.get("player_data", {}),
+        "rounds": rounds,
+    }).encode()
+    header += b" " * (-(prelude.size + len(header)) % header_alignment)
+
+    # write to a temp file and move it into place so readers never see a partial replay
+    replay_dir = os.path.dirname(os.path.abspath(replay_path))
+    with tempfile.NamedTemporaryFile(dir=replay_dir, suffix=".tmp", delete=False) as replay_file:
+        replay_file.write(prelude.pack(magic, format_version, 0, len(header)))
+        replay_file.write(header)
+        replay_file.write(records.tobytes())
+    os.replace(replay_file.name, replay_path)
+
+
+def binary_replay_path(json_path: str, output_dir: str = None) -> str:
+    binary_path = os.path.splitext(json_path)[0] + binary_replay_extension
+    if output_dir is not None:
+        binary_path = os.path.join(output_dir, os.path.basename(binary_path))
+    return binary_path
+
+
+def convert_replay(json_path: str, output_dir: str = None) -> str:
+    binary_path = binary_replay_path(json_path, output_dir)
+    write_binary_replay(replay_stats.read_replay_file(json_path, timeout=0), binary_path)
+    return binary_path
+
+
+def convert(replay_path: str, output_dir: str = None):
+    # convert one replay json or every archived replay in a directory
+    from replay_batch import archived_replay_pattern
+
+    if os.path.isdir(replay_path):
+        # every json archive, including the ones already converted next to it
+        json_paths = sorted(os.path.join(replay_path, filename) for filename in os.listdir(replay_path)
+                            if archived_replay_pattern.match(filename) and filename.endswith(".json"))
+    else:
+        json_paths = [replay_path]
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    start_time = time.perf_counter()
+    json_bytes = 0
+    binary_bytes = 0
+    converted = 0
+    for completed, json_path in enumerate(json_paths, start=1):
+        try:
+            binary_path = convert_replay(json_path, output_dir)
+        except Exception as e:
+            print(f"[{completed}/{len(json_paths)}] {os.path.basename(json_path)} FAILED: {e!r}")
+            continue
+        converted += 1
+        json_bytes += os.path.getsize(json_path)
+        binary_bytes += os.path.getsize(binary_path)
+        print(f"[{completed}/{len(json_paths)}] {os.path.basename(binary_path)}")
+    print(f"converted {converted}/{len(json_paths)} replays in {time.perf_counter() - start_time:.1f}s, "
+          f"{json_bytes / (1024 * 1024):.1f} MB json -> {binary_bytes / (1024 * 1024):.1f} MB binary")
@@ -0,0 +1,253 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+
+import pandas as pd
+
+import replay_binary
+import replay_metrics
+import replay_stats
+from replay_config import default_cache_dir
+
+# feather files need pyarrow, without it the cache is disabled and replays are always parsed
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# bump when the layout of the cached DataFrames changes
+cache_format_version = 1
+
+# default cache size
+default_max_bytes = 2 * 1024 * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def name_tables_version() -> str:
+    # hash of the id to name tables and column types, cached DataFrames are only valid for the same tables
+    version = hashlib.sha1(f"{cache_format_version}:{replay_stats.keep_columns}".encode())
+    name_table_paths = [f"{replay_stats.data_dir}/{table_name}.json" for table_name in ["character_ids", "act_st"]]
+    name_table_paths += sorted(glob.glob(f"{replay_stats.character_move_names_path()}/*.json"))
+    for name_table_path in name_table_paths:
+        with open(name_table_path, 'rb') as name_table_file:
+            version.update(name_table_file.read())
+    return version.hexdigest()
+
+
+class ReplayCache:
+    # on disk cache of prepared round DataFrames as feather files, keyed by replay content and name tables
+    def __init__(self, cache_dir: str = default_cache_dir, max_bytes: int = default_max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.tables_version = name_tables_version()[:16]
+
+        # bytes in the cache, counted by the first store and kept up to date by the stores and evictions of this
+        # instance, the directory is only walked again once it's over max_bytes
+        self.total_bytes = None
+
+    @property
+    def available(self) -> bool:
+        return feather is not None
+
+    def key(self, replay_bytes: bytes) -> str:
+        return f"{hashlib.sha256(replay_bytes).hexdigest()}-{self.tables_version}"
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def load_meta(self, key: str):
+        # round numbers and player_character of a cached replay, None if it isn't cached
+        meta_path = os.path.join(self.entry_dir(key), "meta.json")
+        try:
+            with open(meta_path, 'r') as meta_file:
+                meta = json.load(meta_file)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        # last use time for eviction
+        os.utime(meta_path)
+        return meta
+
+    def read_round(self, key: str, round_num) -> pd.DataFrame:
+        # memory mapped read
+        return feather.read_table(os.path.join(self.entry_dir(key), f"round{round_num}.feather"),
+                                  memory_map=True).to_pandas()
+
+    def load(self, key: str):
+        # (rounds_df, player_character) of a cached replay, None if it isn't cached
+        meta = self.load_meta(key)
+        if meta is None:
+            return None
+        try:
+            rounds_df = {int(round_num): self.read_round(key, round_num) for round_num in meta["rounds"]}
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+        return rounds_df, meta["player_character"]
+
+    def store(self, key: str, rounds_df: dict, player_character: dict):
+        if os.path.isdir(self.entry_dir(key)):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # write into a temp dir and rename it into place so readers never see a partial entry
+        temp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.cache_dir)
+        entry_bytes = 0
+        try:
+            for round_num, df in rounds_df.items():
+                feather.write_feather(df, os.path.join(temp_dir, f"round{round_num}.feather"))
+            with open(os.path.join(temp_dir, "meta.json"), 'w') as meta_file:
+                json.dump({"rounds": [str(round_num) for round_num in rounds_df.keys()],
+                           "player_character": player_character}, meta_file)
+            entry_bytes = sum(entry.stat().st_size for entry in os.scandir(temp_dir))
+            os.replace(temp_dir, self.entry_dir(key))
+        except OSError:
+            # another process stored the same replay first
+            entry_bytes = 0
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        if self.total_bytes is None:
+            self.total_bytes = sum(size for _, size, _ in self.entries())
+        else:
+            self.total_bytes += entry_bytes
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def entries(self) -> list:
+        # (last used, size in bytes, entry dir) of each entry
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.entry_dir(key)
+            meta_path = os.path.join(entry_dir, "meta.json")
+            if key.startswith(".tmp-") or not os.path.exists(meta_path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                entries.append((os.path.getmtime(meta_path), size, entry_dir))
+            except FileNotFoundError:
+                # evicted by another process
+                continue
+        return entries
+
+    def evict(self):
+        # remove least recently used entries until the cache fits in max_bytes
+        entries = sorted(self.entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_bytes -= size
+        self.total_bytes = total_bytes
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.total_bytes = 0
+
+    def read_replay(self, replay_path: str, timeout: float = 5.0) -> tuple:
+        # (key, meta, replay_data) of the replay, meta if it's cached or else replay_data parsed from the bytes that
+        # were hashed, the file is read once
+        # the read and parse are the same parse stage as replay_stats.read_replay_bytes, hashing is part of load
+        with replay_metrics.stage("parse"):
+            with open(replay_path, 'rb') as replay_file:
+                replay_bytes = replay_file.read()
+        key = self.key(replay_bytes)
+        meta = self.load_meta(key)
+        if meta is not None:
+            return key, meta, None
+        try:
+            with replay_metrics.stage("parse"):
+                return key, None, json.loads(replay_bytes)
+        except json.decoder.JSONDecodeError:
+            # the file probably isn't finished updating, read it again until it parses
+            replay_bytes, replay_data = replay_stats.read_replay_bytes(replay_path, timeout)
+            return self.key(replay_bytes), None, replay_data
+
+    def prepare(self, key: str, replay_data: dict) -> tuple:
+        # (rounds_df, player_character) of a replay that wasn't cached, stored for next time
+        rounds_df, player_character = replay_stats.load_replay_data(replay_data)
+        self.store(key, rounds_df, player_character)
+        return rounds_df, player_character
+
+    def load_replay_file(self, replay_path: str, timeout: float = 5.0):
+        # same as replay_stats.load_replay_file, from the cache when this replay was already prepared
+        # binary replays are memory mapped, loading them is already cheaper than the cache
+        if not self.available or replay_binary.is_binary_replay(replay_path):
+            return replay_stats.load_replay_file(replay_path, timeout)
+
+        key, meta, replay_data = self.read_replay(replay_path, timeout)
+        if meta is not None:
+            cached = self.load(key)
+            # the entry was removed or is damaged, parse the replay instead
+            return cached if cached is not None else replay_stats.load_replay_file(replay_path, timeout)
+        return self.prepare(key, replay_data)
+
+    def load_replay(self, replay_path: str, timeout: float = 5.0) -> replay_stats.Replay:
+        # same as replay_stats.Replay.from_file, the rounds of a cached replay are read when they're used
+        if not self.available or replay_binary.is_binary_replay(replay_path):
+            return replay_stats.Replay.from_file(replay_path, timeout)
+
+        key, meta, replay_data = self.read_replay(replay_path, timeout)
+        if meta is not None:
+            # the entry was just marked used so eviction removes it last
+            round_frames = {int(round_num): (lambda round_num=round_num: self.read_round(key, round_num))
+                            for round_num in meta["rounds"]}
+            return replay_stats.Replay(round_frames, meta["player_character"])
+
+        # the entry needs every prepared round, update_plots uses all of them anyway
+        return replay_stats.Replay.from_rounds_df(*self.prepare(key, replay_data))
+
+
+@lru_cache(maxsize=None)
+def process_cache(cache_dir: str, max_bytes: int = default_max_bytes) -> ReplayCache:
+    # one cache per worker process, so its running size is kept across the replays the worker loads, other workers'
+    # entries are only counted once it walks the directory, the batch evicts once more at the end
+    return ReplayCache(cache_dir, max_bytes)
+
+
+def warm_replay(replay_path: str, cache_dir: str, max_bytes: int) -> tuple:
+    # returns (replay path, error or None)
+    try:
+        process_cache(cache_dir, max_bytes).load_replay_file(replay_path, timeout=0)
+    except Exception as e:
+        return replay_path, repr(e)
+    return replay_path, None
+
+
+def warm(replay_dir: str, cache_dir: str = default_cache_dir, max_bytes: int = default_max_bytes,
+         max_workers: int = None):
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from replay_batch import find_archived_replays
+
+    if feather is None:
+        print("pyarrow is not installed, the replay cache is disabled")
+        return
+
+    # binary replays aren't cached
+    replay_paths = [replay_path for replay_path in find_archived_replays(replay_dir)
+                    if not replay_binary.is_binary_replay(replay_path)]
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=replay_stats.configure,
+                             initargs=(replay_stats.data_dir, replay_stats.stats_img_dir)) as executor:
+        futures = [executor.submit(warm_replay, replay_path, cache_dir, max_bytes) for replay_path in replay_paths]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            replay_path, error = future.result()
+            status = "cached" if error is None else f"FAILED: {error}"
+            print(f"[{completed}/{len(replay_paths)}] {os.path.basename(replay_path)} {status}")
+
+    # the workers only counted their own entries
+    ReplayCache(cache_dir, max_bytes).evict()
+    print(f"warmed {len(replay_paths)} matches in {time.perf_counter() - start_time:.1f}s")
+
+
+def info(cache_dir: str = default_cache_dir):
+    entries = ReplayCache(cache_dir).entries()
+    total_bytes = sum(size for _, size, _ in entries)
+    print(f"{cache_dir}: {len(entries)} matches, {total_bytes / (1024 * 1024):.1f} MB")
@@ -0,0 +1,91 @@
+import json
+import os
+
+# only the standard library is imported here so the daemon can read its config before loading pandas
+
+# default replay dir
+default_sf6_path = 'C:/SteamLibrary/steamapps/common/Street Fighter 6/'
+
+# recent replay filename
+replay_name = 'recent_replay.json'
+
+# plot image output directory
+default_output_dir = "stats_img"
+
+# batch output directory, one folder per match
+default_batch_output_dir = "stats_batch"
+
+# parsed replay cache and cross match stats database
+default_cache_dir = ".replay_cache"
+default_store_path = "match_stats.db"
+
+# config file read by the daemon when --config isn't given, skipped if it doesn't exist
+default_config_path = "replay_stats_config.json"
+
+# directory of the scripts, the data dir is found here when it isn't in the working directory
+module_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def default_data_dir() -> str:
+    # data in the working directory like the exe expects, or next to the scripts
+    if os.path.isdir("data"):
+        return "data"
+    return os.path.join(module_dir, "data")
+
+
+def recent_replay_path(sf6_path: str) -> str:
+    return f"{sf6_path}/reframework/data/{replay_name}"
+
+
+class Config:
+    # paths and settings of the daemon, every key of the config file is optional
+    keys = ["sf6_path", "data_dir", "output_dir", "batch_output_dir", "cache_dir", "store_path", "workers",
+            "metrics_path", "profiler", "overlay_port", "render_images", "stations"]
+
+    def __init__(self, sf6_path: str = default_sf6_path, data_dir: str = None, output_dir: str = default_output_dir,
+                 batch_output_dir: str = default_batch_output_dir, cache_dir: str = default_cache_dir,
+                 store_path: str = default_store_path, workers: int = None, metrics_path: str = None,
+                 profiler: str = None, overlay_port: int = None, render_images: bool = True, stations: list = None):
+        self.sf6_path = sf6_path
+        self.data_dir = data_dir if data_dir is not None else default_data_dir()
+        self.output_dir = output_dir
+
+        # None disables the cache or the store
+        self.batch_output_dir = batch_output_dir
+        self.cache_dir = cache_dir
+        self.store_path = store_path
+
+        # render or batch worker processes, None picks from the cpu count
+        self.workers = workers
+
+        # json line of stage timings per match, and cprofile or pyinstrument to profile each match, both off by default
+        self.metrics_path = metrics_path
+        self.profiler = profiler
+
+        # port of the browser source overlay while watching, None disables it, render_images False makes it the only
+        # output
+        self.overlay_port = overlay_port
+        self.render_images = render_images
+
+        # installs watched at once by replay_stations, each a dict of replay_stations.station_keys
+        self.stations = stations if stations is not None else []
+
+    @classmethod
+    def load(cls, config_path: str = None, **overrides) -> "Config":
+        # config file values, then overrides that aren't None, like the command line arguments
+        values = {}
+        if config_path is not None or os.path.exists(default_config_path):
+            with open(config_path or default_config_path, 'r') as config_file:
+                values = json.load(config_file)
+            unknown_keys = set(values.keys()) - set(cls.keys)
+            if len(unknown_keys) > 0:
+                raise ValueError(f"unknown config keys {sorted(unknown_keys)}, expected some of {cls.keys}")
+        values.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**values)
+
+    @property
+    def replay_path(self) -> str:
+        return recent_replay_path(self.sf6_path)
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.keys}
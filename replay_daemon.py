@@ -0,0 +1,198 @@
+# headless entry point for running the stats as a background service, without the ui
+# usage: python replay_daemon.py --watch | --once | --batch [DIR] | --stations [--config replay_stats_config.json] ...
+import time
+
+# cold start is measured from here, before pandas and matplotlib are imported
+start_time = time.perf_counter()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import signal  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+
+import replay_metrics  # noqa: E402
+from replay_config import Config, default_config_path, recent_replay_path  # noqa: E402
+from replay_watcher import ReplayWatcher  # noqa: E402
+
+
+def startup_ms() -> float:
+    return (time.perf_counter() - start_time) * 1000
+
+
+class Pipeline:
+    # replay_stats, the caches and the render workers, imported and started the first time they're needed
+    def __init__(self, config: Config, render_pool: bool = True, overlay=None):
+        self.config = config
+        self.use_render_pool = render_pool and config.render_images
+        self.overlay = overlay
+        self.replay_stats = None
+        self.render_pool = None
+        self.plot_cache = None
+        self.replay_cache = None
+        self.lock = threading.Lock()
+
+        # sqlite connections stay on the thread that opened them, opened by the first update
+        self.stats_store = None
+
+    def load(self):
+        # safe to call from a warm up thread while the main thread waits for a match
+        with self.lock:
+            if self.replay_stats is None:
+                import replay_stats
+                replay_stats.configure(self.config.data_dir, self.config.output_dir)
+
+                if self.config.cache_dir is not None:
+                    from replay_cache import ReplayCache
+                    self.replay_cache = ReplayCache(self.config.cache_dir)
+                if self.use_render_pool:
+                    from replay_render import RenderPool
+                    self.render_pool = RenderPool(self.config.workers)
+                self.plot_cache = replay_stats.PlotCache()
+                self.replay_stats = replay_stats
+        return self.replay_stats
+
+    def update(self):
+        # plot the recent replay, returns once the images are written
+        replay_stats = self.load()
+        if self.stats_store is None and self.config.store_path is not None:
+            from replay_store import StatsStore
+            self.stats_store = StatsStore(self.config.store_path)
+
+        update_start = time.perf_counter()
+        plots_updated = threading.Event()
+
+        def on_complete(errors):
+            for error in errors:
+                print(f"failed to render plot: {error!r}")
+            print(f"updated plots in {time.perf_counter() - update_start:.2f}s.")
+            match_metrics = replay_metrics.last_match()
+            if match_metrics is not None:
+                print(f"slowest stages: {match_metrics.summary()}")
+            plots_updated.set()
+
+        replay_path = self.config.replay_path
+        replay_stats.update_plots(replay_stats.load_recent_replay(self.config.sf6_path, self.replay_cache),
+                                  self.render_pool, on_complete, self.plot_cache, self.stats_store,
+                                  replay_stats.replay_played_at(replay_path), overlay=self.overlay,
+                                  render_images=self.config.render_images)
+        plots_updated.wait()
+
+    def close(self):
+        if self.overlay is not None:
+            self.overlay.close()
+        if self.render_pool is not None:
+            self.render_pool.shutdown()
+        if self.stats_store is not None:
+            self.stats_store.close()
+
+
+def update_logged(pipeline: Pipeline):
+    # one bad replay shouldn't stop the service
+    try:
+        pipeline.update()
+    except Exception as e:
+        print(f"failed to update plots: {e!r}")
+
+
+def run_once(config: Config) -> int:
+    # plot the recent replay in this process and exit, render workers would take longer to start than one match
+    if not os.path.exists(config.replay_path):
+        print(f"no replay at {config.replay_path}")
+        return 1
+    pipeline = Pipeline(config, render_pool=False)
+    try:
+        pipeline.update()
+    finally:
+        pipeline.close()
+    return 0
+
+
+def run_watch(config: Config) -> int:
+    # start watching right away, replay_stats is imported and the render workers started while waiting
+    watcher = ReplayWatcher(config.replay_path)
+    overlay = None
+    if config.overlay_port is not None:
+        from replay_overlay import OverlayServer
+        overlay = OverlayServer(config.overlay_port)
+        print(f"overlay at {overlay.url}")
+    pipeline = Pipeline(config, overlay=overlay)
+
+    # stop cleanly when the service is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.cancel())
+
+    print(f"watching {config.replay_path} ({watcher.backend}), ready in {startup_ms():.0f} ms")
+    warm_thread = threading.Thread(target=pipeline.load, name="warm-up", daemon=True)
+    warm_thread.start()
+    try:
+        if os.path.exists(config.replay_path):
+            update_logged(pipeline)
+        while watcher.wait_for_change():
+            update_logged(pipeline)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        pipeline.close()
+    return 0
+
+
+def run_batch(config: Config, replay_dir: str = None) -> int:
+    import replay_stats
+    from replay_batch import run_batch as run_replay_batch
+
+    replay_stats.configure(config.data_dir, config.output_dir)
+    replay_dir = replay_dir or os.path.dirname(recent_replay_path(config.sf6_path))
+    result = run_replay_batch(replay_dir, config.batch_output_dir, config.workers, config.cache_dir,
+                              config.store_path)
+    return 1 if len(result["failed"]) > 0 else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate SF6 match stats plots without the ui.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--once", action="store_true", help="plot the recent replay and exit")
+    mode.add_argument("--watch", action="store_true", help="plot every new match until stopped")
+    mode.add_argument("--batch", nargs="?", const="", metavar="REPLAY_DIR",
+                      help="process every archived match, in reframework/data by default")
+    mode.add_argument("--stations", action="store_true", help="watch every install in the config's stations")
+    parser.add_argument("--config", default=None, help=f"json config file, {default_config_path} if it exists")
+    parser.add_argument("--sf6-path", default=None, help="SF6 steam directory")
+    parser.add_argument("--data-dir", default=None, help="character and action name tables")
+    parser.add_argument("--output-dir", default=None, help="plot image directory")
+    parser.add_argument("--batch-output-dir", default=None, help="batch output directory, one folder per match")
+    parser.add_argument("--cache-dir", default=None, help="parsed replay cache")
+    parser.add_argument("--store", dest="store_path", default=None, help="cross match stats database")
+    parser.add_argument("--workers", type=int, default=None, help="render or batch worker processes")
+    parser.add_argument("--metrics", dest="metrics_path", default=None, help="append stage timings per match here")
+    parser.add_argument("--profile", dest="profiler", choices=replay_metrics.profilers, default=None,
+                        help="profile each match into --profile-dir")
+    parser.add_argument("--profile-dir", default="profiles")
+    parser.add_argument("--overlay", dest="overlay_port", type=int, nargs="?", const=8765, default=None,
+                        metavar="PORT", help="serve the stats to an OBS browser source while watching, port 8765")
+    parser.add_argument("--no-images", dest="render_images", action="store_false", default=None,
+                        help="don't render the png images, for use with --overlay")
+    args = parser.parse_args(argv)
+    if args.batch is not None and (args.metrics_path is not None or args.profiler is not None):
+        # the batch workers don't record stages
+        parser.error("--metrics/--profile aren't supported with --batch")
+
+    config = Config.load(args.config, sf6_path=args.sf6_path, data_dir=args.data_dir, output_dir=args.output_dir,
+                         batch_output_dir=args.batch_output_dir, cache_dir=args.cache_dir,
+                         store_path=args.store_path, workers=args.workers, metrics_path=args.metrics_path,
+                         profiler=args.profiler, overlay_port=args.overlay_port, render_images=args.render_images)
+    # metrics_path and profiler of the config file are for watching, a batch leaves them off
+    if (config.metrics_path is not None or config.profiler is not None) and args.batch is None:
+        replay_metrics.enable(config.metrics_path, config.profiler, args.profile_dir)
+    if args.once:
+        return run_once(config)
+    if args.watch:
+        return run_watch(config)
+    if args.stations:
+        from replay_stations import run_stations
+        return run_stations(config)
+    return run_batch(config, args.batch or None)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
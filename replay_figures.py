@@ -0,0 +1,327 @@
+import io
+import threading
+from functools import lru_cache
+
+import numpy as np
+from matplotlib import rcParams
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import MaxNLocator
+
+import replay_stats
+
+# same style as the replay_stats plots
+replay_stats.use_plot_style()
+
+# colors the bar calls of the replay_stats plots get from the dark_background color cycle
+cycle_colors = rcParams['axes.prop_cycle'].by_key()['color']
+
+# subplot parameters of a new figure
+subplot_params = ["left", "right", "bottom", "top", "wspace", "hspace"]
+
+
+def new_figure() -> Figure:
+    # figure drawn straight on an Agg canvas, not registered with pyplot
+    fig = Figure(figsize=(15, 5))
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def update_bars(ax, bars: list, xs, heights, width: float, **bar_kwargs) -> list:
+    # move and resize the bar rectangles in place, only adding or removing the difference in bar count
+    for bar in bars[len(xs):]:
+        bar.remove()
+    bars = bars[:len(xs)]
+    for bar, x, height in zip(bars, xs, heights):
+        bar.set_x(x - width / 2)
+        bar.set_width(width)
+        bar.set_height(height)
+    if len(xs) > len(bars):
+        bars.extend(ax.bar(xs[len(bars):], heights[len(bars):], width, **bar_kwargs).patches)
+    return bars
+
+
+def update_texts(ax, texts: list, count: int, **text_kwargs) -> list:
+    # reuse annotation texts, only adding or removing the difference in count
+    for text in texts[count:]:
+        text.remove()
+    texts = texts[:count]
+    while len(texts) < count:
+        texts.append(ax.text(0, 0, "", **text_kwargs))
+    return texts
+
+
+def png_bytes(fig: Figure) -> bytes:
+    # encode in memory, the caller decides where the image goes
+    image_buffer = io.BytesIO()
+    fig.savefig(image_buffer, format='png')
+    return image_buffer.getvalue()
+
+
+def layout(fig: Figure):
+    # tight layout without the legends, they're inside the axes so they don't change it and placing a 'best'
+    # legend is expensive
+    legends = [ax.get_legend() for ax in fig.axes if ax.get_legend() is not None]
+    for legend in legends:
+        legend.set_in_layout(False)
+
+    # tight layout measures from the current layout, start from the one a new figure has so the result matches
+    fig.subplots_adjust(**{param: rcParams[f"figure.subplot.{param}"] for param in subplot_params})
+    fig.tight_layout()
+    for legend in legends:
+        legend.set_in_layout(True)
+
+    # tight_layout leaves a placeholder layout engine behind, which makes savefig draw an extra time
+    fig.set_layout_engine(None)
+
+
+class DamageFigure:
+    # reusable figure of replay_stats.plot_player_damage
+    bar_width = 0.15
+    x_offset = 0.17
+
+    def __init__(self):
+        self.fig = new_figure()
+        self.ax1 = self.fig.add_subplot()
+        self.ax2 = self.ax1.twinx()
+        self.count_bars = []
+        self.total_bars = []
+        self.count_texts = []
+        self.total_texts = []
+
+        # use integer values for y axes
+        self.ax2.yaxis.set_major_locator(MaxNLocator(integer=True))
+        self.ax1.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+        # labels, titles, and legends
+        self.ax1.set_xlabel('')
+        self.ax1.set_ylabel('Count', color='white')
+        self.ax2.set_ylabel('Total Damage', color='orange')
+        self.legends_added = False
+
+    def render(self, player_idx: str, round_num: int, data: dict, player_character: dict) -> bytes:
+        # round start at 0
+        round_num = round_num + 1
+
+        # reverse idx, as in plot_player_damage
+        player_idx = "2" if player_idx == "1" else "1"
+
+        moves = list(data.keys())
+        counts = [data[move]["count"] for move in moves]
+        totals = [data[move]["total"] for move in moves]
+        index = np.arange(len(moves))
+        max_count = max(counts)
+        max_total = max(totals)
+
+        # counts and annotations
+        self.count_bars = update_bars(self.ax1, self.count_bars, index - self.bar_width / 2, counts, self.bar_width,
+                                      alpha=0.8, color=cycle_colors[0])
+        self.count_texts = update_texts(self.ax1, self.count_texts, len(moves), ha='center', va='bottom',
+                                        color='white')
+        for bar, text in zip(self.count_bars, self.count_texts):
+            yval = bar.get_height()
+            text.set_position((bar.get_x() + bar.get_width() / 2, yval + 0.05 * max_count))
+            text.set_text(round(yval, 2))
+
+        # damage and annotations on the second Y axis
+        self.total_bars = update_bars(self.ax2, self.total_bars, index + self.bar_width / 2, totals, self.bar_width,
+                                      alpha=0.8, color='orange')
+        self.total_texts = update_texts(self.ax2, self.total_texts, len(moves), ha='left', va='center',
+                                        color='orange')
+        for bar, text in zip(self.total_bars, self.total_texts):
+            yval = bar.get_height()
+            text.set_position((bar.get_x() + self.x_offset, yval / 2))
+            text.set_text(round(yval))
+
+        # x limits from the bars of both axes, y limits as in plot_player_damage
+        for ax in [self.ax1, self.ax2]:
+            ax.relim()
+        self.ax1.autoscale_view(scaley=False)
+        self.ax1.set_ylim(0, 1.3 * max_count)
+        self.ax2.set_ylim(0, 1.3 * max_total)
+
+        self.ax1.set_xticks(index)
+        self.ax1.set_xticklabels(moves)
+        if not self.legends_added:
+            self.ax1.legend([self.count_bars[0]], ["Count"], loc='upper left')
+            self.ax2.legend([self.total_bars[0]], ["Total Damage"], loc='upper right')
+            self.legends_added = True
+        self.ax2.set_title(f'P{player_idx} ({player_character[player_idx]}) Round {round_num} Damage')
+
+        layout(self.fig)
+        return png_bytes(self.fig)
+
+
+class DriveFigure:
+    # reusable figure of replay_stats.plot_drive_data
+    width = 0.35
+
+    def __init__(self):
+        self.fig = new_figure()
+        self.ax = self.fig.add_subplot()
+        self.player_bars = {"1": [], "2": []}
+        self.player_texts = {"1": [], "2": []}
+
+        # labels, title
+        self.ax.set_ylabel('Drive')
+        self.ax.set_title('Drive Gauge Usage/Lost')
+        self.legend = None
+
+    def render(self, data: dict, round_num: int, player_character: dict) -> bytes:
+        abilities = {}
+        for player, player_data in data.items():
+            for ability, ability_data in player_data.items():
+                if ability not in abilities:
+                    abilities[ability] = {}
+                abilities[ability][player] = ability_data["total"]
+
+        labels = list(abilities.keys())
+        x = np.arange(len(labels))
+        for player, offset, color in [("1", -self.width / 2, cycle_colors[0]), ("2", self.width / 2, cycle_colors[1])]:
+            player_vals = [abilities[ability].get(player, 0) for ability in labels]
+            self.player_bars[player] = update_bars(self.ax, self.player_bars[player], x + offset, player_vals,
+                                                   self.width, color=color)
+
+            # annotations to bars, 3 points vertical offset
+            self.player_texts[player] = self.update_annotations(self.player_texts[player], self.player_bars[player])
+
+        # empty rounds keep the default limits of a new axes
+        self.ax.relim()
+        if len(labels) > 0:
+            self.ax.autoscale_view()
+        else:
+            self.ax.set_xlim(0, 1, auto=None)
+            self.ax.set_ylim(0, 1, auto=None)
+
+        self.ax.set_xticks(x)
+        self.ax.set_xticklabels(labels)
+        legend_labels = [f'P1 ({player_character["1"]})', f'P2 ({player_character["2"]})']
+        if self.legend is None and len(labels) > 0:
+            self.legend = self.ax.legend([self.player_bars["1"][0], self.player_bars["2"][0]], legend_labels)
+        elif self.legend is not None:
+            for text, legend_label in zip(self.legend.get_texts(), legend_labels):
+                text.set_text(legend_label)
+
+        # without bars there's nothing for the legend to label
+        if self.legend is not None:
+            self.legend.set_visible(len(labels) > 0)
+
+        layout(self.fig)
+        return png_bytes(self.fig)
+
+    def update_annotations(self, annotations: list, bars: list) -> list:
+        for annotation in annotations[len(bars):]:
+            annotation.remove()
+        annotations = annotations[:len(bars)]
+        while len(annotations) < len(bars):
+            annotations.append(self.ax.annotate('', xy=(0, 0), xytext=(0, 3), textcoords="offset points",
+                                                ha='center', va='bottom'))
+        for annotation, bar in zip(annotations, bars):
+            height = bar.get_height()
+            annotation.xy = (bar.get_x() + bar.get_width() / 2, height)
+            annotation.set_text('{}'.format(int(height)))
+        return annotations
+
+
+class TableFigure:
+    # reusable figure of replay_stats.plot_table_metrics, the table is rebuilt only when the number of rounds changes
+    header_color = "#505050"
+    metric_color = "#A0A0A0"
+
+    def __init__(self):
+        self.fig = new_figure()
+        self.ax = self.fig.add_subplot()
+        self.ax.axis('off')
+        self.ax.set_title('Match Stats')
+        self.table = None
+
+    def render(self, data: dict) -> bytes:
+        headers = [""]
+        for round_key in sorted(data.keys()):
+            round_num = int(round_key) + 1
+            headers.extend([f"Round {round_num} Player 1", f"Round {round_num} Player 2"])
+        headers.extend(["Total Player 1", "Total Player 2"])
+        cell_data = [headers]
+
+        for metric in data['0'].keys():
+            row = [metric]
+            for round_key in sorted(data.keys()):
+                for player in ["1", "2"]:
+                    row.append(data[round_key][metric][player])
+            total_player_1 = sum([data[round_key][metric]['1'] for round_key in data.keys()])
+            total_player_2 = sum([data[round_key][metric]['2'] for round_key in data.keys()])
+            row.extend([total_player_1, total_player_2])
+            cell_data.append(row)
+
+        shape = (len(cell_data), len(headers))
+        if self.table is not None and self.table_shape == shape:
+            # same rounds and metrics, only the text changes
+            cells = self.table.get_celld()
+            for row_idx, row in enumerate(cell_data):
+                for col_idx, value in enumerate(row):
+                    cells[row_idx, col_idx].get_text().set_text(value)
+        else:
+            if self.table is not None:
+                self.table.remove()
+            self.table = self.create_table(cell_data)
+            self.table_shape = shape
+
+        layout(self.fig)
+        return png_bytes(self.fig)
+
+    def create_table(self, cell_data: list):
+        # padding based on figure dimensions, as in plot_table_metrics
+        padding_inch = 1
+        width_padding_fraction = padding_inch / self.fig.get_figwidth()
+        height_padding_fraction = padding_inch / self.fig.get_figheight()
+        bbox = [width_padding_fraction, height_padding_fraction, 1 - 2 * width_padding_fraction,
+                1 - 2 * height_padding_fraction]
+
+        table = self.ax.table(cellText=cell_data, loc='center', cellLoc='center', bbox=bbox)
+        table.auto_set_font_size(False)
+        table.set_fontsize(10)
+        table.auto_set_column_width(col=list(range(len(cell_data[0]))))
+        table.scale(1, 0.5)
+
+        for key, cell in table.get_celld().items():
+            if key[0] == 0:
+                cell.set_facecolor(self.header_color)
+                cell.set_text_props(color='white')
+            else:
+                cell.set_facecolor(self.metric_color)
+                cell.set_text_props(color='black')
+        return table
+
+
+class FigureRenderer:
+    # renders plot jobs on one persistent figure per plot type
+    def __init__(self):
+        self.figures = {}
+
+        # figures are shared by every thread of the process
+        self.lock = threading.Lock()
+
+    def figure(self, plot_name: str):
+        if plot_name not in self.figures:
+            self.figures[plot_name] = figure_types[plot_name]()
+        return self.figures[plot_name]
+
+    def render(self, plot_job) -> bytes:
+        # the png bytes of the plot job's image
+        plot_name, plot_args = plot_job
+        with self.lock:
+            return self.figure(plot_name).render(*plot_args)
+
+
+# plot name to the figure that renders it
+figure_types = {
+    "player_damage": DamageFigure,
+    "drive_data": DriveFigure,
+    "table_metrics": TableFigure,
+}
+
+
+@lru_cache(maxsize=None)
+def figure_renderer() -> FigureRenderer:
+    # one renderer per process
+    return FigureRenderer()
@@ -0,0 +1,294 @@
+import contextlib
+import ctypes
+import datetime
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# recorder of the process, None when instrumentation is disabled so stages cost one global lookup
+recorder = None
+
+# returned by stage() when disabled, reused so nothing is allocated per call
+null_stage = contextlib.nullcontext()
+
+# profilers the recorder can capture each match with
+profilers = ["cprofile", "pyinstrument"]
+
+
+def load_psapi():
+    # psapi GetProcessMemoryInfo with the PROCESS_MEMORY_COUNTERS it fills in, None if not on windows
+    if not sys.platform.startswith("win"):
+        return None
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong)] + [
+            (field, ctypes.c_size_t) for field in [
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage"]]
+
+    psapi = ctypes.WinDLL("psapi")
+    psapi.GetProcessMemoryInfo.argtypes = [ctypes.c_void_p, ctypes.POINTER(ProcessMemoryCounters), ctypes.c_ulong]
+    return psapi, ProcessMemoryCounters
+
+
+@functools.lru_cache(maxsize=None)
+def memory_reader():
+    # function returning the resident memory of this process in bytes, None if there's no cheap way to read it
+    if os.path.exists("/proc/self/statm"):
+        page_size = os.sysconf("SC_PAGE_SIZE")
+
+        def read_statm():
+            with open("/proc/self/statm", 'rb') as statm_file:
+                return int(statm_file.read().split()[1]) * page_size
+        return read_statm
+
+    psapi = load_psapi()
+    if psapi is not None:
+        psapi, ProcessMemoryCounters = psapi
+        current_process = ctypes.windll.kernel32.GetCurrentProcess()
+
+        def read_working_set():
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            psapi.GetProcessMemoryInfo(current_process, ctypes.byref(counters), counters.cb)
+            return counters.WorkingSetSize
+        return read_working_set
+    return None
+
+
+def rss_bytes():
+    read_memory = memory_reader()
+    return read_memory() if read_memory is not None else None
+
+
+class StageMetrics:
+    # totals of every call of one stage during a match, without the stages nested in it
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.rows = 0
+
+        # change in resident memory over the stage's calls, None if it can't be read
+        self.memory_bytes = None
+
+    def add(self, seconds: float, rows: int = None, memory_bytes: int = None):
+        self.seconds += seconds
+        self.calls += 1
+        if rows is not None:
+            self.rows += rows
+        if memory_bytes is not None:
+            self.memory_bytes = (self.memory_bytes or 0) + memory_bytes
+
+    def to_dict(self) -> dict:
+        return {"seconds": round(self.seconds, 6), "calls": self.calls, "rows": self.rows,
+                "memory_mb": round(self.memory_bytes / (1024 * 1024), 3) if self.memory_bytes is not None else None}
+
+
+class MatchMetrics:
+    # stage name: StageMetrics of one match, stages are added from whatever thread runs them
+    def __init__(self):
+        # when the first stage ran
+        self.started_at = None
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage_name: str, seconds: float, rows: int = None, memory_bytes: int = None):
+        with self.lock:
+            if self.started_at is None:
+                self.started_at = datetime.datetime.now()
+            if stage_name not in self.stages:
+                self.stages[stage_name] = StageMetrics()
+            self.stages[stage_name].add(seconds, rows, memory_bytes)
+
+    def slowest(self, count: int = 3) -> list:
+        # (stage name, seconds) of the slowest stages
+        with self.lock:
+            stage_seconds = [(stage_name, stage.seconds) for stage_name, stage in self.stages.items()]
+        return sorted(stage_seconds, key=lambda item: item[1], reverse=True)[:count]
+
+    def summary(self, count: int = 3) -> str:
+        # short form for the ui status line
+        return ", ".join(f"{stage_name} {seconds:.2f}s" for stage_name, seconds in self.slowest(count))
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {"started_at": self.started_at.isoformat(timespec="milliseconds") if self.started_at else None,
+                    "stages": {stage_name: stage.to_dict() for stage_name, stage in self.stages.items()}}
+
+
+class MetricsRecorder:
+    # collects the stages of the match being processed, writes each finished match as a json line to metrics_path
+    # and optionally profiles it
+    def __init__(self, metrics_path: str = None, profiler: str = None, profile_dir: str = "profiles"):
+        if profiler is not None and profiler not in profilers:
+            raise ValueError(f"unknown profiler {profiler}, expected one of {profilers}")
+        if profiler == "pyinstrument" and pyinstrument is None:
+            raise ValueError("pyinstrument is not installed")
+        self.metrics_path = metrics_path
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+
+        # stages since the last finished match on each thread, matches run on their own threads when several
+        # stations are watched, and the last match that was published
+        self.local = threading.local()
+        self.last = None
+        self.lock = threading.Lock()
+
+        # (profiler, thread id) of the match being profiled, started by its first stage
+        self.profile = None
+
+    @property
+    def current(self) -> MatchMetrics:
+        if not hasattr(self.local, "current"):
+            self.local.current = MatchMetrics()
+        return self.local.current
+
+    @property
+    def running(self) -> list:
+        # [seconds, memory bytes] of the stages nested in each stage running on this thread, innermost last
+        if not hasattr(self.local, "running"):
+            self.local.running = []
+        return self.local.running
+
+    @contextlib.contextmanager
+    def stage(self, stage_name: str, rows: int = None):
+        # stages nest, like load around parse and names, each records its own time without its nested stages' so
+        # the same time isn't counted twice
+        if self.profiler is not None and self.profile is None:
+            self.start_profile()
+        match_metrics = self.current
+        running = self.running
+        nested = [0.0, 0]
+        running.append(nested)
+        start_memory = rss_bytes()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            end_memory = rss_bytes() if start_memory is not None else None
+            memory_bytes = end_memory - start_memory if end_memory is not None else None
+            running.pop()
+            if len(running) > 0:
+                running[-1][0] += elapsed
+                running[-1][1] += memory_bytes or 0
+            match_metrics.add(stage_name, elapsed - nested[0], rows,
+                              memory_bytes - nested[1] if memory_bytes is not None else None)
+
+    def start_profile(self):
+        # profile the thread the match's stages run on, cProfile only sees the thread that enabled it
+        with self.lock:
+            if self.profile is not None:
+                return
+            if self.profiler == "pyinstrument":
+                profiler = pyinstrument.Profiler()
+                profiler.start()
+            else:
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.enable()
+            self.profile = (profiler, threading.get_ident())
+
+    def stop_profile(self, match_metrics: MatchMetrics):
+        with self.lock:
+            if self.profile is None or self.profile[1] != threading.get_ident():
+                return
+            profiler = self.profile[0]
+            self.profile = None
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        started_at = match_metrics.started_at or datetime.datetime.now()
+        profile_name = os.path.join(self.profile_dir, started_at.strftime("%Y%m%d_%H%M%S_%f"))
+        if self.profiler == "pyinstrument":
+            profiler.stop()
+            with open(f"{profile_name}.html", 'w') as profile_file:
+                profile_file.write(profiler.output_html())
+        else:
+            profiler.disable()
+            profiler.dump_stats(f"{profile_name}.prof")
+
+    def finish_match(self) -> MatchMetrics:
+        # the stages this thread collected for the match so far, later stages go to the next match, stages still to
+        # run for this match like rendering are added to the returned metrics directly
+        match_metrics = self.current
+        self.local.current = MatchMetrics()
+        if self.profiler is not None:
+            self.stop_profile(match_metrics)
+        return match_metrics
+
+    def publish(self, match_metrics: MatchMetrics, **match_info):
+        # the match is done, match_info is added to its json line
+        self.last = match_metrics
+        if self.metrics_path is None:
+            return
+        line = json.dumps({**match_info, **match_metrics.to_dict()}, default=str)
+        with self.lock:
+            with open(self.metrics_path, 'a') as metrics_file:
+                metrics_file.write(line + "\n")
+
+
+def enable(metrics_path: str = None, profiler: str = None, profile_dir: str = "profiles") -> MetricsRecorder:
+    global recorder
+    recorder = MetricsRecorder(metrics_path, profiler, profile_dir)
+    return recorder
+
+
+def enable_from_env():
+    # opt in from the environment, for the ui: SF6_STATS_METRICS=<metrics file>, SF6_STATS_PROFILE=cprofile
+    metrics_path = os.environ.get("SF6_STATS_METRICS")
+    profiler = os.environ.get("SF6_STATS_PROFILE")
+    if metrics_path or profiler:
+        return enable(metrics_path or None, profiler or None)
+    return None
+
+
+def disable():
+    global recorder
+    recorder = None
+
+
+def stage(stage_name: str, rows: int = None):
+    # with stage("damage", len(df)): ..., records nothing when disabled
+    if recorder is None:
+        return null_stage
+    return recorder.stage(stage_name, rows)
+
+
+def instrumented(stage_name: str, rows=None):
+    # decorator recording every call as stage_name, rows(*args) gives the rows the call processes
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if recorder is None:
+                return func(*args, **kwargs)
+            with recorder.stage(stage_name, rows(*args) if rows is not None else None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def df_rows(arg_idx: int):
+    # rows of a DataFrame argument
+    return lambda *args: len(args[arg_idx])
+
+
+def finish_match():
+    # MatchMetrics of the match whose stats were just computed, None when disabled
+    return recorder.finish_match() if recorder is not None else None
+
+
+def publish(match_metrics: MatchMetrics, **match_info):
+    if recorder is not None and match_metrics is not None:
+        recorder.publish(match_metrics, **match_info)
+
+
+def last_match():
+    return recorder.last if recorder is not None else None
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from replay_watcher import file_signature
+
+# how long to keep retrying a replace while another program has the image open, only happens on windows
+replace_timeout = 1.0
+
+
+def atomic_write(path: str, data: bytes):
+    # write to a temp file next to path and rename it over path, readers see the old or the new file, never part
+    output_dir = os.path.dirname(os.path.abspath(path))
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=output_dir, prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                     delete=False) as temp_file:
+        temp_file.write(data)
+
+    retry_delay = 0.01
+    deadline = time.monotonic() + replace_timeout
+    try:
+        while True:
+            try:
+                os.replace(temp_file.name, path)
+                return
+            except PermissionError:
+                # windows can't replace a file another program is reading, like OBS
+                if time.monotonic() + retry_delay > deadline:
+                    raise
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 0.1)
+    except BaseException:
+        os.remove(temp_file.name)
+        raise
+
+
+class ImageCache:
+    # latest encoded bytes of each image, written by the render callbacks and read by the ui
+    def __init__(self):
+        self.images = {}
+        self.lock = threading.Lock()
+
+    def put(self, image_path: str, image_bytes: bytes):
+        with self.lock:
+            self.images[os.path.abspath(image_path)] = image_bytes
+
+    def get(self, image_path: str):
+        # the image bytes, None if the image wasn't rendered in this process
+        with self.lock:
+            return self.images.get(os.path.abspath(image_path))
+
+    def remove(self, image_path: str):
+        with self.lock:
+            self.images.pop(os.path.abspath(image_path), None)
+
+
+class ImageSink:
+    # writes encoded images atomically, skips images whose bytes haven't changed, and publishes them to image_cache
+    def __init__(self, image_cache: ImageCache = None):
+        self.image_cache = image_cache
+
+        # image path: (digest, file signature) of the last write, so unchanged images aren't read back
+        self.written = {}
+        self.lock = threading.Lock()
+
+    def unchanged(self, image_path: str, image_bytes: bytes, digest: str) -> bool:
+        signature = file_signature(image_path)
+        if signature is None:
+            return False
+        if self.written.get(image_path) == (digest, signature):
+            return True
+
+        # written before this process started or by something else, compare the bytes
+        if signature[1] != len(image_bytes):
+            return False
+        with open(image_path, 'rb') as image_file:
+            return image_file.read() == image_bytes
+
+    def write(self, image_path: str, image_bytes: bytes) -> bool:
+        # True if the file was written, False if it already had these bytes
+        if self.image_cache is not None:
+            self.image_cache.put(image_path, image_bytes)
+
+        digest = hashlib.sha1(image_bytes).hexdigest()
+        with self.lock:
+            if self.unchanged(image_path, image_bytes, digest):
+                return False
+            atomic_write(image_path, image_bytes)
+            self.written[image_path] = (digest, file_signature(image_path))
+        return True
+
+    def remove(self, image_path: str):
+        if self.image_cache is not None:
+            self.image_cache.remove(image_path)
+        with self.lock:
+            self.written.pop(image_path, None)
+            if os.path.exists(image_path):
+                os.remove(image_path)
+
+
+# sink used when none is given, writes files only
+default_sink = ImageSink()
@@ -0,0 +1,283 @@
+import html
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# default port of the overlay server, an OBS browser source points at http://127.0.0.1:8765/
+default_port = 8765
+
+# seconds between keepalive comments on an idle event stream, so proxies and OBS don't drop it
+keepalive_seconds = 15.0
+
+# colors of the png plots, matplotlib's first two cycle colors on the dark background
+player_colors = {"1": "#1f77b4", "2": "#ff7f0e"}
+count_color = "#1f77b4"
+damage_color = "orange"
+
+# size of each chart in px
+chart_width = 900
+chart_height = 300
+chart_margin = {"top": 40, "right": 60, "bottom": 70, "left": 60}
+
+
+def svg_text(x: float, y: float, text, anchor: str = "middle", color: str = "white", size: int = 12,
+             rotate: float = None) -> str:
+    transform = f' transform="rotate({rotate} {x:.1f} {y:.1f})"' if rotate is not None else ""
+    return (f'<text x="{x:.1f}" y="{y:.1f}" text-anchor="{anchor}" fill="{color}" font-size="{size}"{transform}>'
+            f'{html.escape(str(text))}</text>')
+
+
+def svg_bar_chart(title: str, labels: list, series: list, shared_scale: bool = True) -> str:
+    # grouped bars, series is a list of (name, color, values), each series gets its own scale unless shared_scale
+    # like the twin axes of the damage plot
+    plot_width = chart_width - chart_margin["left"] - chart_margin["right"]
+    plot_height = chart_height - chart_margin["top"] - chart_margin["bottom"]
+    shared_max = max([max(values, default=0) for _, _, values in series], default=0)
+
+    group_width = plot_width / max(len(labels), 1)
+    bar_width = min(group_width * 0.8 / max(len(series), 1), 40)
+    parts = [svg_text(chart_width / 2, 20, title, size=16)]
+
+    for series_idx, (series_name, color, values) in enumerate(series):
+        series_max = shared_max if shared_scale else max(values, default=0)
+        # headroom for the value labels, as the png plots
+        scale = plot_height / (series_max * 1.3) if series_max > 0 else 0
+        for label_idx, value in enumerate(values):
+            bar_height = value * scale
+            x = (chart_margin["left"] + group_width * (label_idx + 0.5) +
+                 bar_width * (series_idx - len(series) / 2))
+            y = chart_margin["top"] + plot_height - bar_height
+            parts.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{bar_width:.1f}" height="{bar_height:.1f}" '
+                         f'fill="{color}" opacity="0.8"/>')
+            parts.append(svg_text(x + bar_width / 2, y - 4, round(value), color=color, size=11))
+
+        # legend along the bottom
+        legend_x = chart_margin["left"] + 120 * series_idx
+        parts.append(f'<rect x="{legend_x}" y="{chart_height - 16}" width="10" height="10" fill="{color}"/>')
+        parts.append(svg_text(legend_x + 14, chart_height - 7, series_name, anchor="start", size=11))
+
+    axis_y = chart_margin["top"] + plot_height
+    parts.append(f'<line x1="{chart_margin["left"]}" y1="{axis_y}" x2="{chart_width - chart_margin["right"]}" '
+                 f'y2="{axis_y}" stroke="white"/>')
+    for label_idx, label in enumerate(labels):
+        label_x = chart_margin["left"] + group_width * (label_idx + 0.5)
+        parts.append(svg_text(label_x, axis_y + 14, label, anchor="end", size=11, rotate=-30))
+
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{chart_width}" height="{chart_height}" '
+            f'viewBox="0 0 {chart_width} {chart_height}">{"".join(parts)}</svg>')
+
+
+def overlay_player_damage(player_idx: str, round_num: int, data: dict, player_character: dict) -> str:
+    # same stats as plot_player_damage, the damage dicts are keyed by the other player
+    player_idx = "2" if player_idx == "1" else "1"
+    moves = list(data.keys())
+    return svg_bar_chart(
+        f'P{player_idx} ({player_character[player_idx]}) Round {round_num + 1} Damage', moves,
+        [("Count", count_color, [data[move]["count"] for move in moves]),
+         ("Total Damage", damage_color, [data[move]["total"] for move in moves])], shared_scale=False)
+
+
+def overlay_drive_data(data: dict, round_num: int, player_character: dict) -> str:
+    # same stats as plot_drive_data
+    abilities = {}
+    for player, player_data in data.items():
+        for ability, ability_data in player_data.items():
+            abilities.setdefault(ability, {})[player] = ability_data["total"]
+    labels = list(abilities.keys())
+    return svg_bar_chart(
+        "Drive Gauge Usage/Lost", labels,
+        [(f'P{player} ({player_character[player]})', player_colors[player],
+          [abilities[ability].get(player, 0) for ability in labels]) for player in ["1", "2"]])
+
+
+def overlay_table_metrics(data: dict) -> str:
+    # same table as plot_table_metrics, every round then the totals
+    round_keys = sorted(data.keys(), key=int)
+    headers = [""]
+    for round_key in round_keys:
+        headers.extend([f"Round {int(round_key) + 1} Player 1", f"Round {int(round_key) + 1} Player 2"])
+    headers.extend(["Total Player 1", "Total Player 2"])
+
+    rows = []
+    for metric in data[round_keys[0]].keys():
+        row = [metric]
+        for round_key in round_keys:
+            row.extend([data[round_key][metric][player] for player in ["1", "2"]])
+        row.extend([sum(data[round_key][metric][player] for round_key in round_keys) for player in ["1", "2"]])
+        rows.append("".join(f"<td>{html.escape(str(cell))}</td>" for cell in row))
+
+    header_row = "".join(f"<th>{html.escape(header)}</th>" for header in headers)
+    body_rows = "".join(f"<tr>{row}</tr>" for row in rows)
+    return (f'<table class="metrics"><caption>Match Stats</caption><thead><tr>{header_row}</tr></thead>'
+            f'<tbody>{body_rows}</tbody></table>')
+
+
+# plot name to overlay function, takes the same args as the plot_functions of replay_stats
+overlay_functions = {
+    "player_damage": overlay_player_damage,
+    "drive_data": overlay_drive_data,
+    "table_metrics": overlay_table_metrics,
+}
+
+
+def panel_name(plot_job) -> str:
+    # the name of the png the job would be rendered to, like round1_drive or match_stats
+    import replay_stats
+    return os.path.splitext(os.path.basename(replay_stats.plot_job_image(plot_job)))[0]
+
+
+def render_panels(plot_jobs: list) -> dict:
+    # panel name: svg or html of each plot job
+    return {panel_name(plot_job): overlay_functions[plot_job[0]](*plot_job[1]) for plot_job in plot_jobs}
+
+
+# page for the browser source, panels are replaced on every stats event, ?panels=match_stats,round1_drive shows only
+# those panels so each can be its own source
+overlay_page = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>SF6 Match Stats</title>
+<style>
+body { margin: 0; background: transparent; color: white; font-family: sans-serif; }
+.panel { margin: 8px; }
+table.metrics { border-collapse: collapse; background: #A0A0A0; color: black; font-size: 14px; }
+table.metrics caption { color: white; font-size: 16px; padding: 4px; }
+table.metrics th { background: #505050; color: white; }
+table.metrics th, table.metrics td { border: 1px solid #303030; padding: 2px 8px; text-align: center; }
+</style>
+</head>
+<body>
+<div id="panels"></div>
+<script>
+const shown = new URLSearchParams(location.search).get("panels");
+const shownPanels = shown ? shown.split(",") : null;
+const container = document.getElementById("panels");
+function show(state) {
+  const names = shownPanels || Object.keys(state.panels);
+  container.innerHTML = names.filter(name => name in state.panels)
+    .map(name => `<div class="panel" id="${name}">${state.panels[name]}</div>`).join("");
+}
+new EventSource("events").addEventListener("stats", event => show(JSON.parse(event.data)));
+</script>
+</body>
+</html>
+"""
+
+
+class OverlayRequestHandler(BaseHTTPRequestHandler):
+    # GET / the page, /state the current panels as json, /events the panels as server sent events on every update,
+    # /panel/<name> one panel
+    def do_GET(self):
+        overlay = self.server.overlay
+        path = urlsplit(self.path).path
+        if path == "/":
+            self.send_body(overlay_page.encode(), "text/html; charset=utf-8")
+        elif path == "/state":
+            self.send_body(overlay.state()[1], "application/json")
+        elif path == "/events":
+            self.send_events(overlay)
+        elif path.startswith("/panel/"):
+            panel = overlay.panel(path[len("/panel/"):])
+            if panel is None:
+                self.send_error(404)
+            else:
+                content_type = "image/svg+xml" if panel.startswith("<svg") else "text/html; charset=utf-8"
+                self.send_body(panel.encode(), content_type)
+        else:
+            self.send_error(404)
+
+    def send_body(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, overlay):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+
+        # the current panels first, then each update
+        seen_version = None
+        try:
+            while not overlay.closed:
+                version, payload = overlay.wait_for_update(seen_version, overlay.keepalive)
+                if version == seen_version:
+                    self.wfile.write(b": keepalive\n\n")
+                else:
+                    self.wfile.write(f"id: {version}\nevent: stats\ndata: ".encode() + payload + b"\n\n")
+                    seen_version = version
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # the browser source was closed
+            pass
+
+    def log_message(self, format, *args):
+        # every request and event stream would be logged otherwise
+        pass
+
+
+class OverlayServer:
+    # serves the stats of the latest match as svg and html panels on a local port and pushes new matches to open
+    # pages, nothing is written to disk
+    def __init__(self, port: int = default_port, host: str = "127.0.0.1", keepalive: float = keepalive_seconds):
+        self.keepalive = keepalive
+
+        # panel name: svg or html, version counts the published matches, payload is the json sent to clients
+        self.panels = {}
+        self.version = 0
+        self.payload = json.dumps({"version": 0, "player_character": {}, "panels": {}}).encode()
+        self.condition = threading.Condition()
+        self.closed = False
+
+        # port 0 picks a free port
+        self.httpd = ThreadingHTTPServer((host, port), OverlayRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.overlay = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="overlay-server", daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def publish(self, plot_jobs: list, player_character: dict):
+        # replace the panels with the plot jobs of a match, open pages get them right away
+        panels = render_panels(plot_jobs)
+        with self.condition:
+            self.version += 1
+            self.panels = panels
+            self.payload = json.dumps({"version": self.version, "player_character": player_character,
+                                       "panels": panels}).encode()
+            self.condition.notify_all()
+
+    def state(self):
+        # (version, json payload) of the latest match
+        with self.condition:
+            return self.version, self.payload
+
+    def panel(self, name: str):
+        with self.condition:
+            return self.panels.get(name)
+
+    def wait_for_update(self, seen_version, timeout: float):
+        # (version, payload) once there's a version newer than seen_version, the same version after timeout
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != seen_version or self.closed, timeout)
+            if self.version == seen_version:
+                return seen_version, None
+            return self.version, self.payload
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
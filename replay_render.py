@@ -0,0 +1,72 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import replay_stats
+from replay_output import ImageSink, default_sink
+
+
+def init_render_worker():
+    # import matplotlib in the worker only, create the figures the jobs are drawn on and draw them once to load the
+    # fonts
+    import replay_figures
+    renderer = replay_figures.figure_renderer()
+    for plot_name in replay_figures.figure_types.keys():
+        renderer.figure(plot_name).fig.canvas.draw()
+
+
+def warm_render_worker():
+    # no-op job used to start the worker processes ahead of the first match
+    pass
+
+
+def default_render_workers() -> int:
+    return max(1, min(4, (os.cpu_count() or 1) - 1))
+
+
+class RenderPool:
+    # warm process pool that renders plot jobs from replay_stats.create_plot_jobs
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or default_render_workers()
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_render_worker)
+
+        # start every worker now so matplotlib is already imported when a match ends
+        for _ in range(self.max_workers):
+            self.executor.submit(warm_render_worker)
+
+    def render(self, plot_jobs: list, on_complete=None, sink: ImageSink = None, output_dir: str = None) -> list:
+        # submit every job, the workers return the png bytes and they're written through sink in this process,
+        # on_complete is called with a list of errors once every image is written
+        sink = sink or default_sink
+        futures = [self.executor.submit(replay_stats.render_plot_png, plot_job) for plot_job in plot_jobs]
+
+        if len(futures) == 0:
+            if on_complete is not None:
+                on_complete([])
+            return futures
+
+        remaining = [len(futures)]
+        errors = []
+        lock = threading.Lock()
+
+        def job_done(future, image_path):
+            try:
+                sink.write(image_path, future.result())
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            if on_complete is not None:
+                on_complete(errors)
+
+        for future, plot_job in zip(futures, plot_jobs):
+            future.add_done_callback(lambda future, image_path=replay_stats.plot_job_image(plot_job, output_dir):
+                                     job_done(future, image_path))
+
+        return futures
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,346 @@
+import csv
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import replay_stats
+from replay_batch import is_archived_replay
+from replay_store import other_player, stats_key
+
+# version of report.json
+report_version = 1
+
+# upper edges of the damage histogram bins of each opener, the last bin also counts anything above it
+damage_bin_size = 500
+damage_bins = 20
+
+# openers and drive actions shown in the plots of each matchup
+plot_top = 15
+
+
+def damage_bin(damage: float) -> int:
+    return min(int(damage // damage_bin_size), damage_bins - 1)
+
+
+def histogram_percentile(histogram: list, percentile: float) -> float:
+    # upper edge of the bin the percentile falls in
+    total = sum(histogram)
+    if total == 0:
+        return 0.0
+    seen = 0
+    for bin_idx, bin_count in enumerate(histogram):
+        seen += bin_count
+        if seen >= total * percentile:
+            return float((bin_idx + 1) * damage_bin_size)
+    return float(damage_bins * damage_bin_size)
+
+
+class MatchupAggregate:
+    # sums of one character against one opponent, a mirror match counts once for each side
+    def __init__(self):
+        self.matches = 0
+        self.rounds = 0
+
+        # opener: [sequences, total damage, damage histogram], the opener is the first named action of each damaging
+        # sequence's route
+        self.damage = {}
+
+        # (category, action name): [count, total drive lost], DEF/DAMAGE with the enemy action or SPECIAL with the
+        # player's action as in the drive stats
+        self.drive = {}
+
+        # metric: total, like perfect parries
+        self.metrics = {}
+
+    def add_damage(self, opener, damage: float):
+        opener_damage = self.damage.setdefault(opener, [0, 0.0, [0] * damage_bins])
+        opener_damage[0] += 1
+        opener_damage[1] += damage
+        opener_damage[2][damage_bin(damage)] += 1
+
+    def add_drive(self, category: str, action_name, count: int, total: float):
+        action_drive = self.drive.setdefault((category, action_name), [0, 0.0])
+        action_drive[0] += count
+        action_drive[1] += total
+
+    def merge(self, other: "MatchupAggregate"):
+        self.matches += other.matches
+        self.rounds += other.rounds
+        for opener, (sequences, total, histogram) in other.damage.items():
+            opener_damage = self.damage.setdefault(opener, [0, 0.0, [0] * damage_bins])
+            opener_damage[0] += sequences
+            opener_damage[1] += total
+            opener_damage[2] = [count + other_count for count, other_count in zip(opener_damage[2], histogram)]
+        for key, (count, total) in other.drive.items():
+            self.add_drive(key[0], key[1], count, total)
+        for metric, value in other.metrics.items():
+            self.metrics[metric] = self.metrics.get(metric, 0) + value
+
+    def to_dict(self) -> dict:
+        # lists of entries since the action names can be None
+        return {
+            "matches": self.matches,
+            "rounds": self.rounds,
+            "damage": [[opener] + values for opener, values in self.damage.items()],
+            "drive": [[category, action_name] + values for (category, action_name), values in self.drive.items()],
+            "metrics": self.metrics,
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "MatchupAggregate":
+        matchup = cls()
+        matchup.matches = values["matches"]
+        matchup.rounds = values["rounds"]
+        matchup.damage = {opener: [sequences, total, histogram]
+                          for opener, sequences, total, histogram in values["damage"]}
+        matchup.drive = {(category, action_name): [count, total]
+                         for category, action_name, count, total in values["drive"]}
+        matchup.metrics = dict(values["metrics"])
+        return matchup
+
+
+class ReportAggregate:
+    # partial aggregates of any number of matches, merge is associative and commutative so chunks of the archive can
+    # be reduced in any order and in any process, the size depends on the characters and actions seen, not the
+    # number of matches
+    def __init__(self):
+        self.matches = 0
+        self.failed = 0
+
+        # (character, opponent): MatchupAggregate
+        self.matchups = {}
+
+    def matchup(self, character: str, opponent: str) -> MatchupAggregate:
+        return self.matchups.setdefault((character, opponent), MatchupAggregate())
+
+    def add_match(self, match_stats: dict, player_character: dict):
+        # match_stats from replay_stats.create_match_stats
+        self.matches += 1
+        for player in ["1", "2"]:
+            matchup = self.matchup(player_character[player], player_character[other_player(player)])
+            matchup.matches += 1
+            matchup.rounds += len(match_stats)
+
+        for round_stats in match_stats.values():
+            # routes are keyed by the damaged player, the damage was dealt by the other player
+            for damaged_player, routes in round_stats["routes"].items():
+                player = other_player(damaged_player)
+                matchup = self.matchup(player_character[player], player_character[damaged_player])
+                for route in routes:
+                    matchup.add_damage(route["route"][0] if len(route["route"]) > 0 else None, route["damage"])
+
+            for player, drive_stats in round_stats["drive"].items():
+                matchup = self.matchup(player_character[player], player_character[other_player(player)])
+                for stat_name, stat in drive_stats.items():
+                    if stat_name in ['DEF', 'DAMAGE']:
+                        for enemy_action_name, enemy_stats in stat.items():
+                            if enemy_action_name != 'total':
+                                matchup.add_drive(stat_name, stats_key(enemy_action_name), enemy_stats["count"],
+                                                  enemy_stats["total"])
+                    else:
+                        matchup.add_drive('SPECIAL', stats_key(stat_name), stat["count"], stat["total"])
+
+            for metric, player_values in round_stats["metrics"].items():
+                for player, value in player_values.items():
+                    matchup = self.matchup(player_character[player], player_character[other_player(player)])
+                    matchup.metrics[metric] = matchup.metrics.get(metric, 0) + int(value)
+
+    def merge(self, other: "ReportAggregate") -> "ReportAggregate":
+        self.matches += other.matches
+        self.failed += other.failed
+        for key, other_matchup in other.matchups.items():
+            self.matchup(*key).merge(other_matchup)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "version": report_version,
+            "matches": self.matches,
+            "failed": self.failed,
+            "matchups": [[character, opponent, matchup.to_dict()]
+                         for (character, opponent), matchup in self.matchups.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "ReportAggregate":
+        if values.get("version") != report_version:
+            raise ValueError(f"report version {values.get('version')} isn't {report_version}")
+        aggregate = cls()
+        aggregate.matches = values["matches"]
+        aggregate.failed = values["failed"]
+        aggregate.matchups = {(character, opponent): MatchupAggregate.from_dict(matchup)
+                              for character, opponent, matchup in values["matchups"]}
+        return aggregate
+
+    @classmethod
+    def load(cls, report_path: str) -> "ReportAggregate":
+        with open(report_path, 'r') as report_file:
+            return cls.from_dict(json.load(report_file))
+
+
+def iter_archived_replays(replay_dir: str):
+    # archived replay paths without listing the whole directory first, in no particular order
+    with os.scandir(replay_dir) as entries:
+        for entry in entries:
+            if is_archived_replay(replay_dir, entry.name):
+                yield entry.path
+
+
+def chunked(items, chunk_size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def aggregate_replays(replay_paths: list) -> tuple:
+    # (ReportAggregate, {replay path: traceback}) of a chunk of replays, one match is loaded at a time and only its
+    # aggregate is kept
+    aggregate = ReportAggregate()
+    failed = {}
+    for replay_path in replay_paths:
+        try:
+            rounds_df, player_character = replay_stats.load_replay_file(replay_path, timeout=0)
+            aggregate.add_match(replay_stats.create_match_stats(rounds_df), player_character)
+        except Exception:
+            aggregate.failed += 1
+            failed[replay_path] = traceback.format_exc()
+        rounds_df = None
+    return aggregate, failed
+
+
+def build_report(replay_dir: str, max_workers: int = None, chunk_size: int = 16) -> tuple:
+    # (ReportAggregate, {replay path: traceback}) of every archived replay, at most two chunks per worker are
+    # submitted at a time so memory doesn't grow with the archive
+    aggregate = ReportAggregate()
+    failed = {}
+    start_time = time.perf_counter()
+
+    def merge_done(futures):
+        for future in futures:
+            chunk_aggregate, chunk_failed = future.result()
+            aggregate.merge(chunk_aggregate)
+            failed.update(chunk_failed)
+            print(f"{aggregate.matches + aggregate.failed} matches, {time.perf_counter() - start_time:.1f}s")
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = 2 * max_workers
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=replay_stats.configure,
+                             initargs=(replay_stats.data_dir, replay_stats.stats_img_dir)) as executor:
+        in_flight = set()
+        for chunk in chunked(iter_archived_replays(replay_dir), chunk_size):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                merge_done(done)
+            in_flight.add(executor.submit(aggregate_replays, chunk))
+        merge_done(wait(in_flight).done)
+    return aggregate, failed
+
+
+def file_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def report_matchups(aggregate: ReportAggregate, character: str = None, opponent: str = None) -> list:
+    # ((character, opponent), MatchupAggregate) in the report, most played first
+    return sorted([(key, matchup) for key, matchup in aggregate.matchups.items()
+                   if (character is None or key[0] == character) and (opponent is None or key[1] == opponent)],
+                  key=lambda item: (-item[1].matches, item[0]))
+
+
+def write_tables(matchups: list, output_dir: str):
+    with open(os.path.join(output_dir, "damage.csv"), 'w', newline='') as damage_file:
+        writer = csv.writer(damage_file)
+        writer.writerow(["character", "opponent", "opener", "sequences", "total", "average", "median", "p90",
+                         "per match"])
+        for (character, opponent), matchup in matchups:
+            for opener, (sequences, total, histogram) in sorted(matchup.damage.items(), key=lambda item: -item[1][1]):
+                writer.writerow([character, opponent, opener, sequences, round(total, 1), round(total / sequences, 1),
+                                 histogram_percentile(histogram, 0.5), histogram_percentile(histogram, 0.9),
+                                 round(sequences / matchup.matches, 2)])
+
+    with open(os.path.join(output_dir, "drive.csv"), 'w', newline='') as drive_file:
+        writer = csv.writer(drive_file)
+        writer.writerow(["character", "opponent", "category", "action", "count", "total", "per match"])
+        for (character, opponent), matchup in matchups:
+            for (category, action_name), (count, total) in sorted(matchup.drive.items(), key=lambda item: -item[1][1]):
+                writer.writerow([character, opponent, category, action_name, count, round(total, 1),
+                                 round(total / matchup.matches, 1)])
+
+    with open(os.path.join(output_dir, "metrics.csv"), 'w', newline='') as metrics_file:
+        writer = csv.writer(metrics_file)
+        writer.writerow(["character", "opponent", "matches", "rounds", "metric", "total", "per match", "per round"])
+        for (character, opponent), matchup in matchups:
+            for metric, total in matchup.metrics.items():
+                writer.writerow([character, opponent, matchup.matches, matchup.rounds, metric, total,
+                                 round(total / matchup.matches, 3), round(total / max(matchup.rounds, 1), 3)])
+
+
+def plot_matchup(character: str, opponent: str, matchup: MatchupAggregate, image_path: str):
+    # most damaging openers and the enemy actions costing the most drive
+    plt = replay_stats.pyplot()
+    fig, (damage_ax, drive_ax) = plt.subplots(2, 1, figsize=(15, 10))
+
+    openers = sorted(matchup.damage.items(), key=lambda item: -item[1][1])[:plot_top]
+    opener_names = [str(opener) for opener, _ in openers]
+    damage_ax.bar(opener_names, [total / matchup.matches for _, (_, total, _) in openers], alpha=0.8,
+                  color='orange')
+    for bar_idx, (_, (sequences, total, _)) in enumerate(openers):
+        damage_ax.text(bar_idx, total / matchup.matches, f"{total / sequences:.0f} avg", ha='center', va='bottom',
+                       color='white')
+    damage_ax.set_ylabel('Damage per Match')
+    damage_ax.set_title(f'{character} vs {opponent} Damage per Opener ({matchup.matches} matches)')
+
+    drive_actions = sorted(matchup.drive.items(), key=lambda item: -item[1][1])[:plot_top]
+    drive_ax.bar([f"{category} {action_name}" for (category, action_name), _ in drive_actions],
+                 [total / matchup.matches for _, (_, total) in drive_actions], alpha=0.8)
+    drive_ax.set_ylabel('Drive per Match')
+    drive_ax.set_title(f'{character} vs {opponent} Drive Usage/Lost')
+
+    for ax in [damage_ax, drive_ax]:
+        plt.setp(ax.get_xticklabels(), rotation=30, ha='right')
+
+    fig.tight_layout()
+    fig.savefig(image_path)
+    plt.close(fig)
+
+
+def write_report(aggregate: ReportAggregate, output_dir: str, character: str = None, opponent: str = None,
+                 plot_matchups: int = 10):
+    # report.json has every matchup so reports can be merged later, the tables and plots only the filtered ones
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "report.json"), 'w') as report_file:
+        json.dump(aggregate.to_dict(), report_file)
+
+    matchups = report_matchups(aggregate, character, opponent)
+    write_tables(matchups, output_dir)
+    for (matchup_character, matchup_opponent), matchup in matchups[:plot_matchups]:
+        plot_matchup(matchup_character, matchup_opponent, matchup,
+                     os.path.join(output_dir, file_name(f"{matchup_character}_vs_{matchup_opponent}.png")))
+
+
+def run_report(replay_dir: str, output_dir: str, max_workers: int = None, chunk_size: int = 16,
+               character: str = None, opponent: str = None, merge_reports: list = None) -> ReportAggregate:
+    # merge_reports are report.json files of other runs, like other archives or machines
+    if replay_dir is not None:
+        aggregate, failed = build_report(replay_dir, max_workers, chunk_size)
+    else:
+        aggregate, failed = ReportAggregate(), {}
+    for report_path in merge_reports or []:
+        aggregate.merge(ReportAggregate.load(report_path))
+
+    write_report(aggregate, output_dir, character, opponent)
+    print(f"report of {aggregate.matches} matches in {output_dir}, {aggregate.failed} failed")
+
+    if len(failed) > 0:
+        with open(os.path.join(output_dir, "errors.log"), 'w') as errors_file:
+            for replay_path, error in failed.items():
+                errors_file.write(f"{replay_path}\n{error}\n")
+    return aggregate
@@ -0,0 +1,312 @@
+import asyncio
+import heapq
+import itertools
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from replay_config import Config, recent_replay_path
+from replay_watcher import ReplayWatcher
+
+# keys of each station in the config's stations list, only name and sf6_path are required
+station_keys = ["name", "sf6_path", "output_dir", "priority", "overlay_port"]
+
+
+class Station:
+    # one SF6 install watched by the supervisor, its images go to its own output dir
+    def __init__(self, name: str, sf6_path: str, output_dir: str, priority: int = 0, overlay_port: int = None):
+        self.name = name
+        self.sf6_path = sf6_path
+        self.output_dir = output_dir
+
+        # when images of several stations are waiting for the render pool the lowest priority goes first
+        self.priority = priority
+        self.overlay_port = overlay_port
+
+        self.watcher = ReplayWatcher(self.replay_path)
+        self.overlay = None
+
+        # created on the station's thread by the first update, sqlite connections stay on the thread that opened them
+        self.plot_cache = None
+        self.stats_store = None
+
+        # stats are computed on the station's own thread so a match ending on another station never waits for it
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"station-{name}")
+
+    @classmethod
+    def from_config(cls, station_config: dict, config: Config) -> "Station":
+        unknown_keys = set(station_config.keys()) - set(station_keys)
+        if len(unknown_keys) > 0:
+            raise ValueError(f"unknown station keys {sorted(unknown_keys)}, expected some of {station_keys}")
+        if "name" not in station_config or "sf6_path" not in station_config:
+            raise ValueError(f"station {station_config} needs a name and an sf6_path")
+        return cls(station_config["name"], station_config["sf6_path"],
+                   station_config.get("output_dir") or os.path.join(config.output_dir, station_config["name"]),
+                   station_config.get("priority", 0), station_config.get("overlay_port"))
+
+    @property
+    def replay_path(self) -> str:
+        return recent_replay_path(self.sf6_path)
+
+    def update(self, renderer, replay_cache, store_path: str = None):
+        # plot the station's recent replay, runs on the station's thread, returns once the images are queued
+        import replay_stats
+        from replay_output import ImageSink
+
+        if self.plot_cache is None:
+            self.plot_cache = replay_stats.PlotCache(ImageSink(), self.output_dir)
+        if self.stats_store is None and store_path is not None:
+            from replay_store import StatsStore
+            self.stats_store = StatsStore(store_path)
+
+        update_start = time.perf_counter()
+
+        def on_complete(errors):
+            for error in errors:
+                print(f"[{self.name}] failed to render plot: {error!r}")
+            print(f"[{self.name}] updated plots in {time.perf_counter() - update_start:.2f}s.")
+
+        replay_stats.update_plots(replay_stats.load_recent_replay(self.sf6_path, replay_cache), renderer, on_complete,
+                                  self.plot_cache, self.stats_store, replay_stats.replay_played_at(self.replay_path),
+                                  overlay=self.overlay, render_images=renderer is not None)
+
+    def close(self):
+        self.watcher.cancel()
+        if self.stats_store is not None:
+            # on the thread that opened it
+            self.executor.submit(self.stats_store.close)
+        self.executor.shutdown(wait=True)
+        self.watcher.close()
+        if self.overlay is not None:
+            self.overlay.close()
+
+
+class RenderBatch:
+    # the images of one update_plots call, on_complete gets the errors once every image is written or replaced by
+    # the same image of a newer match, only used on the event loop
+    def __init__(self, count: int, on_complete):
+        self.remaining = count
+        self.errors = []
+        self.on_complete = on_complete
+        if count == 0:
+            on_complete(self.errors)
+
+    def job_done(self, error: Exception = None):
+        if error is not None:
+            self.errors.append(error)
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.on_complete(self.errors)
+
+
+class RenderJob:
+    def __init__(self, sequence: int, plot_job, sink, batch: RenderBatch):
+        self.sequence = sequence
+        self.plot_job = plot_job
+        self.sink = sink
+        self.batch = batch
+
+
+class RenderScheduler:
+    # renders the images of every station on one process pool, one job per worker is in the pool at a time and the
+    # next job is the oldest image of the highest priority station, a new job for an image replaces the one waiting so
+    # each station has at most one match's images waiting however many matches end
+    def __init__(self, render_pool, io_executor: ThreadPoolExecutor):
+        self.render_pool = render_pool
+        self.io_executor = io_executor
+
+        # heap of (priority, sequence, (station name, image path)), entries whose job was replaced are skipped
+        self.heap = []
+        # (station name, image path): RenderJob waiting for a worker
+        self.pending = {}
+        # (station name, image path): sequence of the last job written, an older job finishing later isn't written
+        self.written = {}
+        self.sequence = itertools.count()
+        self.job_ready = asyncio.Event()
+        self.closed = False
+
+    def submit(self, station: Station, plot_jobs: list, on_complete, sink, output_dir: str):
+        import replay_stats
+
+        batch = RenderBatch(len(plot_jobs), on_complete)
+        for plot_job in plot_jobs:
+            key = (station.name, replay_stats.plot_job_image(plot_job, output_dir))
+            replaced = self.pending.pop(key, None)
+            if replaced is not None:
+                # the newer match's image is written instead
+                replaced.batch.job_done()
+            sequence = next(self.sequence)
+            self.pending[key] = RenderJob(sequence, plot_job, sink, batch)
+            heapq.heappush(self.heap, (station.priority, sequence, key))
+
+        # drop replaced entries once they outnumber the jobs waiting
+        if len(self.heap) > 2 * len(self.pending) + 64:
+            self.heap = [entry for entry in self.heap
+                         if entry[2] in self.pending and self.pending[entry[2]].sequence == entry[1]]
+            heapq.heapify(self.heap)
+        self.job_ready.set()
+
+    def pop(self):
+        # (key, RenderJob) to render next, None if nothing is waiting
+        while len(self.heap) > 0:
+            _, sequence, key = heapq.heappop(self.heap)
+            job = self.pending.get(key)
+            if job is not None and job.sequence == sequence:
+                del self.pending[key]
+                return key, job
+        return None
+
+    async def dispatch(self):
+        # one per render worker
+        import replay_stats
+
+        loop = asyncio.get_running_loop()
+        while not self.closed:
+            next_job = self.pop()
+            if next_job is None:
+                self.job_ready.clear()
+                await self.job_ready.wait()
+                continue
+
+            key, job = next_job
+            error = None
+            try:
+                image_bytes = await asyncio.wrap_future(
+                    self.render_pool.executor.submit(replay_stats.render_plot_png, job.plot_job))
+                if job.sequence > self.written.get(key, -1):
+                    self.written[key] = job.sequence
+                    await loop.run_in_executor(self.io_executor, job.sink.write, key[1], image_bytes)
+            except Exception as e:
+                error = e
+
+            # a failing completion callback would end the dispatcher and stall every station's renders
+            try:
+                job.batch.job_done(error)
+            except Exception as e:
+                print(f"[{key[0]}] failed to complete renders: {e!r}")
+
+    def close(self):
+        self.closed = True
+        self.job_ready.set()
+
+
+class StationRenderer:
+    # the render_pool update_plots is given for a station, queues the images on the shared scheduler
+    def __init__(self, scheduler: RenderScheduler, station: Station, loop: asyncio.AbstractEventLoop):
+        self.scheduler = scheduler
+        self.station = station
+        self.loop = loop
+
+    def render(self, plot_jobs: list, on_complete=None, sink=None, output_dir: str = None):
+        # called on the station's thread, on_complete is run back on it
+        def completed(errors):
+            if on_complete is not None:
+                try:
+                    self.station.executor.submit(on_complete, errors)
+                except RuntimeError as e:
+                    # the station's executor was shut down while its images were rendering
+                    print(f"[{self.station.name}] renders completed after the station stopped: {e!r}")
+
+        self.loop.call_soon_threadsafe(self.scheduler.submit, self.station, list(plot_jobs), completed, sink,
+                                       output_dir)
+
+
+class StationSupervisor:
+    # watches every station at once, each computes its stats on its own thread and the images of all of them are
+    # rendered by one bounded render pool
+    def __init__(self, config: Config, stations: list):
+        names = [station.name for station in stations]
+        if len(set(names)) != len(names):
+            raise ValueError(f"station names must be unique, got {names}")
+        self.config = config
+        self.stations = stations
+        self.stopped = threading.Event()
+
+    @classmethod
+    def from_config(cls, config: Config) -> "StationSupervisor":
+        if len(config.stations) == 0:
+            raise ValueError("no stations in the config")
+        return cls(config, [Station.from_config(station_config, config) for station_config in config.stations])
+
+    def stop(self):
+        # safe from a signal handler or another thread
+        self.stopped.set()
+        for station in self.stations:
+            station.watcher.cancel()
+
+    async def watch(self, station: Station, watch_executor: ThreadPoolExecutor, renderer, replay_cache):
+        # a change during an update is picked up by the next wait, so matches ending quickly are coalesced
+        loop = asyncio.get_running_loop()
+        changed = os.path.exists(station.replay_path)
+        while not self.stopped.is_set():
+            if changed:
+                try:
+                    await loop.run_in_executor(station.executor, station.update, renderer, replay_cache,
+                                               self.config.store_path)
+                except Exception as e:
+                    print(f"[{station.name}] failed to update plots: {e!r}")
+            changed = await loop.run_in_executor(watch_executor, station.watcher.wait_for_change)
+            if not changed:
+                return
+
+    async def run(self):
+        import replay_stats
+        from replay_render import RenderPool
+
+        loop = asyncio.get_running_loop()
+        replay_stats.configure(self.config.data_dir)
+
+        # stop cleanly when the service is stopped, windows event loops don't support signal handlers
+        try:
+            loop.add_signal_handler(signal.SIGTERM, self.stop)
+        except NotImplementedError:
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+
+        for station in self.stations:
+            if station.overlay_port is not None:
+                from replay_overlay import OverlayServer
+                station.overlay = OverlayServer(station.overlay_port)
+            overlay = f", overlay at {station.overlay.url}" if station.overlay is not None else ""
+            print(f"[{station.name}] watching {station.replay_path} into {station.output_dir}{overlay}")
+
+        replay_cache = None
+        if self.config.cache_dir is not None:
+            from replay_cache import ReplayCache
+            replay_cache = ReplayCache(self.config.cache_dir)
+
+        # one thread per station blocks on its watcher, the image writes get their own threads so they never wait
+        # behind the watchers
+        watch_executor = ThreadPoolExecutor(max_workers=len(self.stations), thread_name_prefix="station-watch")
+        io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="station-io")
+        render_pool = RenderPool(self.config.workers) if self.config.render_images else None
+        scheduler = RenderScheduler(render_pool, io_executor)
+        dispatchers = [asyncio.create_task(scheduler.dispatch())
+                       for _ in range(render_pool.max_workers if render_pool is not None else 0)]
+        try:
+            await asyncio.gather(*[
+                self.watch(station, watch_executor,
+                           StationRenderer(scheduler, station, loop) if render_pool is not None else None,
+                           replay_cache)
+                for station in self.stations])
+        finally:
+            scheduler.close()
+            for dispatcher in dispatchers:
+                dispatcher.cancel()
+            await asyncio.gather(*dispatchers, return_exceptions=True)
+            for station in self.stations:
+                station.close()
+            watch_executor.shutdown(wait=True)
+            io_executor.shutdown(wait=True)
+            if render_pool is not None:
+                render_pool.shutdown()
+
+
+def run_stations(config: Config) -> int:
+    supervisor = StationSupervisor.from_config(config)
+    try:
+        asyncio.run(supervisor.run())
+    except KeyboardInterrupt:
+        supervisor.stop()
+    return 0
@@ -2,261 +2,545 @@ import json
 from typing import Dict, Any
 import pandas as pd
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
 import os
+import sys
 import time
+import datetime
+import hashlib
+import threading
+from functools import lru_cache
 from pandas import DataFrame
 
-# set backend to agg since matplotlib is not running in main thread
-matplotlib.use('Agg')
-
-# dark background plots
-plt.style.use('dark_background')
+import replay_config
+import replay_metrics
+from replay_metrics import df_rows, instrumented
+from replay_output import ImageSink, default_sink
+from replay_watcher import ReplayWatcher
 
 # default replay dir
-replay_dir = 'C:/SteamLibrary/steamapps/common/Street Fighter 6/'
+replay_dir = replay_config.default_sf6_path
 
 # recent replay filename
-replay_name = 'recent_replay.json'
+replay_name = replay_config.replay_name
 
-# load character id to name str mappings
-with open(f"data/character_ids.json", 'r') as f:
-    character_ids = json.load(f)
+# id to name tables, loaded the first time they're used
+data_dir = replay_config.default_data_dir()
 
-# load act_st id to string mappings
-with open(f"data/act_st.json", 'r') as f:
-    act_st_names = json.load(f)
+# plot image output directory, created when the first image is written
+stats_img_dir = replay_config.default_output_dir
 
-# character move name paths
-character_move_names_path = "data/fixed_character_names"
 
-# create stat_img directory if it doesn't exist
-os.makedirs("stats_img", exist_ok=True)
+def configure(new_data_dir: str = None, output_dir: str = None):
+    # point the name tables and images somewhere else, also the initializer of worker processes
+    global data_dir, stats_img_dir
+    if new_data_dir is not None and new_data_dir != data_dir:
+        data_dir = new_data_dir
+        load_data_table.cache_clear()
+        load_act_st_name_table.cache_clear()
+        load_character_move_names.cache_clear()
 
+        # the replay cache keys depend on the name tables, only cleared if the cache was imported
+        replay_cache = sys.modules.get("replay_cache")
+        if replay_cache is not None:
+            replay_cache.name_tables_version.cache_clear()
+            replay_cache.process_cache.cache_clear()
+    if output_dir is not None:
+        stats_img_dir = output_dir
 
-def watch_file_for_changes(filename, poll_interval=1.0):
-    while not replay_file_exists(filename):
-        time.sleep(poll_interval)
 
-    # initial timestamp
-    initial_timestamp = os.path.getmtime(filename)
+@lru_cache(maxsize=None)
+def pyplot():
+    # matplotlib is only imported by the pyplot plot functions, set backend to agg since matplotlib is not running
+    # in main thread
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    use_plot_style()
+    return plt
 
-    while True:
-        # wait for the poll interval
-        time.sleep(poll_interval)
 
-        # check the current timestamp
-        current_timestamp = os.path.getmtime(filename)
+@lru_cache(maxsize=None)
+def use_plot_style():
+    # dark background plots
+    import matplotlib.style
+    matplotlib.style.use('dark_background')
 
-        # if the timestamp has changed, exit
-        if current_timestamp != initial_timestamp:
-            break
 
+# columns from the replay data to keep and the dtype to store them as
+keep_columns = {
+    'current_HP': np.int32,
+    'blockstun': np.int16,
+    'mActionId': np.int32,
+    'hitstun': np.int16,
+    'act_st': np.int16,
+    'drive': np.float32
+}
 
-def replay_file_exists(filename: str):
-    return os.path.exists(f"{filename}")
 
+class NameTable:
+    # maps integer ids to names with a single array lookup instead of formatting a str key per frame
+    def __init__(self, names: Dict[str, str], key_format: str):
+        # only keep keys that the formatted id would have matched
+        ids = {int(key): name for key, name in names.items() if key_format.format(int(key)) == key}
 
-def load_recent_file(sf6_path: str) -> tuple[dict[Any, DataFrame], dict[str, Any]]:
-    # columns from the replay data to keep
-    keep_columns = {
-        'current_HP': int,
-        'blockstun': int,
-        'mActionId': int,
-        'hitstun': int,
-        'act_st': int,
-        'drive': float
-    }
+        # unique names become the categories
+        self.categories = pd.Index(pd.unique(pd.Series(list(ids.values()), dtype=object)))
 
-    loaded_file = False
-    while not loaded_file:
-        try:
-            # load the replay file
-            with open(f"{sf6_path}/reframework/data/{replay_name}", 'r') as replay_data_file:
-                replay_data = json.load(replay_data_file)
-            loaded_file = True
-        except json.decoder.JSONDecodeError as e:
-            # file probably not finished updating
-            pass
+        # offset so negative ids can index the code array
+        self.offset = -min(ids.keys(), default=0)
+        self.codes = np.full(max(ids.keys(), default=0) + self.offset + 1, -1, dtype=np.int32)
+        self.codes[np.fromiter(ids.keys(), dtype=np.int64) + self.offset] = self.categories.get_indexer(
+            list(ids.values()))
 
-    # dicts to be transformed into dataframes
-    rounds = {}
+    def resolve(self, ids: np.ndarray) -> pd.Categorical:
+        # ids outside the table resolve to nan
+        positions = ids.astype(np.int64) + self.offset
+        valid = (positions >= 0) & (positions < len(self.codes))
+        codes = np.full(len(positions), -1, dtype=np.int32)
+        codes[valid] = self.codes[positions[valid]]
 
-    for round_number, round_data in replay_data.items():
-        # if round number
-        if round_number.isnumeric():
-            # create dict for the round
-            rounds.setdefault(int(round_number), {})
-            # for each frame
-            for frame_idx, frame_data in round_data.items():
-                row_data = {}
-
-                # append the player_tag to the key to create a unique column name
-                for player_tag, player_data in frame_data.items():
-                    row_data.update({f"{player_tag}_{key}": value for key, value in player_data.items() if
-                                     key in keep_columns.keys()})
-                # append the row dict
-                rounds[int(round_number)][int(frame_idx)] = row_data
+        return pd.Categorical.from_codes(codes, categories=self.categories)
 
-    # dict to store round dataframes
-    rounds_df = {}
-    for round_num, data in rounds.items():
-        # create the df
-        df = pd.DataFrame(data).T
-        df.sort_index(inplace=True)
 
-        # cast columns to type
-        for col_name, col_type in keep_columns.items():
-            for col in df.columns:
-                if col_name in col:
-                    df[col] = df[col].astype(col_type)
-            rounds_df[round_num] = df
+@lru_cache(maxsize=None)
+def load_data_table(table_name: str) -> dict:
+    # character_ids: character id to name str, act_st: act_st id to name str
+    with open(f"{data_dir}/{table_name}.json", 'r') as data_table_file:
+        return json.load(data_table_file)
 
-    # create dict to store player character names
-    player_character = {}
 
-    # for each player character
-    for player_tag, player_id in replay_data['player_data'].items():
-        # set player number
-        player_num = 0 if '0' in player_tag else 1
+def character_move_names_path() -> str:
+    # character move name paths
+    return f"{data_dir}/fixed_character_names"
 
-        # load character name
-        character_name = character_ids[str(player_id)]
 
-        # set player character to appropriate character name
-        player_character[str(player_num + 1)] = character_name
+@lru_cache(maxsize=None)
+def load_character_move_names(character_name: str) -> NameTable:
+    with open(f"{character_move_names_path()}/{character_name} Names.json", 'r') as character_move_names_file:
+        return NameTable(json.load(character_move_names_file), "{:04}")
 
-        # load move names
-        with open(f"{character_move_names_path}/{character_name} Names.json", 'r') as character_move_names_file:
-            character_move_names = json.load(character_move_names_file)
 
-            for _, df in rounds_df.items():
-                # create _actionName to store the name of moves based on _mActionId
-                df[f"p{player_num + 1}_actionName"] = df[f"p{player_num + 1}_mActionId"].apply(
-                    lambda x: character_move_names.get(f"{x:04}", np.nan))
+@lru_cache(maxsize=None)
+def load_act_st_name_table() -> NameTable:
+    # act_st id to name lookup table
+    return NameTable(load_data_table("act_st"), "{}")
 
-                # create _actionStateName to store the name of moves based on _act_st
-                df[f"p{player_num + 1}_actionStateName"] = df[f"p{player_num + 1}_act_st"].apply(
-                    lambda x: act_st_names.get(f"{x}", np.nan))
 
-    # columns to generate diff, to track changes in value across frames
-    diff_columns = ['drive', 'current_HP']
+def replay_file_exists(filename: str):
+    return os.path.exists(f"{filename}")
 
-    # for each diff column
-    for diff_column in diff_columns:
-        for round_num, df in rounds_df.items():
-            for player_num in [1, 2]:
-                # calc and create the dif fcolumn
-                df[f'p{player_num}_{diff_column}_diff'] = df[f'p{player_num}_{diff_column}'].diff()
 
-    return rounds_df, player_character
+@instrumented("parse")
+def read_replay_bytes(replay_path: str, timeout: float = 5.0) -> tuple[bytes, dict]:
+    retry_delay = 0.01
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            # load the replay file, keeping the bytes that were parsed
+            with open(replay_path, 'rb') as replay_data_file:
+                replay_bytes = replay_data_file.read()
+            return replay_bytes, json.loads(replay_bytes)
+        except json.decoder.JSONDecodeError:
+            # file probably not finished updating, back off and retry until the timeout
+            if time.monotonic() + retry_delay > deadline:
+                raise
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 0.5)
+
+
+def read_replay_file(replay_path: str, timeout: float = 5.0) -> dict:
+    return read_replay_bytes(replay_path, timeout)[1]
+
+
+@instrumented("round_df", rows=df_rows(0))
+def create_round_df(round_data: dict) -> pd.DataFrame:
+    # sort the frames by frame number
+    frame_keys = sorted(round_data.keys(), key=int)
+    frame_count = len(frame_keys)
+    frames = [round_data[frame_key] for frame_key in frame_keys]
+
+    # frame number index
+    index = np.fromiter(map(int, frame_keys), dtype=np.int64, count=frame_count)
+
+    # build each column straight into a typed array, skipping the per frame row dicts
+    columns = {}
+    player_tags = frames[0].keys() if frame_count > 0 else ["p1", "p2"]
+    for player_tag in player_tags:
+        for col_name, col_type in keep_columns.items():
+            columns[f"{player_tag}_{col_name}"] = np.fromiter(
+                (frame[player_tag][col_name] for frame in frames), dtype=col_type, count=frame_count)
 
+    return pd.DataFrame(columns, index=index)
 
-def create_damage_seq(p_idx, df):
-    # create a boolean mask where act_st is 'damage'
-    mask = df[f'p{p_idx}_actionStateName'] == 'DAMAGE'
 
-    # identify the start of a new 'DAMAGE' sequence
-    sequence_starts = mask != mask.shift()
+@instrumented("load")
+def load_recent_file(sf6_path: str, replay_cache=None) -> tuple[dict[Any, DataFrame], dict[str, Any]]:
+    # replay_cache is a replay_cache.ReplayCache to reuse prepared DataFrames of replays already seen
+    if replay_cache is not None:
+        return replay_cache.load_replay_file(f"{sf6_path}/reframework/data/{replay_name}")
+    return load_replay_file(f"{sf6_path}/reframework/data/{replay_name}")
 
-    # assign a unique ID to each sequence
-    sequence_ids = sequence_starts.cumsum()
 
-    # identify where the value changes
-    changes = sequence_ids.diff().ne(0).to_numpy()
-    starts = np.where(changes)[0]
+def load_replay_file(replay_path: str, timeout: float = 5.0) -> tuple[dict[Any, DataFrame], dict[str, Any]]:
+    # binary replays are memory mapped instead of parsed
+    import replay_binary
+    if replay_binary.is_binary_replay(replay_path):
+        return replay_binary.load_binary_replay_file(replay_path)
 
-    # offset position by -1 for the end
-    ends = np.where(changes)[0][1:] - 1
+    # load the replay file
+    return load_replay_data(read_replay_file(replay_path, timeout))
 
-    # if the series starts with the same values, prepend the first index
-    if not changes[0]:
-        starts = np.insert(starts, 0, 0)
 
-    # end of the last run is the end of the series
-    ends = np.append(ends, len(sequence_ids) - 1)
+def load_replay_data(replay_data: dict) -> tuple[dict[Any, DataFrame], dict[str, Any]]:
+    # dict to store round dataframes
+    rounds_df = {}
 
-    # create list of sequences
-    damage_seqs = list(zip(starts, ends))
+    for round_number, round_data in replay_data.items():
+        # if round number
+        if round_number.isnumeric():
+            rounds_df[int(round_number)] = create_round_df(round_data)
 
-    return damage_seqs
+    return rounds_df, prepare_rounds(rounds_df, replay_data['player_data'])
 
 
-def create_damage_stats(p_idx: str, damage_seqs: list, df: pd.DataFrame) -> Dict[str, Dict]:
-    other_p_idx = "2" if p_idx == "1" else "1"
-    damage_stats = {}
+def player_characters(player_data: dict) -> dict[str, str]:
+    # player number ("1" or "2") to character name
+    player_character = {}
+    for player_tag, player_id in player_data.items():
+        # set player number
+        player_num = 0 if '0' in player_tag else 1
 
-    for damage_seq in damage_seqs:
-        total_damage = df.iloc[damage_seq[0]:damage_seq[1]][f'p{p_idx}_current_HP_diff'].sum()
-        if total_damage < 0:
-            # the entire attack sequence (combo), maybe used later
-            player_attack_sequence = df.iloc[damage_seq[0]:damage_seq[1]][f'p{other_p_idx}_actionName'].unique()
+        # set player character to appropriate character name
+        player_character[str(player_num + 1)] = load_data_table("character_ids")[str(player_id)]
+    return player_character
 
-            # create key for this actionName
-            action_stats = damage_stats.setdefault(df.iloc[damage_seq[0]][f'p{other_p_idx}_actionName'],
-                                                   {"count": 0, "total": 0})
 
-            # increment the count by 1
-            action_stats['count'] = action_stats['count'] + 1
+def prepare_rounds(rounds_df: dict[Any, DataFrame], player_data: dict) -> dict[str, Any]:
+    # add the name and diff columns to the raw round columns, returns the player character names
 
-            # accumulate the damage
-            action_stats['total'] = action_stats['total'] + (total_damage * -1)
+    # create dict to store player character names
+    player_character = player_characters(player_data)
 
-    return damage_stats
+    # for each player character
+    for player_num in sorted(player_character.keys()):
+        for _, df in rounds_df.items():
+            for derived_column in derived_columns(player_num):
+                df[derived_column] = derive_column(derived_column, df, player_character)
+
+    return player_character
+
+
+def derived_columns(player_num: str) -> list:
+    # columns computed from the replay columns, in the order prepare_rounds adds them
+    return [f"p{player_num}_actionName", f"p{player_num}_actionStateName", f"p{player_num}_drive_diff",
+            f"p{player_num}_current_HP_diff"]
+
+
+def derive_column(column_name: str, df, player_character: dict) -> pd.Series:
+    # compute a name or diff column from the replay columns of df
+    player_tag, _, derived_name = column_name.partition("_")
+    if derived_name == "actionName":
+        # the name of moves based on _mActionId
+        with replay_metrics.stage("names", len(df)):
+            character_move_names = load_character_move_names(player_character[player_tag[1:]])
+            return pd.Series(character_move_names.resolve(df[f"{player_tag}_mActionId"].to_numpy()),
+                             index=df.index, name=column_name)
+    elif derived_name == "actionStateName":
+        # the name of action states based on _act_st
+        with replay_metrics.stage("names", len(df)):
+            return pd.Series(load_act_st_name_table().resolve(df[f"{player_tag}_act_st"].to_numpy()),
+                             index=df.index, name=column_name)
+    elif derived_name in ["drive_diff", "current_HP_diff"]:
+        # track changes in value across frames
+        with replay_metrics.stage("diffs", len(df)):
+            return df[f"{player_tag}_{derived_name[:-len('_diff')]}"].diff().rename(column_name)
+    raise KeyError(column_name)
+
+
+def replay_columns() -> list:
+    # the columns read from the replay for each round
+    return [f"{player_tag}_{col_name}" for player_tag in ["p1", "p2"] for col_name in keep_columns.keys()]
+
+
+class ReplayRound:
+    # one round of a replay, the frames are read on first access and each derived column is computed on first access,
+    # supports the df[column] access the stats functions use
+    def __init__(self, round_num: int, load_frames, player_character: dict):
+        self.round_num = round_num
+        self.player_character = player_character
+
+        # returns the DataFrame of replay columns, dropped once called so the parsed json can be freed
+        self.load_frames = load_frames
+        self._frames = None
+
+        # column name: memoized series
+        self.columns = {}
+
+        # memoized create_round_stats
+        self._stats = None
+
+        # the ui reads rounds from the tk thread while the update thread computes them
+        self.lock = threading.RLock()
+
+    @property
+    def frames(self) -> pd.DataFrame:
+        with self.lock:
+            if self._frames is None:
+                self._frames = self.load_frames()
+                self.load_frames = None
+            return self._frames
+
+    @property
+    def index(self) -> pd.Index:
+        return self.frames.index
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, column_name):
+        if isinstance(column_name, list):
+            return pd.DataFrame({name: self[name] for name in column_name})
+        with self.lock:
+            if column_name in self.frames.columns:
+                return self.frames[column_name]
+            if column_name not in self.columns:
+                self.columns[column_name] = derive_column(column_name, self, self.player_character)
+            return self.columns[column_name]
+
+    @property
+    def stats(self) -> dict:
+        with self.lock:
+            if self._stats is None:
+                self._stats = create_round_stats(self)
+            return self._stats
+
+    @property
+    def df(self) -> pd.DataFrame:
+        # every column, same as a round of load_replay_data
+        column_names = list(self.frames.columns)
+        for player_num in sorted(self.player_character.keys()):
+            column_names.extend(column_name for column_name in derived_columns(player_num)
+                                if column_name not in column_names)
+        return self[column_names]
+
+
+class Replay:
+    # a match whose rounds are only read and prepared when they are used, memory grows with the rounds used
+    def __init__(self, round_frames: dict, player_character: dict[str, str]):
+        # round_frames is round number: function returning the DataFrame of replay columns
+        self.player_character = player_character
+        self.rounds = {round_num: ReplayRound(round_num, load_frames, player_character)
+                       for round_num, load_frames in sorted(round_frames.items())}
+
+    @classmethod
+    def from_replay_data(cls, replay_data: dict) -> "Replay":
+        round_frames = {
+            int(round_number): (lambda round_data=round_data: create_round_df(round_data))
+            for round_number, round_data in replay_data.items() if round_number.isnumeric()
+        }
+        return cls(round_frames, player_characters(replay_data['player_data']))
+
+    @classmethod
+    def from_rounds_df(cls, rounds_df: dict[Any, DataFrame], player_character: dict[str, str]) -> "Replay":
+        # rounds that were already loaded, columns they have are used as is
+        return cls({round_num: (lambda df=df: df) for round_num, df in rounds_df.items()}, player_character)
+
+    @classmethod
+    def from_file(cls, replay_path: str, timeout: float = 5.0) -> "Replay":
+        import replay_binary
+        if replay_binary.is_binary_replay(replay_path):
+            # read into memory instead of mapping so the capture can rewrite the file while rounds are unused
+            binary_replay = replay_binary.BinaryReplay(replay_path, mmap=False)
+            round_frames = {round_num: (lambda round_num=round_num: binary_replay.round_df(round_num))
+                            for round_num in binary_replay.round_numbers}
+            return cls(round_frames, player_characters(binary_replay.player_data))
+        return cls.from_replay_data(read_replay_file(replay_path, timeout))
+
+    @property
+    def round_numbers(self) -> list:
+        return list(self.rounds.keys())
+
+    def __getitem__(self, round_num: int) -> ReplayRound:
+        return self.rounds[round_num]
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def items(self):
+        return self.rounds.items()
+
+    def rounds_df(self) -> dict[Any, DataFrame]:
+        # every round with every column, same as load_replay_data
+        return {round_num: replay_round.df for round_num, replay_round in self.rounds.items()}
+
+
+@instrumented("load")
+def load_recent_replay(sf6_path: str, replay_cache=None) -> Replay:
+    # same as load_recent_file as a Replay
+    if replay_cache is not None:
+        return replay_cache.load_replay(f"{sf6_path}/reframework/data/{replay_name}")
+    return Replay.from_file(f"{sf6_path}/reframework/data/{replay_name}")
+
+
+@instrumented("damage", rows=df_rows(1))
+def create_damage_seq(p_idx, df) -> tuple[np.ndarray, np.ndarray]:
+    # create a boolean mask where act_st is 'damage'
+    mask = (df[f'p{p_idx}_actionStateName'] == 'DAMAGE').to_numpy()
 
+    # identify the start of each run of the same mask value
+    starts = np.flatnonzero(np.diff(mask, prepend=~mask[:1]))
 
-def create_action_counts(df):
-    action_counts = {}
-    for p_tag in ["1", "2"]:
-        print(f"p_tag={p_tag}")
-        # calculate a boolean mask where the actionName value changes
-        mask = df[f'p{p_tag}_actionName'] != df[f'p{p_tag}_actionName'].shift()
+    # the end of each run is the frame before the next start, the last run ends at the end of the series
+    ends = np.append(starts[1:], len(mask))[:len(starts)] - 1
 
-        # cumsum to create a continuous sequence indicator
-        df[f'p{p_tag}_actionName_sequence'] = mask.cumsum()
+    return starts, ends
 
-        # group by actionName and sequence and count occurrences
-        sequence_counts = df.groupby([f'p{p_tag}_actionName', f'p{p_tag}_actionName_sequence']).size().reset_index(
-            name='count')
 
-        # count the number of sequences for each unique action name
-        result = sequence_counts.groupby(f'p{p_tag}_actionName').size().reset_index(name='number_of_sequences')
-        action_counts[p_tag] = result
-    return action_counts
+def damage_totals(p_idx: str, damage_seqs: tuple[np.ndarray, np.ndarray], df: pd.DataFrame) -> np.ndarray:
+    # total HP change of each sequence, the last frame of each sequence isn't counted
+    starts, ends = damage_seqs
+    hp_diff = np.nan_to_num(df[f'p{p_idx}_current_HP_diff'].to_numpy(dtype=np.float64))
+    hp_diff[ends] = 0
+    return np.add.reduceat(hp_diff, starts)
 
 
-def generate_action_count(player_seq_counts, action_label, action_names, round_metrics, total_metrics):
-    # store totals
-    total_counts = {}
+@instrumented("damage")
+def create_damage_stats(p_idx: str, damage_seqs: tuple[np.ndarray, np.ndarray], df: pd.DataFrame) -> Dict[str, Dict]:
+    other_p_idx = "2" if p_idx == "1" else "1"
+    starts, ends = damage_seqs
 
-    # for each player and sequence count
-    for p_tag, seq_count in player_seq_counts.items():
-        # sum the count for these actions
-        total_sequences = seq_count[seq_count[f'p{p_tag}_actionName'].isin(action_names)]['number_of_sequences'].sum()
-        # store the total for that player
-        total_counts[p_tag] = total_sequences
+    if len(starts) == 0:
+        return {}
 
-    # store total for this action
-    round_metrics[action_label] = total_counts
+    total_damage = damage_totals(p_idx, damage_seqs, df)
+    damaged = total_damage < 0
 
-    # create empty to store total
-    action_total = total_metrics.setdefault(action_label, {"1": 0, "2": 0})
+    # the actionName that opened each damaging sequence
+    damage = pd.DataFrame({
+        "actionName": df[f'p{other_p_idx}_actionName'].to_numpy()[starts[damaged]],
+        "damage": total_damage[damaged] * -1
+    })
 
-    # for each player
-    for p_tag in total_counts:
-        # sum the for this action
-        action_total[p_tag] = action_total[p_tag] + round_metrics[action_label][p_tag]
+    # count and total damage per opening actionName, in order of first use
+    action_damage = damage.groupby("actionName", sort=False, dropna=False)["damage"].agg(["count", "sum"])
 
-    return round_metrics, total_metrics
+    return {
+        action_name: {"count": int(action_count), "total": float(action_total)}
+        for action_name, action_count, action_total in zip(
+            action_damage.index, action_damage["count"], action_damage["sum"])
+    }
 
 
+@instrumented("routes")
+def create_damage_routes(p_idx: str, damage_seqs: tuple[np.ndarray, np.ndarray], df: pd.DataFrame) -> list:
+    # the other player's route through each damaging sequence, the actionNames in order of first use over the same
+    # frames the damage is summed over, with the frame the sequence started and the damage it did
+    other_p_idx = "2" if p_idx == "1" else "1"
+    starts, ends = damage_seqs
+
+    if len(starts) == 0:
+        return []
+
+    total_damage = damage_totals(p_idx, damage_seqs, df)
+    damaged = total_damage < 0
+    codes, categories = category_codes(df[f'p{other_p_idx}_actionName'])
+
+    routes = []
+    for start, end, damage in zip(starts[damaged], ends[damaged], total_damage[damaged]):
+        route_codes = codes[start:end]
+
+        # one code per run so the unique pass is over actions, not frames, frames without a name are left out
+        route_codes = route_codes[np.flatnonzero(np.append(True, route_codes[1:] != route_codes[:-1]))]
+        route = [categories[code] for code in dict.fromkeys(route_codes.tolist()) if code >= 0]
+        routes.append({"frame": int(start), "damage": float(damage * -1), "route": route})
+    return routes
+
+
+# metric label: (round column, names), counts how many times each player enters one of the names, the column is
+# actionName or actionStateName, add metrics with register_action_metric
+action_metrics = {
+    'Perfect Parries': ("actionName", ["DPA_H(1)", "DPA_M(1)", "DPA_L(1)"]),
+    'Raw Drive Rushes': ("actionName", ["ATK_CTA_DASH"]),
+    'Throw Breaks': ("actionName", ["NGE"]),
+}
+
+# round columns action metrics can count
+action_metric_columns = ["actionName", "actionStateName"]
+
+
+def register_action_metric(label: str, names: list, column: str = "actionName"):
+    if column not in action_metric_columns:
+        raise ValueError(f"action metric {label} counts {column}, expected one of {action_metric_columns}")
+    if len(names) == 0:
+        raise ValueError(f"action metric {label} has no names")
+    action_metrics[label] = (column, list(names))
+
+
+def category_codes(values: pd.Series):
+    # (code of each value, categories) of a name column, -1 for frames without a name
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    codes, categories = pd.factorize(values)
+    return codes, pd.Index(categories)
+
+
+def count_runs(values: pd.Series):
+    # (runs of consecutive equal values per category code, categories) in one pass over the column, frames without
+    # a name aren't counted
+    codes, categories = category_codes(values)
+    run_starts = np.ones(len(codes), dtype=bool)
+    np.not_equal(codes[1:], codes[:-1], out=run_starts[1:])
+    run_codes = codes[run_starts]
+    return np.bincount(run_codes[run_codes >= 0], minlength=len(categories)), categories
+
+
+@instrumented("action_counts", rows=df_rows(0))
+def count_action_metrics(df, metrics: dict = None) -> dict:
+    # metric label: {player: count} of every metric, each player's column is run length encoded once however many
+    # metrics count it, df isn't modified
+    metrics = metrics if metrics is not None else action_metrics
+
+    # column: (labels, names of every metric, index of each metric's first name)
+    columns = {}
+    for label, (column, names) in metrics.items():
+        if len(names) == 0:
+            raise ValueError(f"action metric {label} has no names")
+        labels, column_names, name_offsets = columns.setdefault(column, ([], [], []))
+        labels.append(label)
+        name_offsets.append(len(column_names))
+        column_names.extend(names)
+
+    metric_counts = {label: {} for label in metrics.keys()}
+    for p_tag in ["1", "2"]:
+        for column, (labels, column_names, name_offsets) in columns.items():
+            run_counts, categories = count_runs(df[f'p{p_tag}_{column}'])
+
+            # names missing from the character's table index the 0 appended to the counts
+            name_counts = np.append(run_counts, 0)[categories.get_indexer(column_names)]
+            for label, count in zip(labels, np.add.reduceat(name_counts, name_offsets)):
+                metric_counts[label][p_tag] = int(count)
+    return metric_counts
+
+
+def player_damage_image(player_idx: str, round_num: int, output_dir: str = None) -> str:
+    # named by the 1 based round and the reversed player idx, as in plot_player_damage
+    output_dir = output_dir or stats_img_dir
+    return f'{output_dir}/round{round_num + 1}_player{"2" if player_idx == "1" else "1"}_dmg.png'
+
+
+@instrumented("plot_player_damage")
 def plot_player_damage(
         player_idx: str,
         round_num: int,
         data: Dict,
-        player_character: Dict[str, str]):
+        player_character: Dict[str, str],
+        output_dir: str = None):
+    plt = pyplot()
+    from matplotlib.ticker import MaxNLocator
+
+    image_path = player_damage_image(player_idx, round_num, output_dir)
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+
     # round start at 0
     round_num = round_num + 1
 
@@ -323,44 +607,64 @@ def plot_player_damage(
 
     # save plot to img
     plt.tight_layout()
-    plt.savefig(f'stats_img/round{round_num}_player{player_idx}_dmg.png')
+    plt.savefig(image_path)
     plt.close()
 
 
+@instrumented("drive", rows=df_rows(1))
 def generate_drive_stats(p_idx: str, df: pd.DataFrame) -> Dict[str, Dict]:
     other_p_idx = "2" if p_idx == "1" else "1"
     drive_stats = {}
 
-    for idx, row in df[df[f'p{p_idx}_drive_diff'] < 0].iterrows():
-        # the action state name
-        action_state_name = row[f'p{p_idx}_actionStateName']
+    # frames where drive was lost
+    drive_diff = df[f'p{p_idx}_drive_diff']
+    lost = (drive_diff < 0).to_numpy()
+    drive_lost = pd.DataFrame({
+        "action_state_name": df[f'p{p_idx}_actionStateName'].to_numpy()[lost],
+        "action_name": df[f'p{p_idx}_actionName'].to_numpy()[lost],
+        "enemy_action_name": df[f'p{other_p_idx}_actionName'].to_numpy()[lost],
+        "drive": drive_diff.to_numpy(dtype=np.float64)[lost] * -1
+    })
+
+    # drive lost to the enemy while blocking or being hit, or used on specials
+    defending = drive_lost["action_state_name"].isin(['DEF', 'DAMAGE']).to_numpy()
+    special = (drive_lost["action_state_name"] == 'SPECIAL').to_numpy()
+
+    # DEF/DAMAGE are tracked by action state, SPECIAL by the player's action
+    drive_lost["stat_name"] = np.where(defending, drive_lost["action_state_name"], drive_lost["action_name"])
+    drive_lost = drive_lost[defending | special]
+    defending = defending[defending | special]
+
+    # count and total for each stat, in order of first loss
+    stat_totals = drive_lost.groupby("stat_name", sort=False, dropna=False)["drive"].agg(["count", "sum"])
+    for stat_name, stat_defending, stat_count, stat_total in zip(
+            stat_totals.index, stat_totals.index.isin(['DEF', 'DAMAGE']), stat_totals["count"], stat_totals["sum"]):
+        if stat_defending:
+            drive_stats[stat_name] = {'total': float(stat_total)}
+        else:
+            drive_stats[stat_name] = {"count": int(stat_count), "total": float(stat_total)}
 
-        if action_state_name in ['DEF', 'DAMAGE']:
-            # create if dict doesn't exist
-            action_stats = drive_stats.setdefault(action_state_name, {})
+    # count and total for each enemy action while blocking or being hit
+    enemy_action_totals = drive_lost[defending].groupby(
+        ["stat_name", "enemy_action_name"], sort=False, dropna=False)["drive"].agg(["count", "sum"])
+    for (stat_name, enemy_action_name), enemy_count, enemy_total in zip(
+            enemy_action_totals.index, enemy_action_totals["count"], enemy_action_totals["sum"]):
+        drive_stats[stat_name][enemy_action_name] = {"count": int(enemy_count), "total": float(enemy_total)}
 
-            # total drive lost
-            total_drive = action_stats.setdefault('total', 0)
-            # accumulate total lost
-            action_stats['total'] = total_drive + (row[f'p{p_idx}_drive_diff'] * -1)
+    return drive_stats
 
-            # create list if doesn't exist
-            enemy_action_stats = action_stats.setdefault(row[f'p{other_p_idx}_actionName'], {"count": 0, "total": 0})
-            # track for this action
-            enemy_action_stats['count'] = enemy_action_stats['count'] + 1
-            enemy_action_stats['total'] = enemy_action_stats['total'] + (row[f'p{p_idx}_drive_diff'] * -1)
-        elif action_state_name == 'SPECIAL':
-            action_name = row[f'p{p_idx}_actionName']
-            action_stats = drive_stats.setdefault(action_name, {"count": 0, "total": 0})
 
-            # track for this action
-            action_stats['count'] = action_stats['count'] + 1
-            action_stats['total'] = action_stats['total'] + (row[f'p{p_idx}_drive_diff'] * -1)
+def drive_data_image(round_num: int, output_dir: str = None) -> str:
+    output_dir = output_dir or stats_img_dir
+    return f'{output_dir}/round{round_num}_drive.png'
 
-    return drive_stats
 
+@instrumented("plot_drive_data")
+def plot_drive_data(data, round_num, player_character, output_dir: str = None):
+    plt = pyplot()
+    image_path = drive_data_image(round_num, output_dir)
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
 
-def plot_drive_data(data, round_num, player_character):
     abilities = {}
 
     for player, player_data in data.items():
@@ -401,11 +705,21 @@ def plot_drive_data(data, round_num, player_character):
     ax.legend()
 
     fig.tight_layout()
-    plt.savefig(f'stats_img/round{round_num}_drive.png')
+    plt.savefig(image_path)
     plt.close()
 
 
-def plot_table_metrics(data):
+def table_metrics_image(output_dir: str = None) -> str:
+    output_dir = output_dir or stats_img_dir
+    return f'{output_dir}/match_stats.png'
+
+
+@instrumented("plot_table_metrics")
+def plot_table_metrics(data, output_dir: str = None):
+    plt = pyplot()
+    image_path = table_metrics_image(output_dir)
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+
     fig, ax = plt.subplots(figsize=(15, 5))
     ax.axis('off')
 
@@ -458,52 +772,414 @@ def plot_table_metrics(data):
 
     plt.title('Match Stats')
     plt.tight_layout()
-    plt.savefig(f'stats_img/match_stats.png')
+    plt.savefig(image_path)
     plt.close()
 
 
-def update_plots(rounds_df, player_character):
-    rounds_metrics = {}
-    total_metrics = {}
+def hash_round_df(df, player_character) -> str:
+    # content hash of a round's frames, only the replay columns are hashed so the derived columns of a ReplayRound
+    # don't have to be computed, names depend on the characters so they're part of the hash
+    round_hash = hashlib.sha1(pd.util.hash_pandas_object(df[replay_columns()], index=True).to_numpy().tobytes())
+    round_hash.update(repr(sorted(player_character.items())).encode())
+    return round_hash.hexdigest()
+
 
+def hash_match(rounds_df, player_character) -> str:
+    # content hash of a match, the same match from recent_replay.json or its archived copy hashes the same
+    match_hash = hashlib.sha1()
     for round_num, df in rounds_df.items():
-        drive_round_stats = {}
-        for _, p_id in enumerate(["2", "1"]):
-            damage_seq = create_damage_seq(p_id, df)
-            damage_stats = create_damage_stats(p_id, damage_seq, df)
-            if len(damage_stats) > 0:
-                plot_player_damage(p_id, round_num, damage_stats, player_character)
+        match_hash.update(f"{round_num}:{hash_round_df(df, player_character)}".encode())
+    return match_hash.hexdigest()
 
-            drive_stats = generate_drive_stats(p_id, df)
-            drive_round_stats[p_id] = drive_stats
-        plot_drive_data(drive_round_stats, round_num, player_character)
 
-        action_counts = create_action_counts(df)
-        round_metrics = rounds_metrics.setdefault(str(round_num), {})
+def hash_plot_job(plot_job) -> str:
+    # content hash of the stats payload of a plot job
+    return hashlib.sha1(repr(plot_job).encode()).hexdigest()
 
-        generate_action_count(action_counts, 'Perfect Parries', ["DPA_H(1)", "DPA_M(1)", "DPA_L(1)"], round_metrics,
-                              total_metrics)
 
-        generate_action_count(action_counts, 'Raw Drive Rushes', ["ATK_CTA_DASH"], round_metrics, total_metrics)
+class PlotCache:
+    # remembers what was computed and rendered so unchanged rounds and images are skipped
+    def __init__(self, sink: ImageSink = None, output_dir: str = None):
+        # round number: (round hash, round stats)
+        self.rounds = {}
 
-        generate_action_count(action_counts, 'Throw Breaks', ["NGE"], round_metrics, total_metrics)
+        # sink the images are written through, stale images are removed through it
+        self.sink = sink or default_sink
 
-        plot_table_metrics(rounds_metrics)
+        # directory the images are rendered to, stats_img_dir if None
+        self.output_dir = output_dir
 
+        # image path: plot job hash of the image on disk
+        self.images = {}
 
-def main():
-    if replay_file_exists(filename=f"{replay_dir}/{replay_name}"):
-        rounds_df, player_character = load_recent_file(replay_dir)
+    def dirty_plot_jobs(self, plot_jobs: list) -> list:
+        # plot jobs whose payload changed or whose image is missing
+        images = {}
+        dirty_jobs = []
+        for plot_job in plot_jobs:
+            image_path = plot_job_image(plot_job, self.output_dir)
+            images[image_path] = hash_plot_job(plot_job)
+            if self.images.get(image_path) != images[image_path] or not os.path.exists(image_path):
+                dirty_jobs.append(plot_job)
 
-        update_plots(rounds_df, player_character)
-        print("updated plots")
+        # remove images from the previous match that this match doesn't have
+        for image_path in self.images.keys() - images.keys():
+            self.sink.remove(image_path)
 
-    while True:
-        print("watching file...")
-        watch_file_for_changes(filename=f"{replay_dir}/{replay_name}")
-        rounds_df, player_character = load_recent_file(replay_dir)
-        update_plots(rounds_df, player_character)
-        print("updated plots.")
+        self.images = images
+        return dirty_jobs
+
+    def invalidate(self):
+        # forget rendered images so the next update renders everything
+        self.images = {}
+
+
+def create_round_stats(df) -> dict:
+    round_stats = {"damage": {}, "routes": {}, "drive": {}}
+
+    for _, p_id in enumerate(["2", "1"]):
+        damage_seq = create_damage_seq(p_id, df)
+        round_stats["damage"][p_id] = create_damage_stats(p_id, damage_seq, df)
+        round_stats["routes"][p_id] = create_damage_routes(p_id, damage_seq, df)
+        round_stats["drive"][p_id] = generate_drive_stats(p_id, df)
+
+    round_stats["metrics"] = count_action_metrics(df)
+    return round_stats
+
+
+def round_stats(df) -> dict:
+    # the stats of a ReplayRound are memoized on it
+    return df.stats if isinstance(df, ReplayRound) else create_round_stats(df)
+
+
+def create_match_stats(rounds_df, player_character=None, plot_cache: PlotCache = None) -> dict:
+    # rounds_df is round number: DataFrame, or a Replay
+    if plot_cache is None:
+        return {round_num: round_stats(df) for round_num, df in rounds_df.items()}
+
+    match_stats = {}
+    rounds_cache = {}
+
+    for round_num, df in rounds_df.items():
+        # reuse the stats of rounds whose frames haven't changed
+        round_hash = hash_round_df(df, player_character)
+        cached_round = plot_cache.rounds.get(round_num)
+        if cached_round is not None and cached_round[0] == round_hash:
+            match_stats[round_num] = cached_round[1]
+        else:
+            match_stats[round_num] = round_stats(df)
+        rounds_cache[round_num] = (round_hash, match_stats[round_num])
+
+    plot_cache.rounds = rounds_cache
+    return match_stats
+
+
+def create_plot_jobs_from_stats(match_stats: dict, player_character) -> list:
+    rounds_metrics = {}
+
+    # (plot name, plot args) for each image to render
+    plot_jobs = []
+
+    for round_num, round_stats in match_stats.items():
+        for p_id, damage_stats in round_stats["damage"].items():
+            if len(damage_stats) > 0:
+                plot_jobs.append(("player_damage", (p_id, round_num, damage_stats, player_character)))
+        plot_jobs.append(("drive_data", (round_stats["drive"], round_num, player_character)))
+        rounds_metrics[str(round_num)] = round_stats["metrics"]
+
+    # the table covers every round so it's rendered once, rendering it per round would have parallel jobs
+    # writing the same image
+    if len(rounds_metrics) > 0:
+        plot_jobs.append(("table_metrics", (rounds_metrics,)))
+
+    return plot_jobs
+
+
+def create_plot_jobs(rounds_df, player_character, plot_cache: PlotCache = None) -> list:
+    return create_plot_jobs_from_stats(create_match_stats(rounds_df, player_character, plot_cache), player_character)
+
+
+def plot_job_image(plot_job, output_dir: str = None) -> str:
+    plot_name, plot_args = plot_job
+    if plot_name == "player_damage":
+        return player_damage_image(plot_args[0], plot_args[1], output_dir)
+    elif plot_name == "drive_data":
+        return drive_data_image(plot_args[1], output_dir)
+    return table_metrics_image(output_dir)
+
+
+# plot name to plot function for render jobs
+plot_functions = {
+    "player_damage": plot_player_damage,
+    "drive_data": plot_drive_data,
+    "table_metrics": plot_table_metrics,
+}
+
+
+def render_plot_png(plot_job) -> bytes:
+    # drawn on figures kept for the life of the process, same images as the plot_functions
+    from replay_figures import figure_renderer
+    with replay_metrics.stage(f"plot_{plot_job[0]}"):
+        return figure_renderer().render(plot_job)
+
+
+def render_plot_job(plot_job, output_dir: str = None, sink: ImageSink = None) -> bool:
+    # write the image through sink, True if the file changed
+    return (sink or default_sink).write(plot_job_image(plot_job, output_dir), render_plot_png(plot_job))
+
+
+def create_image_plot_job(replay: Replay, image_path: str):
+    # the plot job of one image, only the stats of the rounds the image shows are computed, None if the match
+    # doesn't have the image
+    output_dir = os.path.dirname(image_path)
+    player_character = replay.player_character
+    for round_num in replay.round_numbers:
+        round_images = [player_damage_image(p_id, round_num, output_dir) for p_id in ["1", "2"]]
+        round_images.append(drive_data_image(round_num, output_dir))
+        if image_path in round_images:
+            for plot_job in create_plot_jobs_from_stats({round_num: replay[round_num].stats}, player_character):
+                if plot_job[0] != "table_metrics" and plot_job_image(plot_job, output_dir) == image_path:
+                    return plot_job
+            return None
+
+    # the table covers every round
+    if image_path == table_metrics_image(output_dir):
+        for plot_job in create_plot_jobs_from_stats(create_match_stats(replay), player_character):
+            if plot_job[0] == "table_metrics":
+                return plot_job
+    return None
+
+
+def update_plots(replay: Replay, render_pool=None, on_complete=None, plot_cache: PlotCache = None, stats_store=None,
+                 played_at=None, on_submitted=None, overlay=None, render_images: bool = True):
+    player_character = replay.player_character
+
+    # compute the stats in this process
+    match_stats = create_match_stats(replay, player_character, plot_cache)
+    plot_jobs = create_plot_jobs_from_stats(match_stats, player_character)
+
+    # the overlay is a replay_overlay.OverlayServer, it's updated first since it takes milliseconds
+    if overlay is not None:
+        with replay_metrics.stage("overlay", len(plot_jobs)):
+            overlay.publish(plot_jobs, player_character)
+
+    # add the match to the cross match stats, stats_store is a replay_store.StatsStore
+    if stats_store is not None:
+        with replay_metrics.stage("store"):
+            stats_store.add_match(hash_match(replay, player_character), match_stats, player_character, played_at)
+
+    # images are written through the plot cache's sink, to its output dir
+    sink = plot_cache.sink if plot_cache is not None else default_sink
+    output_dir = plot_cache.output_dir if plot_cache is not None else None
+
+    if not render_images:
+        # the overlay is the only output, the image files are left as they are
+        plot_jobs = []
+        plots_updated = on_complete
+    elif plot_cache is not None:
+        # only render images whose stats changed
+        plot_jobs = plot_cache.dirty_plot_jobs(plot_jobs)
+
+        # render everything next time if a job failed
+        def plots_updated(errors):
+            if len(errors) > 0:
+                plot_cache.invalidate()
+            if on_complete is not None:
+                on_complete(errors)
+    else:
+        plots_updated = on_complete
+
+    # stats are computed, only rendering is left
+    if on_submitted is not None:
+        on_submitted()
+
+    # stages of this match, the render workers don't record theirs so pool rendering is timed from here, rendering
+    # in process is a stage around the plot stages
+    render_start = time.perf_counter()
+    match_metrics = None
+
+    def rendered(errors):
+        # the pool finishes the match's metrics when the jobs are submitted, rendering in process here
+        nonlocal match_metrics
+        if match_metrics is None:
+            match_metrics = replay_metrics.finish_match()
+        if match_metrics is not None:
+            if render_pool is not None:
+                match_metrics.add("render", time.perf_counter() - render_start, len(plot_jobs))
+            replay_metrics.publish(match_metrics, player_character=player_character, images=len(plot_jobs),
+                                   errors=len(errors))
+        if plots_updated is not None:
+            plots_updated(errors)
+
+    # render in the pool if there is one, on_complete is called with a list of errors once every image is written
+    if render_pool is not None:
+        match_metrics = replay_metrics.finish_match()
+        return render_pool.render(plot_jobs, rendered, sink, output_dir)
+
+    try:
+        with replay_metrics.stage("render", len(plot_jobs)):
+            for plot_job in plot_jobs:
+                render_plot_job(plot_job, output_dir, sink)
+    except Exception as e:
+        if plots_updated is None:
+            # the failed match's stages aren't left for the next one
+            replay_metrics.finish_match()
+            raise
+        rendered([e])
+    else:
+        rendered([])
+
+
+def print_plots_updated(errors):
+    for error in errors:
+        print(f"failed to render plot: {error!r}")
+    print("updated plots.")
+
+
+def replay_played_at(replay_path: str) -> datetime.datetime:
+    # when the replay file was written
+    return datetime.datetime.fromtimestamp(os.path.getmtime(replay_path))
+
+
+def watch(sf6_path: str, render_workers: int = None, cache_dir: str = None, store_path: str = None):
+    from replay_cache import ReplayCache
+    from replay_render import RenderPool
+    from replay_store import StatsStore
+
+    # prepared DataFrames of replays already seen
+    replay_cache = ReplayCache(cache_dir) if cache_dir is not None else None
+
+    # cross match stats
+    stats_store = StatsStore(store_path) if store_path is not None else None
+    replay_path = f"{sf6_path}/reframework/data/{replay_name}"
+
+    # warm render workers
+    render_pool = RenderPool(render_workers)
+
+    # skip rounds and images that haven't changed between matches
+    plot_cache = PlotCache()
+
+    # start watching before the first load so a match saved during it isn't missed
+    watcher = ReplayWatcher(replay_path)
+
+    if replay_file_exists(filename=replay_path):
+        update_plots(load_recent_replay(sf6_path, replay_cache), render_pool, print_plots_updated, plot_cache,
+                     stats_store, replay_played_at(replay_path))
+
+    try:
+        while True:
+            print(f"watching file ({watcher.backend})...")
+            if not watcher.wait_for_change():
+                break
+            update_plots(load_recent_replay(sf6_path, replay_cache), render_pool, print_plots_updated, plot_cache,
+                         stats_store, replay_played_at(replay_path))
+    finally:
+        watcher.close()
+        render_pool.shutdown()
+        if stats_store is not None:
+            stats_store.close()
+
+
+def main(argv=None):
+    import argparse
+    import replay_cache
+    import replay_store
+
+    parser = argparse.ArgumentParser(description="Generate SF6 match stats plots.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    # watch recent_replay.json and plot each match, the default
+    watch_parser = subparsers.add_parser("watch", help="watch for new matches and plot them")
+    watch_parser.add_argument("--sf6-path", default=replay_dir, help="SF6 steam directory")
+    watch_parser.add_argument("--workers", type=int, default=None, help="render worker processes")
+    watch_parser.add_argument("--cache-dir", default=replay_cache.default_cache_dir, help="parsed replay cache")
+    watch_parser.add_argument("--store", default=replay_store.default_store_path, help="cross match stats database")
+
+    # read frames as they are streamed during the match, needs Stream Frames enabled in capture_match.lua
+    stream_parser = subparsers.add_parser("stream", help="read frames while the match is played")
+    stream_parser.add_argument("--sf6-path", default=replay_dir, help="SF6 steam directory")
+    stream_parser.add_argument("--workers", type=int, default=None, help="render worker processes")
+    stream_parser.add_argument("--store", default=replay_store.default_store_path, help="cross match stats database")
+
+    # process every archived match in a directory
+    batch_parser = subparsers.add_parser("batch", help="process every archived match in a directory")
+    batch_parser.add_argument("replay_dir", help="directory of archived replays, like reframework/data")
+    batch_parser.add_argument("--output", default="stats_batch", help="output directory, one folder per match")
+    batch_parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    batch_parser.add_argument("--cache-dir", default=replay_cache.default_cache_dir, help="parsed replay cache")
+    batch_parser.add_argument("--no-cache", action="store_true", help="always parse the replay json")
+    batch_parser.add_argument("--store", default=replay_store.default_store_path, help="cross match stats database")
+
+    # one report of every archived match, streamed through the workers so memory doesn't grow with the archive
+    report_parser = subparsers.add_parser("report", help="matchup report over every archived match")
+    report_parser.add_argument("replay_dir", nargs="?", help="directory of archived replays, like reframework/data")
+    report_parser.add_argument("--output", default="stats_report", help="output directory")
+    report_parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    report_parser.add_argument("--chunk-size", type=int, default=16, help="matches each worker reduces at a time")
+    report_parser.add_argument("--character", help="only tables and plots of this character, like Ken")
+    report_parser.add_argument("--opponent", help="only tables and plots against this character, like JP")
+    report_parser.add_argument("--merge", nargs="*", default=[], metavar="REPORT_JSON",
+                               help="report.json of other runs to merge into the report")
+
+    # convert replay json to the binary replay format
+    convert_parser = subparsers.add_parser("convert", help="convert replay json to binary replays")
+    convert_parser.add_argument("replay_path", help="replay json, or a directory of archived replays")
+    convert_parser.add_argument("--output", default=None, help="output directory, next to the json by default")
+
+    # manage the parsed replay cache
+    cache_parser = subparsers.add_parser("cache", help="manage the parsed replay cache")
+    cache_parser.add_argument("action", choices=["warm", "clear", "info"])
+    cache_parser.add_argument("replay_dir", nargs="?", help="directory of archived replays to warm the cache with")
+    cache_parser.add_argument("--cache-dir", default=replay_cache.default_cache_dir, help="parsed replay cache")
+    cache_parser.add_argument("--max-size-mb", type=int, default=replay_cache.default_max_bytes // (1024 * 1024),
+                              help="least recently used matches are evicted above this size")
+    cache_parser.add_argument("--workers", type=int, default=None, help="worker processes")
+
+    # query the cross match stats
+    query_parser = subparsers.add_parser("query", help="query stats across matches")
+    query_parser.add_argument("kind", choices=["damage", "drive", "metrics", "matches", "routes", "drops"])
+    query_parser.add_argument("--character", help="character the stats are for, like Ken")
+    query_parser.add_argument("--opponent", help="opposing character, like JP")
+    query_parser.add_argument("--action", help="action name, sql LIKE wildcards allowed, like 'ATK_CTA%%'")
+    query_parser.add_argument("--since", help="matches played on or after, like 2023-10-01")
+    query_parser.add_argument("--until", help="matches played before, like 2023-11-01")
+    query_parser.add_argument("--route", help="comma separated action names, the start of the routes or the route "
+                                              "whose drops are counted, like 'ATK_CTA_DASH,5LP'")
+    query_parser.add_argument("--limit", type=int, default=50)
+    query_parser.add_argument("--store", default=replay_store.default_store_path, help="cross match stats database")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "batch":
+        from replay_batch import run_batch
+        run_batch(args.replay_dir, args.output, args.workers, None if args.no_cache else args.cache_dir, args.store)
+    elif args.command == "report":
+        if args.replay_dir is None and len(args.merge) == 0:
+            parser.error("report needs a replay_dir or --merge")
+        from replay_report import run_report
+        run_report(args.replay_dir, args.output, args.workers, args.chunk_size, args.character, args.opponent,
+                   args.merge)
+    elif args.command == "query":
+        replay_store.run_query(args.store, args.kind, args.character, args.opponent, args.action, args.since,
+                               args.until, args.limit, args.route)
+    elif args.command == "cache":
+        if args.action == "warm":
+            if args.replay_dir is None:
+                parser.error("cache warm needs a replay_dir")
+            replay_cache.warm(args.replay_dir, args.cache_dir, args.max_size_mb * 1024 * 1024, args.workers)
+        elif args.action == "clear":
+            replay_cache.ReplayCache(args.cache_dir).clear()
+        replay_cache.info(args.cache_dir)
+    elif args.command == "convert":
+        from replay_binary import convert
+        convert(args.replay_path, args.output)
+    elif args.command == "stream":
+        from replay_stream import stream
+        stream(args.sf6_path, args.workers, args.store)
+    elif args.command == "watch":
+        watch(args.sf6_path, args.workers, args.cache_dir, args.store)
+    else:
+        watch(replay_dir, cache_dir=replay_cache.default_cache_dir, store_path=replay_store.default_store_path)
 
 
 if __name__ == "__main__":
@@ -1,29 +1,295 @@
 import tkinter as tk
 from tkinter import ttk, filedialog
 from PIL import Image, ImageTk
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
 import threading
 import queue
+import multiprocessing
+import os
+import re
 
+import replay_metrics
 import replay_stats
+from replay_output import ImageCache, ImageSink
+from replay_render import RenderPool
+from replay_watcher import file_signature
+from replay_worker import MatchWorker, WorkerEvent, update_stages
+
+
+# rounds of the drive images on disk, drive images are named by the 0 based round
+drive_image_pattern = re.compile(r"round(\d+)_drive\.png")
+
+
+def image_rounds(output_dir: str = None) -> list:
+    # rounds whose images are on disk, for when no replay is loaded
+    output_dir = output_dir or replay_stats.stats_img_dir
+    try:
+        file_names = os.listdir(output_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(int(match.group(1)) for match in map(drive_image_pattern.fullmatch, file_names) if match)
+
+
+def match_images(replay) -> list:
+    # (image path, tab label) of each plot of the match
+    round_numbers = replay.round_numbers if replay is not None else image_rounds()
+
+    images = []
+    for round_num in round_numbers:
+        # damage images are named after the player who dealt the damage
+        for damaged_player, player_num in [("2", "1"), ("1", "2")]:
+            images.append((replay_stats.player_damage_image(damaged_player, round_num),
+                           f"Round {round_num + 1} Player {player_num} Damage"))
+        images.append((replay_stats.drive_data_image(round_num), f"Round {round_num + 1} Drive Usage/Lost"))
+    images.append((replay_stats.table_metrics_image(), "Match Statistics"))
+    return images
+
+
+class DecodedImage:
+    # image decoded on the loader thread, its PhotoImage is only built on the tk thread when it's first shown
+    def __init__(self, key, image):
+        # sha1 of the rendered bytes, or the file signature of an image rendered by another process
+        self.key = key
+        self.image = image
+        self.photo = None
+
+    def photo_image(self):
+        # tk thread only
+        if self.photo is None:
+            self.photo = ImageTk.PhotoImage(self.image)
+        return self.photo
+
+
+class ImageLoader:
+    # decodes plot images on a background thread, rendering the ones that are missing
+    def __init__(self, image_cache: ImageCache, plot_cache: replay_stats.PlotCache):
+        self.image_cache = image_cache
+        self.plot_cache = plot_cache
+
+        # image path: DecodedImage, kept across viewer windows until the image changes
+        self.decoded = {}
+        self.lock = threading.Lock()
+
+        # one thread, so the same image is never decoded or rendered twice at once
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-loader")
+
+    def image_key(self, image_path: str):
+        # key that changes whenever the image does, None if the image doesn't exist
+        image_bytes = self.image_cache.get(image_path)
+        if image_bytes is not None:
+            return hashlib.sha1(image_bytes).hexdigest(), image_bytes
+        return file_signature(image_path), None
+
+    def render(self, image_path: str, replay) -> bool:
+        # plot a missing image from the stats of the round it shows only, False if there's nothing to plot
+        plot_job = replay_stats.create_image_plot_job(replay, image_path)
+        if plot_job is None:
+            return False
+        replay_stats.render_plot_job(plot_job, os.path.dirname(image_path), self.plot_cache.sink)
+        return True
+
+    def load(self, image_path: str, load_replay):
+        # the DecodedImage of image_path, None if there's nothing to show
+        key, image_bytes = self.image_key(image_path)
+        if key is None:
+            replay = load_replay()
+            if replay is None or not self.render(image_path, replay):
+                return None
+            key, image_bytes = self.image_key(image_path)
+            if key is None:
+                return None
+
+        with self.lock:
+            decoded = self.decoded.get(image_path)
+        if decoded is not None and decoded.key == key:
+            return decoded
+
+        try:
+            image = Image.open(io.BytesIO(image_bytes) if image_bytes is not None else image_path)
+            # decode here instead of on the tk thread
+            image.load()
+        except FileNotFoundError:
+            # removed after it was checked
+            return None
+
+        decoded = DecodedImage(key, image)
+        with self.lock:
+            self.decoded[image_path] = decoded
+        return decoded
+
+    def request(self, image_path: str, load_replay, on_loaded):
+        # load image_path on the loader thread, on_loaded(image_path, decoded or None, error or None) is called there
+        def loaded(future):
+            error = future.exception()
+            on_loaded(image_path, None if error is not None else future.result(), error)
+
+        self.executor.submit(self.load, image_path, load_replay).add_done_callback(loaded)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class MatchViewer:
+    # notebook of the match plots, opens without reading any image and fills in each tab when it's selected
+    def __init__(self, master, image_loader: ImageLoader, replay, sf6_path: str):
+        self.image_loader = image_loader
+        self.replay = replay
+        self.sf6_path = sf6_path
+        self.replay_lock = threading.Lock()
+
+        self.window = tk.Toplevel(master)
+        self.window.title("Match Plots")
+        self.notebook = ttk.Notebook(self.window)
+        self.notebook.pack(padx=10, pady=10, expand=True, fill=tk.BOTH)
+
+        # tab frame name: image path, and the label showing each tab's image
+        self.tab_images = {}
+        self.tab_labels = {}
+
+        # images decoded on the loader thread, handed to the tk thread by the <<ImageLoaded>> event
+        self.loaded = queue.Queue()
+
+        self.notebook.bind('<<NotebookTabChanged>>', lambda event: self.show_selected())
+        self.window.bind('<<ImageLoaded>>', lambda event: self.show_loaded())
+        self.set_images(match_images(replay))
+
+    def load_replay(self):
+        # loader thread, the recent replay file is only read when an image has to be rendered without a match loaded
+        with self.replay_lock:
+            if self.replay is None:
+                replay_path = f"{self.sf6_path}/reframework/data/{replay_stats.replay_name}"
+                if replay_stats.replay_file_exists(replay_path):
+                    self.replay = replay_stats.load_recent_replay(self.sf6_path)
+            return self.replay
+
+    def set_images(self, images: list):
+        # rebuild the tabs, keeping the selected tab if the match still has it
+        selected = None
+        if self.notebook.select():
+            selected = self.tab_images.get(self.notebook.select())
+        for frame_name in self.notebook.tabs():
+            self.notebook.nametowidget(frame_name).destroy()
+        self.tab_images = {}
+        self.tab_labels = {}
+
+        # tabs are empty until they're selected
+        for image_path, label in images:
+            frame = ttk.Frame(self.notebook)
+            self.notebook.add(frame, text=label)
+            self.tab_images[str(frame)] = image_path
+            if image_path == selected:
+                self.notebook.select(frame)
+
+    def refresh(self, replay):
+        # new match or new plots, rebuild the tabs only if the match's images changed and reload the selected one
+        with self.replay_lock:
+            self.replay = replay
+        images = match_images(replay)
+        if [image_path for image_path, _ in images] != list(self.tab_images.values()):
+            self.set_images(images)
+        self.show_selected()
+
+    def show_selected(self):
+        # load the selected tab's image, or check it's still current if it's already shown
+        if not self.notebook.select():
+            return
+        image_path = self.tab_images[self.notebook.select()]
+        self.image_loader.request(image_path, self.load_replay, self.on_loaded)
+
+    def on_loaded(self, image_path: str, decoded, error):
+        # loader thread, hand the image to the tk thread
+        self.loaded.put((image_path, decoded, error))
+        try:
+            self.window.event_generate('<<ImageLoaded>>', when='tail')
+        except (tk.TclError, RuntimeError):
+            # window was closed
+            pass
+
+    def show_loaded(self):
+        while not self.loaded.empty():
+            image_path, decoded, error = self.loaded.get()
+            if error is not None:
+                print(f"failed to load {image_path}: {error!r}")
+            for frame_name, tab_image in self.tab_images.items():
+                if tab_image == image_path:
+                    self.show_image(frame_name, decoded)
+
+    def show_image(self, frame_name: str, decoded):
+        label = self.tab_labels.get(frame_name)
+        if label is not None and getattr(label, 'decoded', None) is decoded:
+            # already showing this image
+            return
+        if label is None:
+            label = ttk.Label(self.notebook.nametowidget(frame_name))
+            label.pack(padx=10, pady=10)
+            self.tab_labels[frame_name] = label
+
+        if decoded is None:
+            label.config(image='', text="Nothing to plot.")
+            label.image = None
+        else:
+            photo = decoded.photo_image()
+            label.config(image=photo, text="")
+            label.image = photo  # Keep reference to avoid garbage collection
+        label.decoded = decoded
+
+    def exists(self) -> bool:
+        try:
+            return bool(self.window.winfo_exists())
+        except tk.TclError:
+            return False
+
+
+def worker_status(worker_event: WorkerEvent) -> str:
+    # status label text of a worker event
+    if worker_event.stage == "parse":
+        return "Computing Stats..."
+    if worker_event.stage == "compute":
+        return "Rendering Plots..."
+    if worker_event.stage == "render":
+        return "Finishing..."
+    if worker_event.stage == "done":
+        timings = ", ".join(f"{stage} {worker_event.timings[stage]:.2f}s" for stage in update_stages[:-1])
+        failed = f", {len(worker_event.errors)} failed" if len(worker_event.errors) > 0 else ""
+        slowest = f"\nSlowest: {worker_event.metrics.summary()}" if worker_event.metrics is not None else ""
+        return f"Updated Plots in {worker_event.elapsed:.2f}s ({timings}{failed}).{slowest}"
+    if worker_event.stage == "waiting":
+        return "Waiting for Match..."
+    if worker_event.stage == "error":
+        return "Failed to Update Plots."
+    return "Stopped."
 
 
 class MatchStatsUI:
     def __init__(self, master):
         self.master = master
 
-        # update_plots thread
-        self.thread = None
-        
-        # update_plots status queue
-        self.status_queue = queue.Queue()
+        # process pool that renders the plots, started with the first run of the worker
+        self.render_pool = None
+
+        # rendered images, the viewer reads them from here instead of the files
+        self.image_cache = ImageCache()
+
+        # rounds and images already rendered, unchanged ones are skipped
+        self.plot_cache = replay_stats.PlotCache(ImageSink(self.image_cache))
+
+        # most recent match, its rounds are only computed when they're plotted or viewed
+        self.replay = None
+
+        # worker events, handed to the tk thread by the <<WorkerEvent>> event
+        self.worker_events = queue.Queue()
 
-        # update_plots flag
-        self.keep_running = threading.Event()
-        self.keep_running.set()
+        # watches the replay file and updates the plots on one thread for the life of the ui
+        self.worker = MatchWorker(self.on_worker_event, self.plot_cache)
+
+        # decodes the viewer's images off the tk thread, decoded images are kept across viewer windows
+        self.image_loader = ImageLoader(self.image_cache, self.plot_cache)
+
+        # match plots window
+        self.viewer = None
 
-        # notebook for images
-        self.notebook = None
-        
         master.title("Replay Stats")
 
         # SF6 Path Label, Entry, Dialog Button
@@ -48,46 +314,19 @@ class MatchStatsUI:
         self.new_window_button = ttk.Button(master, text="View Recent Match Stats...", command=self.create_new_window)
         self.new_window_button.grid(row=2, column=2, columnspan=3, pady=20, padx=10, sticky='w')
 
-        # update_plots status flag
-        self.status_update = threading.Event()
+        # worker progress, sent from the worker and render pool threads
+        self.master.bind('<<WorkerEvent>>', lambda event: self.show_worker_events())
 
         # bind to destroy on_close
         self.master.bind('<Destroy>', self.on_close)
 
-    def add_notebook_ing(self, img_path, label):
-        try:
-            img = Image.open(img_path)
-            frame = ttk.Frame(self.notebook)
-            self.notebook.add(frame, text=label)
-
-            photo = ImageTk.PhotoImage(img)
-
-            label = ttk.Label(frame, image=photo)
-            label.image = photo  # Keep reference to avoid garbage collection
-            label.pack(padx=10, pady=10)
-        except FileNotFoundError:
-            print(f"missing {img_path}")
-            pass
-
     def create_new_window(self):
-        new_window = tk.Toplevel(self.master)
-        new_window.title("Match Plots")
-
-        self.notebook = ttk.Notebook(new_window)
-
-        for round_num in range(0, 4):
-            for player_num in range(1, 3):
-                image_path = f"stats_img/round{round_num}_player{player_num}_dmg.png"
-                label = f"Round {round_num} Player {player_num} Damage"
-                self.add_notebook_ing(image_path, label)
-            image_path = f"stats_img/round{round_num}_drive.png"
-            label = f"Round {int(round_num+1)} Drive Usage/Lost"
-            self.add_notebook_ing(image_path, label)
-        image_path = f'stats_img/match_stats.png'
-        label = f"Match Statistics"
-        self.add_notebook_ing(image_path, label)
-
-        self.notebook.pack(padx=10, pady=10, expand=True, fill=tk.BOTH)
+        # one viewer, opening it again brings it to the front
+        if self.viewer is not None and self.viewer.exists():
+            self.viewer.window.lift()
+            self.viewer.refresh(self.replay)
+            return
+        self.viewer = MatchViewer(self.master, self.image_loader, self.replay, self.sf6_entry.get())
 
     def browse_folder(self):
         folder_selected = filedialog.askdirectory()
@@ -96,85 +335,79 @@ class MatchStatsUI:
             self.sf6_entry.insert(0, folder_selected)  # update entry
 
     def on_start(self):
-        # change the button to "Stop"
-        self.start_button.config(text="Stop", command=self.on_stop)
+        # warm render workers
+        if self.render_pool is None:
+            self.render_pool = RenderPool()
 
-        # start the update_plots function in a separate thread
-        self.keep_running.set()
-        self.thread = threading.Thread(target=self.update_plots, args=(self.sf6_entry.get(),))
-        self.thread.start()
+        # the worker refuses a second run, so Start can never run two pipelines
+        if not self.worker.start(self.sf6_entry.get(), self.render_pool):
+            return
 
-        # check for updates
-        self.check_for_updates()
+        # change the button to "Stop"
+        self.start_button.config(text="Stop", command=self.on_stop)
+        self.status_label['text'] = "Starting..."
 
     def on_stop(self):
-        # update status queue
-        self.status_queue.put("Stopping...")
-        self.status_update.set()
-
-        # clear flag to stop update_plots
-        self.keep_running.clear()
+        # wakes the worker if it's waiting for a match and skips the rest of an update, "stopped" follows
+        self.worker.stop()
 
         # change the button back to "Start"
         self.start_button.config(text="Start", command=self.on_start)
-
-        # update status queue
-        self.status_queue.put("Stopped.")
-        self.status_update.set()
+        self.status_label['text'] = "Stopping..."
 
     def on_close(self, event=None):
-        # clear flag to stop update_plots
-        self.keep_running.clear()
-
-        # destroy main thread after wait
-        self.master.after(100, self.master.destroy)
-
-    def check_for_updates(self):
-        # while the queue isn't empy
-        while not self.status_queue.empty():
-            # get the new status
-            new_status = self.status_queue.get()
-            # update label with new status
-            self.status_label['text'] = new_status
-
-        # schedule next check_for_updates
-        self.master.after(100, self.check_for_updates)  # Check every 100ms
-
-    def update_plots(self, s6_path):
-        if replay_stats.replay_file_exists(filename=f"{s6_path}/reframework/data/{replay_stats.replay_name}"):
-            # load recent replay file
-            rounds_df, player_character = replay_stats.load_recent_file(s6_path)
-
-            # update status
-            self.status_queue.put("Updating Plots...")
-            self.status_update.set()
-            # write plots
-            replay_stats.update_plots(rounds_df, player_character)
-            # update status
-            self.status_queue.put("Updated Plots.")
-            self.status_update.set()
-
-        # while flag is set
-        while self.keep_running.is_set():
-            # update status
-            self.status_queue.put("Waiting for Match...")
-            self.status_update.set()
-            # wait for new match file
-            replay_stats.watch_file_for_changes(filename=f"{s6_path}/reframework/data/{replay_stats.replay_name}")
-
-            # update status
-            self.status_queue.put("Updating Plots...")
-            self.status_update.set()
-            # write plots
-            rounds_df, player_character = replay_stats.load_recent_file(s6_path)
-            replay_stats.update_plots(rounds_df, player_character)
-
-            # update status
-            self.status_queue.put("Updated Plots.")
-            self.status_update.set()
+        # <Destroy> is sent for every child of the window too
+        if event is not None and event.widget is not self.master:
+            return
+
+        # stop the worker thread
+        self.worker.shutdown()
+        self.image_loader.shutdown()
+
+        # stop the render workers
+        if self.render_pool is not None:
+            self.render_pool.shutdown(wait=False)
+            self.render_pool = None
+
+    def on_worker_event(self, worker_event: WorkerEvent):
+        # worker or render pool thread, wake the tk thread
+        self.worker_events.put(worker_event)
+        try:
+            self.master.event_generate('<<WorkerEvent>>', when='tail')
+        except (tk.TclError, RuntimeError):
+            # ui was closed
+            pass
+
+    def show_worker_events(self):
+        while not self.worker_events.empty():
+            worker_event = self.worker_events.get()
+            if worker_event.stage == "parse":
+                self.replay = worker_event.replay
+            elif worker_event.stage == "done":
+                for error in worker_event.errors:
+                    print(f"failed to render plot: {error!r}")
+                # show the new plots in the open viewer
+                if self.viewer is not None and self.viewer.exists():
+                    self.viewer.refresh(self.replay)
+            elif worker_event.stage == "error":
+                print(f"failed to update plots: {worker_event.errors[0]!r}")
+            elif worker_event.stage == "stopped":
+                if self.worker.watcher is not None:
+                    # a stopped run finishing after the next one started
+                    continue
+                # the worker may have stopped by itself
+                self.start_button.config(text="Start", command=self.on_start)
+            self.status_label['text'] = worker_status(worker_event)
 
 
 if __name__ == "__main__":
+    # render workers re-run this module in the frozen exe
+    multiprocessing.freeze_support()
+
+    # stage timings for the status line, SF6_STATS_METRICS and SF6_STATS_PROFILE also log and profile them
+    if replay_metrics.enable_from_env() is None:
+        replay_metrics.enable()
+
     root = tk.Tk()
     app = MatchStatsUI(root)
     root.mainloop()
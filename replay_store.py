@@ -0,0 +1,457 @@
+import datetime
+import os
+import sqlite3
+
+from replay_config import default_store_path
+
+schema = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    match_key TEXT NOT NULL UNIQUE,
+    replay TEXT,
+    played_at TEXT NOT NULL,
+    p1_character TEXT NOT NULL,
+    p2_character TEXT NOT NULL,
+    rounds INTEGER NOT NULL
+);
+
+-- damage dealt by player, per opening action of each damaging sequence
+CREATE TABLE IF NOT EXISTS damage (
+    match_id INTEGER NOT NULL REFERENCES matches(id) ON DELETE CASCADE,
+    round INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    character TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    action_name TEXT,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL
+);
+
+-- drive lost by player, category is DEF/DAMAGE with the enemy action, or SPECIAL with the player's action
+CREATE TABLE IF NOT EXISTS drive (
+    match_id INTEGER NOT NULL REFERENCES matches(id) ON DELETE CASCADE,
+    round INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    character TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    category TEXT NOT NULL,
+    action_name TEXT,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL
+);
+
+-- action count metrics like perfect parries and throw breaks
+CREATE TABLE IF NOT EXISTS metrics (
+    match_id INTEGER NOT NULL REFERENCES matches(id) ON DELETE CASCADE,
+    round INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    character TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value INTEGER NOT NULL
+);
+
+-- action names of the routes, routes are stored as their ids
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+-- the attacker's route through each damaging sequence, the action ids in order of first use like '12,4,31,'
+CREATE TABLE IF NOT EXISTS sequences (
+    match_id INTEGER NOT NULL REFERENCES matches(id) ON DELETE CASCADE,
+    round INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    character TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    frame INTEGER NOT NULL,
+    route TEXT NOT NULL,
+    damage REAL NOT NULL
+);
+
+-- every route prefix up to max_prefix_actions long per matchup, kept up to date as matches are added or replaced,
+-- sequences and damage are every sequence through the prefix, ended and ended_damage the ones whose whole route
+-- is the prefix
+CREATE TABLE IF NOT EXISTS route_prefixes (
+    character TEXT NOT NULL,
+    opponent TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    sequences INTEGER NOT NULL,
+    damage REAL NOT NULL,
+    ended INTEGER NOT NULL,
+    ended_damage REAL NOT NULL,
+    PRIMARY KEY (character, opponent, prefix)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS matches_played_at ON matches(played_at);
+CREATE INDEX IF NOT EXISTS matches_matchup ON matches(p1_character, p2_character);
+CREATE INDEX IF NOT EXISTS damage_character ON damage(character, opponent, action_name);
+CREATE INDEX IF NOT EXISTS damage_action_name ON damage(action_name);
+CREATE INDEX IF NOT EXISTS damage_match ON damage(match_id);
+CREATE INDEX IF NOT EXISTS drive_character ON drive(character, opponent, category, action_name);
+CREATE INDEX IF NOT EXISTS drive_match ON drive(match_id);
+CREATE INDEX IF NOT EXISTS metrics_character ON metrics(character, opponent, metric);
+CREATE INDEX IF NOT EXISTS metrics_match ON metrics(match_id);
+CREATE INDEX IF NOT EXISTS sequences_match ON sequences(match_id);
+CREATE INDEX IF NOT EXISTS route_prefixes_prefix ON route_prefixes(prefix);
+
+-- per match totals
+CREATE VIEW IF NOT EXISTS match_damage AS
+    SELECT match_id, player, character, opponent, action_name, SUM(count) AS count, SUM(total) AS total
+    FROM damage GROUP BY match_id, player, action_name;
+CREATE VIEW IF NOT EXISTS match_drive AS
+    SELECT match_id, player, character, opponent, category, action_name, SUM(count) AS count, SUM(total) AS total
+    FROM drive GROUP BY match_id, player, category, action_name;
+CREATE VIEW IF NOT EXISTS match_metrics AS
+    SELECT match_id, player, character, opponent, metric, SUM(value) AS value
+    FROM metrics GROUP BY match_id, player, metric;
+"""
+
+
+# longest route prefix in the index, longer routes are only counted through their first actions
+max_prefix_actions = 8
+
+# adds the sequences of a match to a prefix, or removes them with negative values
+upsert_route_prefix = (
+    "INSERT INTO route_prefixes VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (character, opponent, prefix) DO UPDATE SET sequences = sequences + excluded.sequences, "
+    "damage = damage + excluded.damage, ended = ended + excluded.ended, "
+    "ended_damage = ended_damage + excluded.ended_damage")
+
+
+def encode_route(action_ids: list) -> str:
+    # the trailing comma keeps '12,' from matching '123,' in prefix range scans
+    return "".join(f"{action_id}," for action_id in action_ids)
+
+
+def prefix_range(prefix: str) -> tuple:
+    # (low, high) of the routes starting with an encoded prefix, ',' sorts right before '-'
+    return prefix, prefix[:-1] + "-"
+
+
+def route_prefix_rows(sequence_rows: list, sign: int) -> list:
+    # route_prefixes rows of (character, opponent, route, damage) sequences, sign -1 to remove them
+    prefixes = {}
+    for character, opponent, route, damage in sequence_rows:
+        action_ids = route.split(",")[:-1]
+        for length in range(1, min(len(action_ids), max_prefix_actions) + 1):
+            key = (character, opponent, encode_route(action_ids[:length]))
+            prefix = prefixes.setdefault(key, [length, 0, 0.0, 0, 0.0])
+            prefix[1] += sign
+            prefix[2] += sign * damage
+            if length == len(action_ids):
+                prefix[3] += sign
+                prefix[4] += sign * damage
+    return [key + tuple(prefix) for key, prefix in prefixes.items()]
+
+
+def other_player(player: str) -> str:
+    return "2" if player == "1" else "1"
+
+
+def stats_key(value):
+    # nan action names are stored as NULL
+    return None if value != value else value
+
+
+class StatsStore:
+    # sqlite store of per round stats across matches
+    def __init__(self, path: str = default_store_path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(schema)
+
+        # action name: id of the names already in the actions table
+        self.action_ids = {}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_match(self, match_key: str, match_stats: dict, player_character: dict, played_at: datetime.datetime = None,
+                  replay: str = None) -> int:
+        # store the stats from replay_stats.create_match_stats, a match already stored under match_key is replaced
+        played_at = (played_at or datetime.datetime.now()).isoformat(sep=" ", timespec="seconds")
+
+        damage_rows = []
+        drive_rows = []
+        metric_rows = []
+        sequence_rows = []
+        for round_num, round_stats in match_stats.items():
+            # damage stats are keyed by the damaged player, the damage was dealt by the other player
+            for damaged_player, damage_stats in round_stats["damage"].items():
+                player = other_player(damaged_player)
+                for action_name, action_stats in damage_stats.items():
+                    damage_rows.append((int(round_num), player, player_character[player],
+                                        player_character[damaged_player], stats_key(action_name),
+                                        int(action_stats["count"]), float(action_stats["total"])))
+
+            for player, drive_stats in round_stats["drive"].items():
+                character = player_character[player]
+                opponent = player_character[other_player(player)]
+                for stat_name, stat in drive_stats.items():
+                    if stat_name in ['DEF', 'DAMAGE']:
+                        # drive lost to each enemy action, the 'total' is the sum of them
+                        for enemy_action_name, enemy_stats in stat.items():
+                            if enemy_action_name == 'total':
+                                continue
+                            drive_rows.append((int(round_num), player, character, opponent, stat_name,
+                                               stats_key(enemy_action_name), int(enemy_stats["count"]),
+                                               float(enemy_stats["total"])))
+                    else:
+                        drive_rows.append((int(round_num), player, character, opponent, 'SPECIAL',
+                                           stats_key(stat_name), int(stat["count"]), float(stat["total"])))
+
+            for metric, player_values in round_stats["metrics"].items():
+                for player, value in player_values.items():
+                    metric_rows.append((int(round_num), player, player_character[player],
+                                        player_character[other_player(player)], metric, int(value)))
+
+            # routes are keyed by the damaged player like the damage stats
+            for damaged_player, routes in round_stats.get("routes", {}).items():
+                player = other_player(damaged_player)
+                for route in routes:
+                    sequence_rows.append((int(round_num), player, player_character[player],
+                                          player_character[damaged_player], int(route["frame"]), route["route"],
+                                          float(route["damage"])))
+
+        with self.connection:
+            # take the replaced match's sequences out of the route index before they're deleted with it
+            replaced_rows = self.query(
+                "SELECT sequences.character, sequences.opponent, sequences.route, sequences.damage FROM sequences "
+                "JOIN matches ON matches.id = sequences.match_id WHERE matches.match_key = ?", (match_key,))
+            self.connection.execute("DELETE FROM matches WHERE match_key = ?", (match_key,))
+            match_id = self.connection.execute(
+                "INSERT INTO matches (match_key, replay, played_at, p1_character, p2_character, rounds) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (match_key, replay, played_at, player_character["1"], player_character["2"], len(match_stats))
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT INTO damage VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(match_id,) + row for row in damage_rows])
+            self.connection.executemany(
+                "INSERT INTO drive VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [(match_id,) + row for row in drive_rows])
+            self.connection.executemany(
+                "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?)", [(match_id,) + row for row in metric_rows])
+
+            action_ids = self.intern_actions({name for row in sequence_rows for name in row[5]})
+            sequence_rows = [row[:5] + (encode_route([action_ids[name] for name in row[5]]),) + row[6:]
+                             for row in sequence_rows]
+            self.connection.executemany(
+                "INSERT INTO sequences VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(match_id,) + row for row in sequence_rows])
+            self.update_route_prefixes(replaced_rows, [(row[2], row[3], row[5], row[6]) for row in sequence_rows])
+
+        # only cached once committed, ids of a rolled back transaction aren't in the actions table
+        self.action_ids.update(action_ids)
+        return match_id
+
+    def intern_actions(self, names: set) -> dict:
+        # action name: id of names, adding the names that aren't in the actions table yet, the caller caches the new
+        # ids once its transaction commits
+        action_ids = {name: self.action_ids[name] for name in names if name in self.action_ids}
+        new_names = [name for name in names if name not in action_ids]
+        if len(new_names) > 0:
+            self.connection.executemany("INSERT OR IGNORE INTO actions (name) VALUES (?)",
+                                        [(name,) for name in new_names])
+            action_ids.update(self.query(
+                f"SELECT name, id FROM actions WHERE name IN ({', '.join('?' * len(new_names))})", new_names))
+        return action_ids
+
+    def update_route_prefixes(self, removed_rows: list, added_rows: list):
+        # apply the sequences of a replaced and an added match to the route index, the prefixes of one matchup are
+        # only touched by matches of that matchup
+        prefix_rows = route_prefix_rows(removed_rows, -1) + route_prefix_rows(added_rows, 1)
+        self.connection.executemany(upsert_route_prefix, prefix_rows)
+        if len(removed_rows) > 0:
+            self.connection.execute("DELETE FROM route_prefixes WHERE sequences <= 0")
+
+    def action_names(self) -> dict:
+        # action id: name
+        return {action_id: name for action_id, name in self.query("SELECT id, name FROM actions")}
+
+    def encode_actions(self, action_names: list):
+        # encoded route prefix of action names, None if one was never stored
+        action_ids = dict(self.query(
+            f"SELECT name, id FROM actions WHERE name IN ({', '.join('?' * len(action_names))})", action_names))
+        if any(name not in action_ids for name in action_names):
+            return None
+        return encode_route([action_ids[name] for name in action_names])
+
+    def decode_route(self, route: str, action_names: dict) -> str:
+        return " > ".join(action_names[int(action_id)] for action_id in route.split(",")[:-1])
+
+    def prefix_filters(self, character: str = None, opponent: str = None, starting_with: str = None) -> tuple:
+        # where clause and params of route_prefixes rows, starting_with is an encoded prefix
+        clauses = []
+        params = []
+        for column, value in [("character", character), ("opponent", opponent)]:
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if starting_with:
+            clauses.append("prefix >= ? AND prefix < ?")
+            params.extend(prefix_range(starting_with))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def damage_routes(self, character: str = None, opponent: str = None, starting_with: list = None,
+                      min_sequences: int = 1, limit: int = 50) -> list:
+        # (route, sequences, total damage, average damage) of whole routes starting with the action names in
+        # starting_with, most damaging on average first, routes over max_prefix_actions aren't included
+        encoded_prefix = None
+        if starting_with:
+            encoded_prefix = self.encode_actions(starting_with)
+            if encoded_prefix is None:
+                # no route starts with an action that was never stored
+                return []
+        where, params = self.prefix_filters(character, opponent, encoded_prefix)
+        where = f"{where} AND ended > 0" if where else " WHERE ended > 0"
+        rows = self.query(
+            "SELECT prefix, SUM(ended), SUM(ended_damage), SUM(ended_damage) / SUM(ended) "
+            f"FROM route_prefixes{where} GROUP BY prefix HAVING SUM(ended) >= ? "
+            "ORDER BY SUM(ended_damage) / SUM(ended) DESC, SUM(ended) DESC LIMIT ?",
+            params + [max(min_sequences, 1), limit])
+        action_names = self.action_names()
+        return [(self.decode_route(route, action_names),) + tuple(row) for route, *row in rows]
+
+    def route_drops(self, route: list, character: str = None, opponent: str = None, limit: int = 50) -> list:
+        # how often sequences through route end there (dropped) instead of continuing, as (next action, sequences,
+        # share of the sequences through route, average damage) with None as the next action of the ones that
+        # ended, most common first
+        encoded_route = self.encode_actions(route) if route else None
+        if encoded_route is None or len(route) > max_prefix_actions:
+            return []
+        where, params = self.prefix_filters(character, opponent)
+        where = f"{where} AND " if where else " WHERE "
+        through = self.query(
+            f"SELECT SUM(sequences), SUM(ended), SUM(ended_damage) FROM route_prefixes{where}prefix = ?",
+            params + [encoded_route])[0]
+        if not through[0]:
+            return []
+        rows = [(None, through[1], through[1] / through[0], through[2] / through[1] if through[1] else 0.0)]
+
+        if len(route) < max_prefix_actions:
+            next_rows = self.query(
+                "SELECT prefix, SUM(sequences), SUM(damage) / SUM(sequences) "
+                f"FROM route_prefixes{where}prefix >= ? AND prefix < ? AND length = ? GROUP BY prefix",
+                params + list(prefix_range(encoded_route)) + [len(route) + 1])
+            action_names = self.action_names()
+            rows.extend((action_names[int(prefix.split(",")[-2])], sequences, sequences / through[0], damage)
+                        for prefix, sequences, damage in next_rows)
+        return sorted(rows, key=lambda row: row[1], reverse=True)[:limit]
+
+    def query(self, sql: str, params=()) -> list:
+        return self.connection.execute(sql, params).fetchall()
+
+    def filters(self, table: str, character: str = None, opponent: str = None, action_name: str = None,
+                since: str = None, until: str = None) -> tuple:
+        # where clause and params shared by the stat queries, action_name may use sql LIKE wildcards
+        clauses = []
+        params = []
+        for column, value in [("character", character), ("opponent", opponent)]:
+            if value is not None:
+                clauses.append(f"{table}.{column} = ?")
+                params.append(value)
+        if action_name is not None:
+            clauses.append(f"{table}.action_name LIKE ?")
+            params.append(action_name)
+        if since is not None:
+            clauses.append("matches.played_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("matches.played_at < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def damage_by_action(self, character: str = None, opponent: str = None, action_name: str = None,
+                         since: str = None, until: str = None, limit: int = 50) -> list:
+        # (action name, matches, count, total damage, average damage per sequence) most damaging first
+        where, params = self.filters("damage", character, opponent, action_name, since, until)
+        return self.query(
+            "SELECT damage.action_name, COUNT(DISTINCT damage.match_id), SUM(damage.count), SUM(damage.total), "
+            "SUM(damage.total) / SUM(damage.count) "
+            f"FROM damage JOIN matches ON matches.id = damage.match_id{where} "
+            "GROUP BY damage.action_name ORDER BY SUM(damage.total) DESC LIMIT ?", params + [limit])
+
+    def drive_by_action(self, character: str = None, opponent: str = None, action_name: str = None,
+                        since: str = None, until: str = None, limit: int = 50) -> list:
+        # (category, action name, matches, count, total drive lost) most drive lost first
+        where, params = self.filters("drive", character, opponent, action_name, since, until)
+        return self.query(
+            "SELECT drive.category, drive.action_name, COUNT(DISTINCT drive.match_id), SUM(drive.count), "
+            "SUM(drive.total) "
+            f"FROM drive JOIN matches ON matches.id = drive.match_id{where} "
+            "GROUP BY drive.category, drive.action_name ORDER BY SUM(drive.total) DESC LIMIT ?", params + [limit])
+
+    def metric_totals(self, character: str = None, opponent: str = None, since: str = None,
+                      until: str = None) -> list:
+        # (metric, matches, total, average per match)
+        where, params = self.filters("metrics", character, opponent, None, since, until)
+        return self.query(
+            "SELECT metrics.metric, COUNT(DISTINCT metrics.match_id), SUM(metrics.value), "
+            "CAST(SUM(metrics.value) AS REAL) / COUNT(DISTINCT metrics.match_id) "
+            f"FROM metrics JOIN matches ON matches.id = metrics.match_id{where} "
+            "GROUP BY metrics.metric ORDER BY metrics.metric", params)
+
+    def matches(self, character: str = None, opponent: str = None, since: str = None, until: str = None,
+                limit: int = 50) -> list:
+        # (played at, p1 character, p2 character, rounds, replay) most recent first
+        clauses = []
+        params = []
+        if character is not None:
+            clauses.append("(p1_character = ? OR p2_character = ?)")
+            params.extend([character, character])
+        if opponent is not None:
+            clauses.append("(p1_character = ? OR p2_character = ?)")
+            params.extend([opponent, opponent])
+        if since is not None:
+            clauses.append("played_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("played_at < ?")
+            params.append(until)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        return self.query(
+            f"SELECT played_at, p1_character, p2_character, rounds, replay FROM matches{where} "
+            "ORDER BY played_at DESC LIMIT ?", params + [limit])
+
+
+def print_rows(headers: list, rows: list):
+    # plain text table
+    cells = [[str(header) for header in headers]] + [
+        [f"{value:.1f}" if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(row[col]) for row in cells) for col in range(len(headers))]
+    for row in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def run_query(store_path: str, kind: str, character: str = None, opponent: str = None, action_name: str = None,
+              since: str = None, until: str = None, limit: int = 50, route: str = None):
+    # route is comma separated action names
+    route = route.split(",") if route else None
+    with StatsStore(store_path) as store:
+        if kind == "damage":
+            print_rows(["action", "matches", "count", "total", "avg"],
+                       store.damage_by_action(character, opponent, action_name, since, until, limit))
+        elif kind == "drive":
+            print_rows(["category", "action", "matches", "count", "total"],
+                       store.drive_by_action(character, opponent, action_name, since, until, limit))
+        elif kind == "metrics":
+            print_rows(["metric", "matches", "total", "per match"],
+                       store.metric_totals(character, opponent, since, until))
+        elif kind == "matches":
+            print_rows(["played at", "p1", "p2", "rounds", "replay"],
+                       store.matches(character, opponent, since, until, limit))
+        elif kind == "routes":
+            print_rows(["route", "count", "total", "avg"], store.damage_routes(character, opponent, route, 1, limit))
+        elif kind == "drops":
+            print_rows(["next action", "count", "share", "avg"],
+                       [(next_action or "(dropped)",) + tuple(row)
+                        for next_action, *row in store.route_drops(route, character, opponent, limit)])
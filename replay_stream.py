@@ -0,0 +1,192 @@
+import array
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import replay_stats
+
+# newline delimited frames written by capture_match.lua when streaming is enabled
+stream_name = 'recent_replay_stream.ndjson'
+
+
+class RoundColumns:
+    # typed column buffers of one round, appended to as frames arrive
+    def __init__(self, player_tags):
+        self.frames = array.array('q')
+        self.columns = {
+            f"{player_tag}_{col_name}": array.array(np.dtype(col_type).char)
+            for player_tag in player_tags for col_name, col_type in replay_stats.keep_columns.items()
+        }
+
+    def append(self, frame_idx: int, frame_data: dict):
+        self.frames.append(frame_idx)
+        for player_tag, player_data in frame_data.items():
+            for col_name in replay_stats.keep_columns.keys():
+                self.columns[f"{player_tag}_{col_name}"].append(player_data[col_name])
+
+    def __len__(self):
+        return len(self.frames)
+
+    def to_df(self) -> pd.DataFrame:
+        # copy the buffers so they can keep growing, sorted by frame like create_round_df
+        df = pd.DataFrame({
+            col_name: np.array(column, dtype=replay_stats.keep_columns[col_name.split("_", 1)[1]])
+            for col_name, column in self.columns.items()
+        }, index=np.array(self.frames, dtype=np.int64))
+
+        # a frame written twice keeps the last write, like the lua replay table
+        df = df[~df.index.duplicated(keep='last')]
+        return df.sort_index()
+
+
+class StreamingReplayReader:
+    # tails the streamed frames of the current match and keeps the round columns up to date
+    def __init__(self, stream_path: str):
+        self.stream_path = stream_path
+        self.offset = 0
+        self.partial_line = b""
+
+        # (device, inode) and first line of the file being read, a new match truncates or replaces the file and its
+        # first line has the time the match started
+        self.file_id = None
+        self.first_line = None
+
+        # lines that weren't valid json
+        self.skipped_lines = 0
+
+        # incremented on each new match
+        self.match_number = 0
+        self.reset_match()
+
+    def reset_match(self):
+        self.match_number += 1
+        self.player_data = {}
+        self.rounds = {}
+        self.ended = False
+
+    def restart(self):
+        # read a new match's file from the start
+        self.offset = 0
+        self.partial_line = b""
+        self.first_line = None
+        self.reset_match()
+
+    def poll(self) -> int:
+        # read new lines from the stream, returns the number of frames read
+        try:
+            with open(self.stream_path, 'rb') as stream_file:
+                stat = os.fstat(stream_file.fileno())
+                file_id = (stat.st_dev, stat.st_ino)
+                first_line = stream_file.readline()
+
+                # the file was replaced or truncated for a new match, it can already be longer than the offset
+                if self.offset > 0 and (file_id != self.file_id or stat.st_size < self.offset or
+                                        (self.first_line is not None and first_line != self.first_line)):
+                    self.restart()
+                self.file_id = file_id
+                if self.first_line is None and first_line.endswith(b"\n"):
+                    self.first_line = first_line
+
+                stream_file.seek(self.offset)
+                data = stream_file.read()
+        except FileNotFoundError:
+            return 0
+        self.offset += len(data)
+
+        # the last line may be partially written, keep it for the next poll
+        lines = (self.partial_line + data).split(b"\n")
+        self.partial_line = lines.pop()
+
+        frame_count = 0
+        for line in lines:
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a corrupt line loses one frame, not the stream
+                    self.skipped_lines += 1
+                    print(f"skipped invalid stream line: {line[:80]!r}")
+                    continue
+                frame_count += self.read_record(record)
+        return frame_count
+
+    def read_record(self, record: dict) -> int:
+        if "reset" in record:
+            if record["reset"] == "match":
+                self.reset_match()
+            elif record["reset"] == "round":
+                # the round restarted, drop its frames
+                self.rounds.pop(int(record["round"]), None)
+            return 0
+        if "player_data" in record:
+            self.player_data = record["player_data"]
+            return 0
+        if "end" in record:
+            self.ended = True
+            return 0
+
+        round_num = int(record["round"])
+        frame_data = {player_tag: record[player_tag] for player_tag in ["p1", "p2"]}
+        round_columns = self.rounds.get(round_num)
+        if round_columns is None:
+            round_columns = self.rounds[round_num] = RoundColumns(frame_data.keys())
+        round_columns.append(int(record["frame"]), frame_data)
+        return 1
+
+    def finished_rounds(self) -> list:
+        # numbers of the rounds before the one being played, their frames only change if the round restarts
+        round_nums = sorted(round_num for round_num, round_columns in self.rounds.items() if len(round_columns) > 0)
+        return round_nums if self.ended else round_nums[:-1]
+
+    def replay(self, round_nums: list = None) -> replay_stats.Replay:
+        # the frames read so far, or of round_nums, as a Replay, the derived columns are computed when used
+        round_frames = {round_num: round_columns.to_df for round_num, round_columns in sorted(self.rounds.items())
+                        if len(round_columns) > 0 and (round_nums is None or round_num in round_nums)}
+        return replay_stats.Replay(round_frames, replay_stats.player_characters(self.player_data))
+
+
+def stream(sf6_path: str, render_workers: int = None, store_path: str = None):
+    from replay_render import RenderPool
+    from replay_store import StatsStore
+    from replay_watcher import ReplayWatcher
+
+    stream_path = f"{sf6_path}/reframework/data/{stream_name}"
+    render_pool = RenderPool(render_workers)
+    plot_cache = replay_stats.PlotCache()
+    stats_store = StatsStore(store_path) if store_path is not None else None
+
+    # wake up on each write to the stream
+    watcher = ReplayWatcher(stream_path, poll_interval=0.1)
+    reader = StreamingReplayReader(stream_path)
+
+    # match number of the last plotted match, and the match and rounds whose stats are in the plot cache
+    plotted_match = None
+    stats_rounds = None
+    try:
+        print(f"streaming frames ({watcher.backend})...")
+        while True:
+            reader.poll()
+
+            # the stats of each round are computed once the next round starts and kept in the plot cache, at match
+            # end only the last round's stats and the rendering are left
+            finished_rounds = (reader.match_number, reader.finished_rounds())
+            if not reader.ended and len(finished_rounds[1]) > 0 and finished_rounds != stats_rounds:
+                stats_rounds = finished_rounds
+                finished_replay = reader.replay(finished_rounds[1])
+                replay_stats.create_match_stats(finished_replay, finished_replay.player_character, plot_cache)
+
+            if reader.ended and reader.match_number != plotted_match:
+                plotted_match = reader.match_number
+                replay_stats.update_plots(reader.replay(), render_pool, replay_stats.print_plots_updated, plot_cache,
+                                          stats_store)
+
+            # wait for the next write to the stream
+            if not watcher.wait_for_event():
+                break
+    finally:
+        watcher.close()
+        render_pool.shutdown()
+        if stats_store is not None:
+            stats_store.close()
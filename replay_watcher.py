@@ -0,0 +1,166 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+# inotify event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# inotify_event header: wd, mask, cookie, len
+inotify_event_header = struct.Struct("iIII")
+
+
+def file_signature(filename: str):
+    # mtime and size of the file, None if it doesn't exist
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_libc():
+    # libc with inotify, None if not on linux
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class ReplayWatcher:
+    # waits for the replay file to be rewritten, with inotify on linux and mtime polling everywhere else
+    def __init__(self, filename: str, poll_interval: float = 1.0, settle_interval: float = 0.05):
+        self.filename = os.path.abspath(filename)
+        self.poll_interval = poll_interval
+        self.settle_interval = settle_interval
+
+        # set when cancel is called, wait_for_change returns False from then on
+        self.cancelled = threading.Event()
+
+        # signature of the last version of the file that was handed out
+        self.signature = file_signature(self.filename)
+
+        # inotify fd and a pipe to wake up select on cancel, the lock stops cancel writing to a closed pipe
+        self.inotify_fd = None
+        self.wake_r, self.wake_w = os.pipe()
+        self.fd_lock = threading.Lock()
+        self.open_inotify()
+
+    def open_inotify(self):
+        libc = load_libc()
+        replay_dir = os.path.dirname(self.filename)
+        if libc is None or not os.path.isdir(replay_dir):
+            return
+
+        inotify_fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if inotify_fd < 0:
+            return
+
+        # watch the directory, the file may not exist yet or may be replaced
+        watch_mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(inotify_fd, os.fsencode(replay_dir), watch_mask) < 0:
+            os.close(inotify_fd)
+            return
+        self.inotify_fd = inotify_fd
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self.inotify_fd is not None else "polling"
+
+    def read_inotify_events(self) -> bool:
+        # drain pending events, True if any of them were for the replay file
+        replay_name = os.fsencode(os.path.basename(self.filename))
+        touched = False
+        while True:
+            try:
+                buffer = os.read(self.inotify_fd, 64 * 1024)
+            except BlockingIOError:
+                return touched
+
+            offset = 0
+            while offset < len(buffer):
+                _, _, _, name_len = inotify_event_header.unpack_from(buffer, offset)
+                offset += inotify_event_header.size
+                name = buffer[offset:offset + name_len].rstrip(b"\0")
+                offset += name_len
+                if name == replay_name:
+                    touched = True
+
+    def wait_for_event(self, timeout=None) -> bool:
+        # block until the replay file may have changed, False if cancelled
+        if self.inotify_fd is None:
+            return not self.cancelled.wait(self.poll_interval if timeout is None else timeout)
+
+        while not self.cancelled.is_set():
+            ready, _, _ = select.select([self.inotify_fd, self.wake_r], [], [], timeout)
+            if self.wake_r in ready or self.cancelled.is_set():
+                return False
+            if not ready:
+                # timed out
+                return True
+            if self.read_inotify_events():
+                return True
+        return False
+
+    def wait_until_settled(self) -> bool:
+        # wait until the size and mtime stop changing so the writer is done, False if cancelled
+        signature = file_signature(self.filename)
+        while not self.cancelled.is_set():
+            if self.inotify_fd is None:
+                if self.cancelled.wait(self.settle_interval):
+                    return False
+            else:
+                # new events restart the wait, a quiet settle interval means the write is done
+                self.wait_for_event(timeout=self.settle_interval)
+            settled_signature = file_signature(self.filename)
+            if settled_signature == signature:
+                return True
+            signature = settled_signature
+        return False
+
+    def wait_for_change(self) -> bool:
+        # block until a new, fully written version of the file exists, False if cancelled
+        while not self.cancelled.is_set():
+            signature = file_signature(self.filename)
+            if signature is not None and signature != self.signature:
+                if not self.wait_until_settled():
+                    return False
+
+                # hand out the settled version
+                signature = file_signature(self.filename)
+                if signature is not None:
+                    self.signature = signature
+                    return True
+            elif not self.wait_for_event():
+                return False
+        return False
+
+    def cancel(self):
+        # wake up and stop any wait_for_change, safe to call from any thread
+        self.cancelled.set()
+        with self.fd_lock:
+            if self.wake_w is not None:
+                os.write(self.wake_w, b"\0")
+
+    def close(self):
+        self.cancel()
+        with self.fd_lock:
+            for fd in [self.inotify_fd, self.wake_r, self.wake_w]:
+                if fd is not None:
+                    os.close(fd)
+            self.inotify_fd = None
+            self.wake_r = None
+            self.wake_w = None
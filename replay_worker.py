@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+
+import replay_metrics
+import replay_stats
+from replay_store import StatsStore
+from replay_watcher import ReplayWatcher
+
+# stages of a plot update, each one sends an event with its time when it finishes
+update_stages = ["parse", "compute", "render", "done"]
+
+
+class WorkerEvent:
+    # progress of the worker, sent to on_event from the worker or render pool threads
+    # stage is one of update_stages, or "waiting", "stopped", "error"
+    def __init__(self, stage: str, elapsed: float = None, timings: dict = None, replay=None, errors: list = None,
+                 metrics: replay_metrics.MatchMetrics = None):
+        self.stage = stage
+
+        # seconds the stage took, and every stage's time on the done event
+        self.elapsed = elapsed
+        self.timings = timings
+
+        # the match that was parsed, on the parse event
+        self.replay = replay
+
+        # render errors on the done event, the exception on an error event
+        self.errors = errors if errors is not None else []
+
+        # stages of the match on the done event, None when instrumentation is disabled
+        self.metrics = metrics
+
+
+class MatchWorker:
+    # one long lived thread that watches the replay file and updates the plots, started and stopped from the ui
+    # each run's ReplayWatcher is its cancellation token, cancelling it wakes the thread and skips remaining stages
+    def __init__(self, on_event, plot_cache: replay_stats.PlotCache = None):
+        self.on_event = on_event
+        self.plot_cache = plot_cache
+
+        # (sf6 path, render pool, watcher) of each run, None stops the thread
+        self.commands = queue.Queue()
+
+        # watcher of the current run, None when stopped
+        self.watcher = None
+        self.lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self.run, name="match-worker", daemon=True)
+        self.thread.start()
+
+    def start(self, sf6_path: str, render_pool=None) -> bool:
+        # False if a run is already going, runs queue behind a stopped run that is still finishing
+        with self.lock:
+            if self.watcher is not None:
+                return False
+
+            # start watching now so a change while the previous run finishes isn't missed
+            self.watcher = ReplayWatcher(f"{sf6_path}/reframework/data/{replay_stats.replay_name}")
+            self.commands.put((sf6_path, render_pool, self.watcher))
+        return True
+
+    def stop(self):
+        with self.lock:
+            if self.watcher is not None:
+                self.watcher.cancel()
+                self.watcher = None
+
+    def shutdown(self):
+        self.stop()
+        self.commands.put(None)
+
+    def run(self):
+        # idle until started, nothing polls
+        while True:
+            command = self.commands.get()
+            if command is None:
+                return
+            sf6_path, render_pool, watcher = command
+            try:
+                self.watch(sf6_path, render_pool, watcher)
+            except Exception as e:
+                self.on_event(WorkerEvent("error", errors=[e]))
+            finally:
+                watcher.close()
+                with self.lock:
+                    # ended by itself, let it be started again
+                    if self.watcher is watcher:
+                        self.watcher = None
+                self.on_event(WorkerEvent("stopped"))
+
+    def watch(self, sf6_path: str, render_pool, watcher: ReplayWatcher):
+        replay_path = f"{sf6_path}/reframework/data/{replay_stats.replay_name}"
+
+        # cross match stats, sqlite connections stay on the thread that opened them
+        stats_store = StatsStore()
+        try:
+            if replay_stats.replay_file_exists(filename=replay_path) and not watcher.cancelled.is_set():
+                self.update(sf6_path, render_pool, watcher, stats_store)
+
+            while not watcher.cancelled.is_set():
+                self.on_event(WorkerEvent("waiting"))
+                # wait for new match file, stop if the watcher was cancelled
+                if not watcher.wait_for_change():
+                    break
+                self.update(sf6_path, render_pool, watcher, stats_store)
+        finally:
+            stats_store.close()
+
+    def update(self, sf6_path: str, render_pool, watcher: ReplayWatcher, stats_store: StatsStore):
+        replay_path = f"{sf6_path}/reframework/data/{replay_stats.replay_name}"
+        timings = {}
+        try:
+            # rounds are read lazily, parse covers the player data and round index
+            start_time = time.perf_counter()
+            replay = replay_stats.load_recent_replay(sf6_path)
+            timings["parse"] = time.perf_counter() - start_time
+            self.on_event(WorkerEvent("parse", timings["parse"], replay=replay))
+            if watcher.cancelled.is_set():
+                return
+
+            # compute ends when every plot job is submitted, render when every image is written
+            compute_start = time.perf_counter()
+
+            def plots_updated(errors):
+                # render pool thread, or this thread without a pool
+                timings["render"] = time.perf_counter() - render_start
+                self.on_event(WorkerEvent("render", timings["render"]))
+                timings["done"] = time.perf_counter() - start_time
+                self.on_event(WorkerEvent("done", timings["done"], dict(timings), errors=errors,
+                                          metrics=replay_metrics.last_match()))
+
+            def plots_submitted():
+                nonlocal render_start
+                timings["compute"] = time.perf_counter() - compute_start
+                self.on_event(WorkerEvent("compute", timings["compute"]))
+                render_start = time.perf_counter()
+
+            render_start = None
+            replay_stats.update_plots(replay, render_pool, plots_updated, self.plot_cache, stats_store,
+                                      replay_stats.replay_played_at(replay_path), on_submitted=plots_submitted)
+        except Exception as e:
+            # keep watching, the next match may load
+            self.on_event(WorkerEvent("error", errors=[e]))
@@ -40,6 +40,32 @@ local filename_changed
 local replay_filename = "replay.json"
 local capture_status = "waiting for game..."
 
+-- stream each frame as a json line while the match is played
+local stream_frames = false
+local stream_filename = "recent_replay_stream.ndjson"
+local stream_file = nil
+local stream_player_data = nil
+local last_fight_st = nil
+
+-- also write the replay in the binary format read by replay_binary.py
+local binary_capture = false
+local binary_replay_filename = "recent_replay.sf6r"
+local binary_format_version = 1
+
+-- per player fields and their string.pack format, must match player_fields in replay_binary.py
+local binaryFields = {
+    {"throw_invuln", "i2", "<i2"}, {"hitstun", "i2", "<i2"}, {"mEndFrame", "i2", "<i2"},
+    {"current_HP", "i4", "<i4"}, {"drive_cooldown", "i2", "<i2"}, {"blockstun", "i2", "<i2"},
+    {"HP_cooldown", "i2", "<i2"}, {"absolute_range", "f", "<f4"}, {"stance", "i2", "<i2"},
+    {"drive", "f", "<f4"}, {"spdY", "f", "<f4"}, {"act_st", "i2", "<i2"},
+    {"juggle", "i2", "<i2"}, {"posY", "f", "<f4"}, {"pushback", "f", "<f4"},
+    {"aclY", "f", "<f4"}, {"mMarginFrame", "i2", "<i2"}, {"mActionId", "i4", "<i4"},
+    {"full_invuln", "i2", "<i2"}, {"dir", "i1", "|i1"}, {"spdX", "f", "<f4"},
+    {"posX", "f", "<f4"}, {"buff", "i2", "<i2"}, {"super", "i4", "<i4"},
+    {"aclX", "f", "<f4"}, {"mActionFrame", "i2", "<i2"}, {"relative_range", "f", "<f4"},
+    {"HP_cap", "i4", "<i4"}, {"hitstop", "i2", "<i2"}
+}
+
 p1.absolute_range = 0
 p1.relative_range = 0
 p2.absolute_range = 0
@@ -109,6 +135,66 @@ function findMissingKeys(t)
 end
 
 
+local function sortedNumberKeys(t)
+    local keys = {}
+    for k, _ in pairs(t) do
+        if type(k) == "number" then
+            table.insert(keys, k)
+        end
+    end
+    table.sort(keys)
+    return keys
+end
+
+local function writeBinaryReplayToFile(filename)
+    -- record format: round, frame, then the fields of p1 and p2
+    local record_format = "<i2i4"
+    local header_fields = {}
+    for _, field in ipairs(binaryFields) do
+        record_format = record_format..field[2]
+        table.insert(header_fields, {field[1], field[3]})
+    end
+    record_format = record_format..string.sub(record_format, 6)
+
+    -- records sorted by round then frame, each round is a contiguous run of records
+    local records = {}
+    local rounds = {}
+    for _, round_num in ipairs(sortedNumberKeys(replay_table)) do
+        local frames = sortedNumberKeys(replay_table[round_num])
+        table.insert(rounds, {round_num, #records, #frames})
+        for _, frame in ipairs(frames) do
+            local values = {round_num, frame}
+            for _, p_tag in ipairs({"p1", "p2"}) do
+                local frame_data = replay_table[round_num][frame][p_tag]
+                for _, field in ipairs(binaryFields) do
+                    local value = frame_data[field[1]] or 0
+                    if field[2] ~= "f" then
+                        value = math.floor(value)
+                    end
+                    table.insert(values, value)
+                end
+            end
+            table.insert(records, string.pack(record_format, table.unpack(values)))
+        end
+    end
+
+    -- json header padded so the records start 8 byte aligned
+    local header = json.dump_string({
+        fields = header_fields,
+        player_data = replay_table['player_data'],
+        rounds = rounds
+    })
+    header = header..string.rep(" ", (8 - (12 + #header) % 8) % 8)
+
+    local binary_file = io.open(filename, "wb")
+    if binary_file then
+        binary_file:write(string.pack("<c4I2I2I4", "SF6R", binary_format_version, 0, #header))
+        binary_file:write(header)
+        binary_file:write(table.concat(records))
+        binary_file:close()
+    end
+end
+
 local function writeReplayToFile()
     local filenameTimestamp = os.date("%Y%m%d_%H%M%S")
     local player0_name = characterMapping[tostring(replay_table['player_data']['player_0_id'])]
@@ -117,6 +203,10 @@ local function writeReplayToFile()
 
     json.dump_file("recent_replay.json", replay_table)
     json.dump_file(replay_filename, replay_table)
+    if binary_capture then
+        writeBinaryReplayToFile(binary_replay_filename)
+        writeBinaryReplayToFile(string.sub(replay_filename, 1, -6)..".sf6r")
+    end
     log.debug("recent_replay.json SAVED")
 
     -- if json.dump_file(replay_filename, replay_table) then
@@ -129,6 +219,50 @@ end
 
 
 
+local function writeStreamRecord(record)
+    if stream_file then
+        stream_file:write(json.dump_string(record).."\n")
+        stream_file:flush()
+    end
+end
+
+local function openStream()
+    if stream_file then
+        stream_file:close()
+        stream_file = nil
+    end
+    if stream_frames then
+        stream_file = io.open(stream_filename, "w")
+        stream_player_data = nil
+        -- the start time tells the reader a rewritten file is a new match
+        writeStreamRecord({reset = "match", started = os.time()})
+    end
+end
+
+local function closeStream()
+    if stream_file then
+        writeStreamRecord({["end"] = true})
+        stream_file:close()
+        stream_file = nil
+    end
+end
+
+local function writeFrameToStream()
+    local player_data = replay_table['player_data']
+    local player_data_key = tostring(player_data['player_0_id']).."_"..tostring(player_data['player_1_id'])
+    if stream_player_data ~= player_data_key then
+        stream_player_data = player_data_key
+        writeStreamRecord({player_data = player_data})
+    end
+
+    writeStreamRecord({
+        round = round_number,
+        frame = stage_timer,
+        p1 = replay_table[round_number][stage_timer]["p1"],
+        p2 = replay_table[round_number][stage_timer]["p2"]
+    })
+end
+
 local function writeFrameToTable()
     if replay_table[round_number] == nil then
         replay_table[round_number] = {}
@@ -158,6 +292,8 @@ end)
 re.on_draw_ui(function()
     if imgui.tree_node("Capture Match") then
         changed, display_capture_info = imgui.checkbox("Display Capture Info", display_capture_info)
+        changed, stream_frames = imgui.checkbox("Stream Frames", stream_frames)
+        changed, binary_capture = imgui.checkbox("Binary Capture", binary_capture)
         imgui.tree_pop()
     end
 end)
@@ -200,6 +336,7 @@ re.on_frame(function()
             -- game done
             if sGame.fight_st == 7 and not replay_saved and data_reset then
                 writeReplayToFile()
+                closeStream()
                 replay_saved = true
                 replay_table = {}
                 replay_table['player_data'] = {}
@@ -207,6 +344,9 @@ re.on_frame(function()
                 capture_status = "game captured."
             -- game started
             elseif sGame.fight_st == 2 then
+                if last_fight_st ~= 2 then
+                    openStream()
+                end
                 replay_table = {}
                 replay_table['player_data'] = {}
                 replay_saved = false
@@ -221,6 +361,9 @@ re.on_frame(function()
                 capture_frame = false
                 capture_status = "round reset."
                 log.debug("reset round")
+                if last_fight_st ~= 3 then
+                    writeStreamRecord({reset = "round", round = round_number})
+                end
             elseif sGame.fight_st == 4 then
                 capture_status = "capturing..."
                 capture_frame = true
@@ -301,7 +444,10 @@ re.on_frame(function()
 
             if round_number and stage_timer and capture_frame then
                 writeFrameToTable()
+                writeFrameToStream()
             end
+
+            last_fight_st = sGame.fight_st
         end
     end
 end)